@@ -1,79 +1,79 @@
-from datetime import datetime, timedelta
-from flask import redirect, url_for, request, flash
+from flask import abort, redirect, url_for, request, flash
 from flask_admin import Admin, AdminIndexView, expose, BaseView
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user, login_user, logout_user
-from sqlalchemy import func
-from models import db, User, Role, Product, Order, OrderItem, Category, Supplier
+from models import db, User, Role, Product, Order, OrderItem, Category, Supplier, has_role
+from admin_metrics import get_dashboard_metrics
+from pagination import keyset_paginate
+from loaders import load_profile
+from replicas import read_replica
+from exports import export_response
+
+MANAGEMENT_PER_PAGE = 50
 
 def _is_admin():
-    if not current_user.is_authenticated:
-        return False
-    r = current_user.role
-    if not r or not r.name:
-        return False
-    return r.name.lower() == 'admin'
+    # Роль берётся из снимка current_user, без загрузки Role
+    return current_user.is_authenticated and current_user.is_admin()
 
 class SecureModelView(ModelView):
+    # Столбцы потоковой выгрузки export.csv / export.jsonl; None — выгрузки нет
+    export_columns = None
+
     def is_accessible(self):
         return _is_admin()
     def inaccessible_callback(self, name, **kwargs):
         return redirect(url_for('auth.login'))
 
+    @expose('/export.<fmt>')
+    @read_replica
+    def stream_export(self, fmt):
+        """Вся таблица (с фильтрами из column_filters) потоком, без загрузки в память"""
+        if not self.export_columns:
+            abort(404)
+        filters = {name: request.args[name] for name in self.column_filters or () if request.args.get(name)}
+        return export_response(self.model, self.export_columns, filters, fmt, self.model.__tablename__)
+
 class UsersModelView(SecureModelView):
     column_searchable_list = ['username', 'email', 'first_name', 'last_name']
     column_filters = ['role_id', 'is_active']
+    # Без password_hash
+    export_columns = ['id', 'username', 'email', 'first_name', 'middle_name', 'last_name', 'role_id',
+                      'is_active', 'created_at']
     column_editable_list = ['is_active', 'role_id']
     form_columns = ['username', 'email', 'first_name', 'middle_name', 'last_name', 'role_id', 'is_active']
 
 class ProductsModelView(SecureModelView):
     column_searchable_list = ['productname']
     column_filters = ['category_id', 'is_published', 'created_by']
+    export_columns = ['id', 'productname', 'price', 'category_id', 'supplier_id', 'created_by', 'is_published',
+                      'product_image', 'created_at']
     column_editable_list = ['is_published', 'price', 'category_id']
 
 class OrdersModelView(SecureModelView):
     column_filters = ['status', 'user_id', 'seller_id']
+    export_columns = ['id', 'user_id', 'seller_id', 'status', 'total_amount', 'created_at']
     column_editable_list = ['status']
 
 class MyAdminIndexView(AdminIndexView):
     @expose('/')
+    @read_replica
     def index(self):
         if not current_user.is_authenticated or not current_user.is_admin():
             return redirect(url_for('auth.login') + '?next=' + url_for('admin.index'))
 
-        now = datetime.utcnow()
-        since = now - timedelta(days=30)
-        users_count = User.query.count()
-        products_count = Product.query.count()
-        orders_count = Order.query.count()
-        new_orders = Order.query.filter(Order.created_at >= since).count()
-        new_products = Product.query.filter(Product.created_at >= since).count()
-
-        new_clients = User.query.join(Role).filter(
-            func.lower(func.trim(Role.name)) == 'user',
-            User.created_at >= since
-        ).count()
-
-        new_sellers = User.query.join(Role).filter(
-            func.lower(func.trim(Role.name)) == 'seller',
-            User.created_at >= since
-        ).count()
-
-        users = User.query.order_by(User.created_at.desc()).limit(10).all()
-        products = Product.query.order_by(Product.created_at.desc()).limit(10).all()
-        recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+        # Счётчики считаются одним запросом и кэшируются на ADMIN_METRICS_TTL секунд
+        metrics = get_dashboard_metrics()
 
         return self.render('admin/dashboard.html',
-                           users_count=users_count,
-                           products_count=products_count,
-                           orders_count=orders_count,
-                           new_orders=new_orders,
-                           new_products=new_products,
-                           new_clients=new_clients,
-                           new_sellers=new_sellers,
-                           users=users,
-                           products=products,
-                           recent_orders=recent_orders)
+                           users_count=metrics.users_count,
+                           products_count=metrics.products_count,
+                           orders_count=metrics.orders_count,
+                           new_orders=metrics.new_orders,
+                           new_products=metrics.new_products,
+                           new_clients=metrics.new_clients,
+                           new_sellers=metrics.new_sellers,
+                           users=metrics.users,
+                           products=metrics.products)
 
 
 class AdminProfileView(BaseView):
@@ -92,13 +92,22 @@ class AdminManagementView(BaseView):
         return redirect(url_for('auth.login'))
     @expose('/')
     def index(self):
-        clients = db.session.query(User).join(Role, User.role_id == Role.id).\
-            filter(db.func.lower(db.func.trim(Role.name)) == 'user').order_by(User.created_at.desc()).all()
-        sellers = db.session.query(User).join(Role, User.role_id == Role.id).\
-            filter(db.func.lower(db.func.trim(Role.name)) == 'seller').order_by(User.created_at.desc()).all()
-        orders = Order.query.order_by(Order.created_at.desc()).limit(50).all()
-        products = Product.query.order_by(Product.created_at.desc()).limit(50).all()
-        return self.render('admin/management.html', clients=clients, sellers=sellers, orders=orders, products=products)
+        # Каждая таблица листается своим курсором, новые записи первыми
+        clients = keyset_paginate(User.query.filter(has_role('user')),
+                                  (User.created_at, User.id), cursor=request.args.get('clients_cursor'),
+                                  per_page=MANAGEMENT_PER_PAGE)
+        sellers = keyset_paginate(User.query.filter(has_role('seller')),
+                                  (User.created_at, User.id), cursor=request.args.get('sellers_cursor'),
+                                  per_page=MANAGEMENT_PER_PAGE)
+        orders = keyset_paginate(Order.query.options(*load_profile('order_list')), (Order.created_at, Order.id),
+                                 cursor=request.args.get('orders_cursor'), per_page=MANAGEMENT_PER_PAGE)
+        products = keyset_paginate(Product.query.options(*load_profile('product_list')), (Product.created_at, Product.id),
+                                   cursor=request.args.get('products_cursor'), per_page=MANAGEMENT_PER_PAGE)
+        return self.render('admin/management.html',
+                           clients=clients.items, sellers=sellers.items,
+                           orders=orders.items, products=products.items,
+                           clients_page=clients, sellers_page=sellers,
+                           orders_page=orders, products_page=products)
     @expose('/change_user_role', methods=['POST'])
     def change_user_role(self):
         user_id = int(request.form.get('user_id'))
@@ -0,0 +1,107 @@
+# admin_metrics.py
+"""Метрики главной страницы админки: все счётчики одним запросом, результат кэшируется"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, func, select, true
+from models import db, User, Role, Product, Order, Category, Supplier, has_role
+
+RecentUser = namedtuple('RecentUser', 'id username email role_name is_active')
+RecentProduct = namedtuple('RecentProduct', 'id productname price category_name supplier_name is_published')
+
+DashboardMetrics = namedtuple('DashboardMetrics', [
+	'users_count', 'products_count', 'orders_count',
+	'new_orders', 'new_products', 'new_clients', 'new_sellers',
+	'users', 'products', 'computed_at',
+])
+
+# Окно, за которое считаются «новые» записи
+NEW_PERIOD = timedelta(days=30)
+
+
+class MetricsCache:
+	"""Одно значение с временем жизни ttl секунд"""
+
+	def __init__(self, ttl=30):
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._value = None
+		self._expires = 0
+
+	def get(self):
+		with self._lock:
+			if self._value is not None and self._expires > time.monotonic():
+				return self._value
+			return None
+
+	def set(self, value):
+		with self._lock:
+			self._value = value
+			self._expires = time.monotonic() + self.ttl
+
+	def clear(self):
+		with self._lock:
+			self._value = None
+
+
+def _counters(since):
+	"""Все счётчики за один запрос: по агрегату с FILTER на таблицу, соединённые в одну строку"""
+	recent_user = User.created_at >= since
+	users = select(
+		func.count().label('users_count'),
+		func.count().filter(and_(has_role('user'), recent_user)).label('new_clients'),
+		func.count().filter(and_(has_role('seller'), recent_user)).label('new_sellers'),
+	).select_from(User).subquery()
+	products = select(
+		func.count().label('products_count'),
+		func.count().filter(Product.created_at >= since).label('new_products'),
+	).select_from(Product).subquery()
+	orders = select(
+		func.count().label('orders_count'),
+		func.count().filter(Order.created_at >= since).label('new_orders'),
+	).select_from(Order).subquery()
+	stmt = select(users, products, orders).select_from(users).join(products, true()).join(orders, true())
+	return db.session.execute(stmt).one()._asdict()
+
+
+def _recent_users(limit):
+	rows = db.session.query(User.id, User.username, User.email, Role.name, User.is_active)\
+		.outerjoin(Role, User.role_id == Role.id)\
+		.order_by(User.created_at.desc()).limit(limit)
+	return [RecentUser(*row) for row in rows]
+
+
+def _recent_products(limit):
+	rows = db.session.query(Product.id, Product.productname, Product.price,
+							Category.category_name, Supplier.supplier_name, Product.is_published)\
+		.outerjoin(Category, Product.category_id == Category.id)\
+		.outerjoin(Supplier, Product.supplier_id == Supplier.id)\
+		.order_by(Product.created_at.desc()).limit(limit)
+	return [RecentProduct(*row) for row in rows]
+
+
+def compute_dashboard_metrics(now=None, recent_limit=10):
+	now = now or datetime.utcnow()
+	counters = _counters(now - NEW_PERIOD)
+	return DashboardMetrics(
+		users=_recent_users(recent_limit),
+		products=_recent_products(recent_limit),
+		computed_at=now,
+		**counters
+	)
+
+
+def get_dashboard_metrics():
+	"""Метрики из кэша; пересчитываются не чаще раза в ADMIN_METRICS_TTL секунд"""
+	metrics_cache = current_app.extensions['admin_metrics']
+	metrics = metrics_cache.get()
+	if metrics is None:
+		metrics = compute_dashboard_metrics()
+		metrics_cache.set(metrics)
+	return metrics
+
+
+def init_admin_metrics(app):
+	app.extensions['admin_metrics'] = MetricsCache(ttl=float(app.config.get('ADMIN_METRICS_TTL', 30)))
@@ -0,0 +1,64 @@
+# bootstrap.py
+"""Первичная настройка БД: роли и учётная запись администратора (команда flask bootstrap).
+
+Раньше это выполнялось при каждом импорте main.py; теперь — один раз при
+развёртывании или после смены ADMIN_* в окружении.
+"""
+import os
+from models import db, User, Role
+
+ROLES = ['Admin', 'Seller', 'User']
+
+
+def ensure_roles():
+	"""Создаёт недостающие роли; возвращает роль Admin"""
+	existing = {role.name: role for role in Role.query.filter(Role.name.in_(ROLES))}
+	for role_name in ROLES:
+		if role_name not in existing:
+			existing[role_name] = Role(name=role_name)
+			db.session.add(existing[role_name])
+			print(f"Создана роль: {role_name}")
+	db.session.flush()
+	return existing['Admin']
+
+
+def bootstrap_admin(username, email, password):
+	"""Создаёт или исправляет администратора. Хэш пароля пересчитывается,
+	только если пароль действительно изменился"""
+	admin_role = ensure_roles()
+	admin_user = User.query.filter_by(email=email).first()
+	if admin_user:
+		if admin_user.role_id != admin_role.id:
+			print(f"Предупреждение: Пользователь {email} был не админом → исправляем роль!")
+			admin_user.role_id = admin_role.id
+		admin_user.username = username
+		admin_user.is_active = True
+		admin_user.first_name = 'Админ'
+		admin_user.last_name = 'Системы'
+		if not admin_user.check_password(password):
+			admin_user.set_password(password)
+			print(f"Пароль администратора {email} обновлён")
+	else:
+		admin_user = User(
+			username=username,
+			email=email,
+			role_id=admin_role.id,
+			is_active=True,
+			first_name='Админ',
+			last_name='Системы'
+		)
+		admin_user.set_password(password)
+		db.session.add(admin_user)
+		print(f"Админ создан: {email}")
+	db.session.commit()
+	return admin_user
+
+
+def init_bootstrap(app):
+	@app.cli.command('bootstrap')
+	def bootstrap():
+		"""Создаёт роли и администратора из ADMIN_USERNAME / ADMIN_EMAIL / ADMIN_PASSWORD"""
+		admin_username = os.getenv('ADMIN_USERNAME', 'admin').strip()
+		admin_email = os.getenv('ADMIN_EMAIL', f"{admin_username}@example.com").strip()
+		admin_password = os.getenv('ADMIN_PASSWORD', 'admin123').strip()
+		bootstrap_admin(admin_username, admin_email, admin_password)
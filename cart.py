@@ -0,0 +1,301 @@
+# cart.py
+"""Изменение корзины атомарными SQL-операциями.
+
+Добавление — INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE SET
+quantity = cart.quantity + :delta, без чтения строки перед записью.
+Уменьшение до нуля удаляет строку одним DELETE. Две быстрые отправки формы
+не создают дублей: их запрещает ограничение uq_cart_user_product.
+
+Сводка корзины (число позиций, штук, сумма и снимок товаров с ценами)
+кэшируется на пользователя: в памяти процесса или в общем хранилище
+с интерфейсом Redis (CART_CACHE_URL) для нескольких воркеров. Сводка
+сбрасывается после коммита любого изменения корзины и при смене цены
+товара, который лежит в чьей-то корзине.
+"""
+import json
+from collections import namedtuple
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import delete, event, func, inspect, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Cart, Product
+from ttl_cache import TTLCache
+
+# lines — кортеж (product_id, quantity, price) в порядке добавления
+CartSummary = namedtuple('CartSummary', 'items quantity total lines')
+
+EMPTY_CART = CartSummary(0, 0, Decimal('0.00'), ())
+
+
+class MemoryCartCache:
+	"""Сводки в памяти процесса: LRU с TTL, метка защищает от гонки с коммитом"""
+
+	def __init__(self, maxsize=10000, ttl=600):
+		self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+	def get(self, user_id):
+		"""(сводка или None, метка для set)"""
+		token = self._cache.token()
+		return self._cache.get(user_id), token
+
+	def set(self, user_id, summary, token):
+		self._cache.set(user_id, summary, token)
+
+	def invalidate(self, user_ids):
+		for user_id in user_ids:
+			self._cache.delete(user_id)
+
+	def clear(self):
+		self._cache.clear()
+
+
+class SharedCartCache:
+	"""Сводки в общем хранилище (клиент с get/set/incr, как у redis.Redis).
+
+	Ключ сводки содержит версию корзины пользователя; изменение корзины
+	увеличивает версию, и сводка, прочитанная из БД до коммита, ложится
+	под старый ключ, который уже никто не читает.
+	"""
+
+	def __init__(self, client, ttl=600, prefix='vibe:cart:'):
+		self.client = client
+		self.ttl = int(ttl)
+		self.prefix = prefix
+
+	def _version(self, user_id):
+		return int(self.client.get(f'{self.prefix}v:{user_id}') or 0)
+
+	def get(self, user_id):
+		version = self._version(user_id)
+		raw = self.client.get(f'{self.prefix}{user_id}:{version}')
+		return (_decode(raw) if raw is not None else None), version
+
+	def set(self, user_id, summary, token):
+		self.client.set(f'{self.prefix}{user_id}:{token}', _encode(summary), ex=self.ttl)
+
+	def invalidate(self, user_ids):
+		for user_id in user_ids:
+			self.client.incr(f'{self.prefix}v:{user_id}')
+
+	def clear(self):
+		pass
+
+
+def _encode(summary):
+	return json.dumps([summary.items, summary.quantity, str(summary.total),
+					   [[pid, qty, str(price)] for pid, qty, price in summary.lines]])
+
+
+def _decode(raw):
+	items, quantity, total, lines = json.loads(raw)
+	return CartSummary(items, quantity, Decimal(total),
+					   tuple((pid, qty, Decimal(price)) for pid, qty, price in lines))
+
+
+def get_cart_cache():
+	return current_app.extensions['cart_cache']
+
+
+def _load_summary(user_id):
+	rows = db.session.execute(
+		select(Cart.product_id, Cart.quantity, Product.price)
+		.join(Product, Cart.product_id == Product.id)
+		.where(Cart.user_id == user_id)
+		.order_by(Cart.id)
+	).all()
+	if not rows:
+		return EMPTY_CART
+	lines = tuple((pid, quantity or 0, Decimal(price)) for pid, quantity, price in rows)
+	total = sum((quantity * price for _, quantity, price in lines), Decimal('0'))
+	return CartSummary(len(lines), sum(q for _, q, _ in lines), total.quantize(Decimal('0.01')), lines)
+
+
+def get_cart_summary(user_id):
+	"""Сводка корзины из кэша; при промахе — один запрос к cart и products"""
+	cart_cache = get_cart_cache()
+	summary, token = cart_cache.get(user_id)
+	if summary is None:
+		summary = _load_summary(user_id)
+		cart_cache.set(user_id, summary, token)
+	return summary
+
+
+def touch(user_id):
+	"""Отмечает, что корзина пользователя меняется SQL-операцией в обход ORM.
+	Сводка сбросится после коммита"""
+	db.session.info.setdefault('cart_users', set()).add(user_id)
+
+
+class CartError(ValueError):
+	"""Неверная операция с корзиной"""
+
+
+def _insert(session):
+	dialect = session.get_bind().dialect.name
+	if dialect == 'postgresql':
+		return postgresql.insert(Cart)
+	if dialect == 'sqlite':
+		return sqlite.insert(Cart)
+	raise RuntimeError(f'Upsert корзины не поддерживается для {dialect}')
+
+
+def _upsert(user_id, product_id, quantity, increment):
+	"""Вставляет строку корзины, если товар существует; при конфликте прибавляет или заменяет quantity.
+
+	Возвращает False, если товара нет.
+	"""
+	touch(user_id)
+	stmt = _insert(db.session).from_select(
+		['user_id', 'product_id', 'quantity'],
+		select(literal(user_id), Product.id, literal(quantity)).where(Product.id == product_id)
+	)
+	new_quantity = func.coalesce(Cart.quantity, 0) + stmt.excluded.quantity if increment else stmt.excluded.quantity
+	stmt = stmt.on_conflict_do_update(index_elements=[Cart.user_id, Cart.product_id],
+									  set_={'quantity': new_quantity})
+	return db.session.execute(stmt).rowcount > 0
+
+
+def _decrease(delta, *criteria):
+	"""Уменьшает количество на -delta: строку, которая дойдёт до нуля, удаляет один DELETE,
+	иначе количество меняет один UPDATE. False — строки нет"""
+	drop = delete(Cart).where(func.coalesce(Cart.quantity, 0) + delta <= 0, *criteria)\
+		.execution_options(synchronize_session=False)
+	if db.session.execute(drop).rowcount:
+		return True
+	if db.session.execute(update(Cart).where(func.coalesce(Cart.quantity, 0) + delta > 0, *criteria)
+						  .values(quantity=func.coalesce(Cart.quantity, 0) + delta)
+						  .execution_options(synchronize_session=False)).rowcount:
+		return True
+	# Между запросами количество уменьшил параллельный запрос — теперь строка уходит в ноль
+	return db.session.execute(drop).rowcount > 0
+
+
+def add_item(user_id, product_id, delta=1):
+	"""Меняет количество товара в корзине на delta; строка с нулём удаляется.
+
+	Возвращает False, если товара нет (при delta > 0) или его не было в корзине (при delta < 0).
+	"""
+	if delta > 0:
+		return _upsert(user_id, product_id, delta, increment=True)
+	touch(user_id)
+	return _decrease(delta, Cart.user_id == user_id, Cart.product_id == product_id)
+
+
+def change_item(user_id, item_id, delta):
+	"""То же по id строки корзины (для кнопок +/- на странице корзины); False — строки нет"""
+	touch(user_id)
+	criteria = (Cart.id == item_id, Cart.user_id == user_id)
+	if delta < 0:
+		return _decrease(delta, *criteria)
+	return db.session.execute(update(Cart).where(*criteria)
+							  .values(quantity=func.coalesce(Cart.quantity, 0) + delta)
+							  .execution_options(synchronize_session=False)).rowcount > 0
+
+
+def set_quantity(user_id, product_id, quantity):
+	"""Задаёт количество товара; 0 и меньше удаляют его из корзины"""
+	if quantity <= 0:
+		return remove_item(user_id, product_id)
+	return _upsert(user_id, product_id, quantity, increment=False)
+
+
+def remove_line(user_id, item_id):
+	"""Удаляет строку корзины по id; False — строки нет или она чужая"""
+	touch(user_id)
+	return db.session.execute(delete(Cart).where(Cart.id == item_id, Cart.user_id == user_id)
+							  .execution_options(synchronize_session=False)).rowcount > 0
+
+
+def remove_item(user_id, product_id):
+	touch(user_id)
+	return db.session.execute(delete(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
+							  .execution_options(synchronize_session=False)).rowcount > 0
+
+
+def cart_totals(user_id):
+	"""Итоги корзины одним запросом: позиций, штук и сумма"""
+	items, units, total = db.session.execute(
+		select(func.count(Cart.id), func.coalesce(func.sum(Cart.quantity), 0),
+			   func.coalesce(func.sum(Product.price * Cart.quantity), 0))
+		.join(Product, Cart.product_id == Product.id)
+		.where(Cart.user_id == user_id)
+	).one()
+	return {'items': items, 'quantity': int(units), 'total': str(Decimal(total).quantize(Decimal('0.01')))}
+
+
+def _int(value, name):
+	if isinstance(value, bool):
+		raise CartError(f'{name} должно быть целым числом')
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		raise CartError(f'{name} должно быть целым числом')
+
+
+def apply_operations(user_id, operations):
+	"""Применяет пачку операций и возвращает итоги корзины.
+
+	Операция: {"product_id": 5, "delta": 2} — прибавить (или убавить) количество,
+	{"product_id": 5, "quantity": 3} — задать количество (0 — удалить).
+	Коммит остаётся за вызывающим кодом; неверная операция или больше
+	CART_BATCH_MAX операций — CartError.
+	"""
+	if not isinstance(operations, list) or not operations:
+		raise CartError('Ожидается непустой список операций')
+	limit = current_app.config.get('CART_BATCH_MAX', 50)
+	if len(operations) > limit:
+		raise CartError(f'Не больше {limit} операций за запрос')
+	for operation in operations:
+		if not isinstance(operation, dict) or 'product_id' not in operation:
+			raise CartError('В операции нет product_id')
+		product_id = _int(operation['product_id'], 'product_id')
+		if 'quantity' in operation:
+			set_quantity(user_id, product_id, _int(operation['quantity'], 'quantity'))
+		elif 'delta' in operation:
+			delta = _int(operation['delta'], 'delta')
+			if delta:
+				add_item(user_id, product_id, delta)
+		else:
+			raise CartError('В операции нужен delta или quantity')
+	return cart_totals(user_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_cart_changes(session, flush_context):
+	users = set()
+	repriced = set()
+	for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+		if isinstance(obj, Cart):
+			users.add(obj.user_id)
+		elif isinstance(obj, Product) and obj.id is not None and (
+				obj in session.deleted or inspect(obj).attrs.price.history.has_changes()):
+			repriced.add(obj.id)
+	if repriced:
+		# Цена попала в сводки всех, у кого товар в корзине
+		users.update(session.connection().execute(
+			select(Cart.user_id).where(Cart.product_id.in_(repriced)).distinct()).scalars())
+	if users:
+		session.info.setdefault('cart_users', set()).update(users)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_cart_summaries(session):
+	users = session.info.pop('cart_users', None)
+	if users and 'cart_cache' in current_app.extensions:
+		get_cart_cache().invalidate(users)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_cart_changes(session):
+	session.info.pop('cart_users', None)
+
+
+def init_cart(app):
+	"""Кэш сводок в app.extensions: CART_CACHE_URL (redis://...) — общий, иначе в памяти процесса"""
+	ttl = app.config.get('CART_CACHE_TTL', 600)
+	url = app.config.get('CART_CACHE_URL')
+	if url:
+		import redis  # нужен только для общего кэша
+		app.extensions['cart_cache'] = SharedCartCache(redis.Redis.from_url(url), ttl=ttl)
+	else:
+		app.extensions['cart_cache'] = MemoryCartCache(maxsize=app.config.get('CART_CACHE_SIZE', 10000), ttl=ttl)
@@ -0,0 +1,307 @@
+# catalog.py
+"""Кэш страниц каталога (/products) с TTL, вытеснением LRU и точечной инвалидацией"""
+import os
+import threading
+import time
+from collections import namedtuple
+from math import ceil
+from flask import current_app
+from sqlalchemy import event, inspect
+from models import db, Product, Category
+from pagination import KeysetPage, keyset_paginate
+from replicas import primary_reads
+from ttl_cache import TTLCache
+
+CATALOG_PER_PAGE = 12
+
+# Сортировки для режима курсоров: столбцы ключа и направление
+CATALOG_SORTS = {
+	'new': ((Product.created_at, Product.id), True),
+	'price': ((Product.price, Product.id), False),
+}
+
+# Лёгкие снимки строк: ORM-объекты нельзя держать между запросами
+ProductCard = namedtuple('ProductCard', 'id productname price category_id product_image is_published')
+CategoryItem = namedtuple('CategoryItem', 'id category_name')
+
+# Поля товара, от которых зависит попадание в выдачу каталога
+_WATCHED = ('category_id', 'price', 'is_published')
+_UNKNOWN = object()
+
+
+class CatalogPage:
+	"""Страница каталога. Повторяет интерфейс Pagination из Flask-SQLAlchemy, нужный шаблону"""
+
+	def __init__(self, items, page, per_page, total):
+		self.items = items
+		self.page = page
+		self.per_page = per_page
+		self.total = total
+
+	@property
+	def pages(self):
+		if not self.total:
+			return 0
+		return ceil(self.total / self.per_page)
+
+	@property
+	def has_prev(self):
+		return self.page > 1
+
+	@property
+	def prev_num(self):
+		return self.page - 1 if self.has_prev else None
+
+	@property
+	def has_next(self):
+		return self.page < self.pages
+
+	@property
+	def next_num(self):
+		return self.page + 1 if self.has_next else None
+
+	def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+		pages_end = self.pages + 1
+		if pages_end == 1:
+			return
+		left_end = min(1 + left_edge, pages_end)
+		yield from range(1, left_end)
+		if left_end == pages_end:
+			return
+		mid_start = max(left_end, self.page - left_current)
+		mid_end = min(self.page + right_current + 1, pages_end)
+		if mid_start - left_end > 0:
+			yield None
+		yield from range(mid_start, mid_end)
+		if mid_end == pages_end:
+			return
+		right_start = max(mid_end, pages_end - right_edge)
+		if right_start - mid_end > 0:
+			yield None
+		yield from range(right_start, pages_end)
+
+
+class CatalogVersion:
+	"""Версия каталога для ETag (см. http_cache.py): растёт с каждым коммитом,
+	меняющим товары или категории.
+
+	С общим хранилищем (клиент с get/incr, как у redis.Redis) версия одна на все
+	процессы. Без него счётчик свой у процесса: версия содержит случайный префикс
+	процесса, чтобы его ETag не совпал с чужим, и номер интервала ttl (TTL кэша
+	каталога) — записи других процессов процесс увидит не позже, чем истечёт его кэш.
+	"""
+
+	def __init__(self, client=None, key='vibe:catalog:version', ttl=0):
+		self.client = client
+		self.key = key
+		self.ttl = ttl
+		self._prefix = os.urandom(4).hex()
+		self._counter = 0
+		self._lock = threading.Lock()
+
+	def get(self):
+		if self.client is not None:
+			return str(int(self.client.get(self.key) or 0))
+		epoch = int(time.time() // self.ttl) if self.ttl else 0
+		return f'{self._prefix}.{self._counter}.{epoch}'
+
+	def bump(self):
+		if self.client is not None:
+			self.client.incr(self.key)
+		with self._lock:
+			self._counter += 1
+
+
+def get_catalog_cache():
+	return current_app.extensions['catalog_cache']
+
+
+def get_catalog_version():
+	return current_app.extensions['catalog_version']
+
+
+def make_page_key(category_id, min_price, max_price, page):
+	return ('page', category_id or None, min_price, max_price, max(page or 1, 1))
+
+
+def make_slice_key(category_id, min_price, max_price, sort, cursor):
+	return ('keyset', category_id or None, min_price, max_price, sort, cursor or None)
+
+
+def page_key_matches(key, state):
+	"""Может ли товар в состоянии state оказаться на странице с ключом key"""
+	if key[0] not in ('page', 'keyset'):
+		return False
+	category_id, min_price, max_price = key[1:4]
+	is_published = state.get('is_published', _UNKNOWN)
+	if is_published is not _UNKNOWN and not is_published:
+		return False
+	product_category = state.get('category_id', _UNKNOWN)
+	if category_id is not None and product_category is not _UNKNOWN and product_category != category_id:
+		return False
+	price = state.get('price', _UNKNOWN)
+	if price is not _UNKNOWN and price is not None:
+		if min_price is not None and float(price) < min_price:
+			return False
+		if max_price is not None and float(price) > max_price:
+			return False
+	return True
+
+
+def invalidate_product_states(states):
+	"""Сбрасывает только те страницы, на которые влияют состояния товара до и после записи"""
+	if not states:
+		return 0
+	return get_catalog_cache().invalidate(lambda key: any(page_key_matches(key, s) for s in states))
+
+
+def invalidate_categories():
+	get_catalog_cache().invalidate(lambda key: key[0] == 'categories')
+
+
+def _cached(key, load):
+	"""Значение из кэша каталога или load() с основной БД.
+
+	Версия каталога может быть общей для процессов (CATALOG_VERSION_URL), а кэш у
+	каждого процесса свой, и коммит сбрасывает только кэш своего процесса. Поэтому
+	запись хранит версию, при которой прочитана: запись старой версии — промах, и
+	под новым ETag не окажется страница, собранная до чужого коммита.
+	"""
+	catalog_cache = get_catalog_cache()
+	version = get_catalog_version().get()
+	entry = catalog_cache.get(key)
+	if entry is not None and entry[0] == version:
+		return entry[1]
+	token = catalog_cache.token()
+	# Кэш общий для всех посетителей: заполняем только с основной БД, не с отстающей реплики
+	with primary_reads():
+		value = load()
+	catalog_cache.set(key, (version, value), token)
+	return value
+
+
+def get_categories():
+	"""Список категорий для фильтра"""
+	return _cached(('categories',), lambda: [CategoryItem(c.id, c.category_name) for c in Category.query.all()])
+
+
+def _catalog_query(category_id, min_price, max_price):
+	query = Product.query.filter_by(is_published=True)
+	if category_id:
+		query = query.filter_by(category_id=category_id)
+	if min_price is not None:
+		query = query.filter(Product.price >= min_price)
+	if max_price is not None:
+		query = query.filter(Product.price <= max_price)
+	return query
+
+
+def _card(product):
+	return ProductCard(product.id, product.productname, product.price, product.category_id,
+					   product.product_image, product.is_published)
+
+
+def get_catalog_page(category_id, min_price, max_price, page):
+	"""Страница опубликованных товаров с фильтрами; при промахе читает БД"""
+	def load():
+		query = _catalog_query(category_id, min_price, max_price)
+		pagination = query.paginate(page=page, per_page=CATALOG_PER_PAGE, error_out=False)
+		items = [_card(p) for p in pagination.items]
+		return CatalogPage(items, pagination.page, pagination.per_page, pagination.total)
+	return _cached(make_page_key(category_id, min_price, max_price, page), load)
+
+
+def get_catalog_slice(category_id, min_price, max_price, sort, cursor=None):
+	"""Страница каталога в режиме курсоров (sort — ключ CATALOG_SORTS)"""
+	columns, descending = CATALOG_SORTS[sort]
+
+	def load():
+		query = _catalog_query(category_id, min_price, max_price)
+		page = keyset_paginate(query, columns, descending=descending, cursor=cursor,
+							   per_page=CATALOG_PER_PAGE, with_total=True)
+		return KeysetPage([_card(p) for p in page.items], page.next_cursor, page.prev_cursor, page.total)
+	return _cached(make_slice_key(category_id, min_price, max_price, sort, cursor), load)
+
+
+def _product_states(obj, pending=False, deleted=False):
+	"""Значения отслеживаемых полей товара до и после изменения (по истории атрибутов)"""
+	insp = inspect(obj)
+	before, after = {}, {}
+	for name in _WATCHED:
+		hist = insp.attrs[name].history
+		if hist.added:
+			current = hist.added[0]
+		elif hist.unchanged:
+			current = hist.unchanged[0]
+		elif pending:
+			current = None
+		else:
+			# Поле не менялось, но истекло после коммита — дочитываем его
+			current = getattr(obj, name)
+			hist = insp.attrs[name].history
+		if hist.deleted:
+			previous = hist.deleted[0]
+		elif hist.unchanged:
+			previous = hist.unchanged[0]
+		else:
+			# Прежнее значение не было загружено: считаем, что товар мог быть где угодно
+			previous = _UNKNOWN
+		before[name] = previous
+		after[name] = current
+	if pending:
+		return [after]
+	if deleted:
+		return [before]
+	return [before, after]
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_catalog_changes(session, flush_context, instances):
+	states = session.info.setdefault('catalog_states', [])
+	for obj in session.new:
+		if isinstance(obj, Product):
+			states.extend(_product_states(obj, pending=True))
+		elif isinstance(obj, Category):
+			session.info['catalog_categories'] = True
+	for obj in session.dirty:
+		if isinstance(obj, Product) and session.is_modified(obj):
+			states.extend(_product_states(obj))
+		elif isinstance(obj, Category):
+			session.info['catalog_categories'] = True
+	for obj in session.deleted:
+		if isinstance(obj, Product):
+			states.extend(_product_states(obj, deleted=True))
+		elif isinstance(obj, Category):
+			session.info['catalog_categories'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_catalog_invalidation(session):
+	states = session.info.pop('catalog_states', None)
+	categories = session.info.pop('catalog_categories', False)
+	if 'catalog_cache' not in current_app.extensions:
+		return
+	if states:
+		invalidate_product_states(states)
+	if categories:
+		invalidate_categories()
+	if states or categories:
+		get_catalog_version().bump()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_catalog_changes(session):
+	session.info.pop('catalog_states', None)
+	session.info.pop('catalog_categories', None)
+
+
+def init_catalog(app):
+	"""Кэш каталога и версия в app.extensions: CATALOG_VERSION_URL (redis://...) — общая версия, иначе в памяти процесса"""
+	ttl = float(app.config.get('CATALOG_CACHE_TTL', 60))
+	app.extensions['catalog_cache'] = TTLCache(maxsize=int(app.config.get('CATALOG_CACHE_SIZE', 256)), ttl=ttl)
+	url = app.config.get('CATALOG_VERSION_URL')
+	if url:
+		import redis  # нужен только для общей версии
+		app.extensions['catalog_version'] = CatalogVersion(redis.Redis.from_url(url), ttl=ttl)
+	else:
+		app.extensions['catalog_version'] = CatalogVersion(ttl=ttl)
@@ -0,0 +1,76 @@
+# checkout.py
+"""Оформление заказа из корзины набором SQL-операций.
+
+Число запросов не зависит от размера корзины: строки корзины и товаров
+блокируются одним SELECT ... FOR UPDATE, заказы (по одному на продавца) и
+их позиции создаются через INSERT ... SELECT с суммами, посчитанными в БД,
+корзина очищается одним DELETE.
+"""
+from datetime import datetime
+from sqlalchemy import and_, delete, func, insert, literal, select
+from models import db, Cart, Product, Order, OrderItem
+from stats import record_orders
+from cart import touch
+
+
+class EmptyCartError(Exception):
+	"""Корзина пуста (или её уже оформил параллельный запрос)"""
+
+
+def lock_cart(user_id):
+	"""Блокирует строки корзины и её товаров до конца транзакции; возвращает id строк корзины.
+
+	Товары блокируются в порядке id, чтобы параллельные оформления не
+	взаимоблокировались. Повторный запрос того же пользователя ждёт первый
+	и затем видит уже пустую корзину.
+	"""
+	return db.session.execute(
+		select(Cart.id).join(Product, Cart.product_id == Product.id)
+		.where(Cart.user_id == user_id)
+		.order_by(Cart.product_id)
+		.with_for_update()
+	).scalars().all()
+
+
+def place_order(user_id):
+	"""Создаёт из корзины пользователя по заказу на каждого продавца и очищает её.
+
+	Возвращает id созданных заказов. Коммит остаётся за вызывающим кодом.
+	Пустая корзина — EmptyCartError.
+	"""
+	cart_ids = lock_cart(user_id)
+	if not cart_ids:
+		raise EmptyCartError()
+	now = datetime.utcnow()
+	# Каждый запрос ниже видит свой снимок (READ COMMITTED): строка, добавленная в корзину
+	# после блокировки, не должна попасть в заказ мимо суммы или пропасть при очистке
+	locked = Cart.id.in_(cart_ids)
+
+	# Один INSERT ... SELECT ... GROUP BY создаёт заказы всех продавцов корзины
+	orders = db.session.execute(
+		insert(Order).from_select(
+			['user_id', 'seller_id', 'total_amount', 'status', 'created_at'],
+			select(literal(user_id), Product.created_by, func.sum(Product.price * Cart.quantity),
+				   literal('pending'), literal(now))
+			.select_from(Cart).join(Product, Cart.product_id == Product.id)
+			.where(locked)
+			.group_by(Product.created_by)
+		).returning(Order.id)
+	).scalars().all()
+
+	# Позиция попадает в заказ своего продавца
+	db.session.execute(
+		insert(OrderItem).from_select(
+			['order_id', 'product_id', 'quantity', 'price', 'created_at'],
+			select(Order.id, Cart.product_id, Cart.quantity, Product.price, literal(now))
+			.select_from(Cart).join(Product, Cart.product_id == Product.id)
+			.join(Order, and_(Order.id.in_(orders), Order.seller_id == Product.created_by))
+			.where(locked).order_by(Cart.id)
+		)
+	)
+	db.session.execute(delete(Cart).where(locked).execution_options(synchronize_session=False))
+	touch(user_id)
+
+	# Статистика продаж обновляется в той же транзакции, что и заказы
+	record_orders(orders)
+	return orders
@@ -0,0 +1,20 @@
+-- Одна строка корзины на пару (пользователь, товар): объединяем дубли и запрещаем новые (models.Cart)
+BEGIN;
+
+UPDATE cart c
+SET quantity = d.total
+FROM (
+    SELECT MIN(id) AS keep_id, SUM(COALESCE(quantity, 1)) AS total
+    FROM cart
+    GROUP BY user_id, product_id
+    HAVING COUNT(*) > 1
+) d
+WHERE c.id = d.keep_id;
+
+DELETE FROM cart c
+USING cart k
+WHERE c.user_id = k.user_id AND c.product_id = k.product_id AND c.id > k.id;
+
+ALTER TABLE cart ADD CONSTRAINT uq_cart_user_product UNIQUE (user_id, product_id);
+
+COMMIT;
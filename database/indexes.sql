@@ -0,0 +1,13 @@
+-- Индексы горячих запросов (то же, что миграция migrations/versions/0002_hot_path_indexes.py).
+-- CONCURRENTLY нельзя выполнять в транзакции: запускайте psql без -1
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_role_id_created_at ON users (role_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_catalog_price ON products (is_published, category_id, price, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_created_by_created_at ON products (created_by, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_created_at ON products (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_price ON products (price);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_user_id_created_at ON orders (user_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_seller_id_created_at ON orders (seller_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_created_at ON orders (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_order_id ON order_items (order_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_product_id ON order_items (product_id);
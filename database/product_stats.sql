@@ -0,0 +1,18 @@
+-- Материализованная статистика продаж (models.ProductStat)
+CREATE TABLE IF NOT EXISTS product_stats (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    units_sold INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_stats_order_count ON product_stats(order_count);
+
+-- Первичное заполнение по истории заказов; далее — при оформлении заказа или командой flask stats-refresh
+INSERT INTO product_stats (product_id, order_count, units_sold, revenue, updated_at)
+SELECT product_id, COUNT(id), COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * price), 0), CURRENT_TIMESTAMP
+FROM order_items
+WHERE product_id IS NOT NULL
+GROUP BY product_id
+ON CONFLICT (product_id) DO NOTHING;
@@ -0,0 +1,26 @@
+-- Поисковый индекс товаров (используется search.PostgresSearchBackend)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS product_search (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    document TSVECTOR NOT NULL
+);
+
+-- Полнотекстовый поиск по префиксам слов
+CREATE INDEX IF NOT EXISTS idx_product_search_document ON product_search USING GIN (document);
+
+-- Поиск подстроки (ILIKE '%...%') и similarity() по триграммам
+CREATE INDEX IF NOT EXISTS idx_product_search_content_trgm ON product_search USING GIN (content gin_trgm_ops);
+
+-- Первичное заполнение; далее индекс поддерживает приложение (или: flask search-reindex)
+INSERT INTO product_search (product_id, content, document)
+SELECT p.id,
+       concat_ws(' ', p.productname, c.category_name, u.username),
+       setweight(to_tsvector('simple', coalesce(p.productname, '')), 'A') ||
+       setweight(to_tsvector('simple', coalesce(c.category_name, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(u.username, '')), 'C')
+FROM products p
+JOIN categories c ON c.id = p.category_id
+JOIN users u ON u.id = p.created_by
+ON CONFLICT (product_id) DO NOTHING;
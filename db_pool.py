@@ -0,0 +1,143 @@
+# db_pool.py
+"""Настройки пула соединений из окружения и метрики пула.
+
+MeteredQueuePool — обычный QueuePool, который дополнительно считает ожидания
+свободного соединения: их число, суммарное и максимальное время, тайм-ауты.
+Долгие ожидания (дольше DB_POOL_WAIT_LOG_MS) и тайм-ауты пишутся в лог
+'vibe.pool', текущее состояние отдаёт /admin/pool (только администраторам).
+
+Для работы за PgBouncer (DB_PGBOUNCER=1) statement_timeout задаётся через
+SET LOCAL в каждой транзакции: параметры запуска соединения (-c ...)
+PgBouncer в режиме transaction не пропускает. DB_POOL_SIZE=0 отключает пул
+приложения (NullPool) и оставляет пулинг PgBouncer.
+"""
+import json
+import logging
+import threading
+import time
+from flask import abort, jsonify
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+from models import db
+
+pool_log = logging.getLogger('vibe.pool')
+
+
+class MeteredQueuePool(QueuePool):
+	"""QueuePool со счётчиками ожидания соединения"""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._metrics_lock = threading.Lock()
+		self.wait_count = 0
+		self.wait_total = 0.0
+		self.wait_max = 0.0
+		self.timeouts = 0
+		self.wait_log_threshold = None
+
+	def _do_get(self):
+		started = time.perf_counter()
+		try:
+			return super()._do_get()
+		except PoolTimeoutError:
+			with self._metrics_lock:
+				self.timeouts += 1
+			pool_log.warning(json.dumps({'event': 'pool_timeout', 'status': self.status()}, ensure_ascii=False))
+			raise
+		finally:
+			self._record_wait(time.perf_counter() - started)
+
+	def recreate(self):
+		# После invalidate/переподключения движок заменяет пул; настройка лога должна сохраниться
+		pool = super().recreate()
+		pool.wait_log_threshold = self.wait_log_threshold
+		return pool
+
+	def _record_wait(self, waited):
+		with self._metrics_lock:
+			self.wait_count += 1
+			self.wait_total += waited
+			self.wait_max = max(self.wait_max, waited)
+		if self.wait_log_threshold is not None and waited * 1000 >= self.wait_log_threshold:
+			pool_log.warning(json.dumps({'event': 'pool_wait', 'ms': round(waited * 1000, 2),
+										 'checked_out': self.checkedout(), 'overflow': self.overflow()},
+										ensure_ascii=False))
+
+
+def engine_options(config):
+	"""SQLALCHEMY_ENGINE_OPTIONS по ключам DB_* конфигурации"""
+	uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+	options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+	if uri.startswith('sqlite'):
+		# У SQLite свой пул (в памяти — одно соединение), размеры к нему неприменимы
+		return options
+	pool_size = config.get('DB_POOL_SIZE', 5)
+	if pool_size == 0:
+		options['poolclass'] = NullPool
+	else:
+		options.update({
+			'poolclass': MeteredQueuePool,
+			'pool_size': pool_size,
+			'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+			'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+		})
+	options['pool_recycle'] = config.get('DB_POOL_RECYCLE', 1800)
+	timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+	if timeout and uri.startswith('postgres') and not config.get('DB_PGBOUNCER'):
+		options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+	return options
+
+
+def _set_local_timeout(timeout):
+	def begin(conn):
+		conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+	return begin
+
+
+def pool_status(engine):
+	"""Состояние пула движка: занято/свободно/переполнение и ожидания"""
+	pool = engine.pool
+	status = {'pool': type(pool).__name__}
+	if isinstance(pool, QueuePool):
+		status.update({
+			'size': pool.size(),
+			'checked_out': pool.checkedout(),
+			'idle': pool.checkedin(),
+			'overflow': max(pool.overflow(), 0),
+		})
+	if isinstance(pool, MeteredQueuePool):
+		with pool._metrics_lock:
+			status.update({
+				'waits': pool.wait_count,
+				'wait_avg_ms': round(pool.wait_total / pool.wait_count * 1000, 3) if pool.wait_count else 0.0,
+				'wait_max_ms': round(pool.wait_max * 1000, 3),
+				'timeouts': pool.timeouts,
+			})
+	return status
+
+
+def all_pool_status():
+	"""Состояние пулов всех движков приложения (основной и binds)"""
+	return {name or 'default': pool_status(engine) for name, engine in db.engines.items()}
+
+
+def _pool_endpoint():
+	if not current_user.is_authenticated or not current_user.is_admin():
+		abort(404)
+	return jsonify(all_pool_status())
+
+
+def init_db_pool(app):
+	"""Подключает метрики пула и SET LOCAL statement_timeout для PgBouncer.
+	Вызывать после db.init_app(app)"""
+	with app.app_context():
+		engines = list(db.engines.values())
+	timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+	for engine in engines:
+		if isinstance(engine.pool, MeteredQueuePool):
+			engine.pool.wait_log_threshold = app.config.get('DB_POOL_WAIT_LOG_MS', 100)
+		if timeout and app.config.get('DB_PGBOUNCER') and engine.dialect.name == 'postgresql':
+			event.listen(engine, 'begin', _set_local_timeout(timeout))
+	app.add_url_rule('/admin/pool', 'pool_status', _pool_endpoint)
@@ -0,0 +1,237 @@
+# http_cache.py
+"""HTTP-кэширование публичных страниц и статики.
+
+Страницы, помеченные декоратором cacheable, для анонимных посетителей получают
+слабый ETag из версии каталога (catalog.get_catalog_version()), сборки шаблонов и
+адреса страницы. Запрос с совпадающим If-None-Match получает 304 до вызова
+обработчика: без запросов к БД и рендеринга. Вошедшим пользователям и
+страницам с ожидающими flash-сообщениями ответ не кэшируется.
+
+Готовый HTML этих страниц хранится в PageCache (LRU с ограничением по объёму,
+по желанию сжатый gzip) под ключом-ETag: смена версии каталога сама делает
+старые записи недостижимыми. Одновременные промахи по одному ключу ждут
+первого рендеринга (single-flight), а не строят страницу параллельно.
+Вошедшие пользователи кэш обходят.
+
+Статика: файлы с хэшем содержимого в имени (images/<хэш>.jpg и их копии)
+отдаются как immutable на год, остальная — с SEND_FILE_MAX_AGE_DEFAULT.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import current_app, make_response, request, session
+import catalog
+from replicas import replica_used
+
+# images/<sha256[:20]>.<ext> из images.save_upload и копии <хэш>_<размер>.<ext>
+HASHED_STATIC = re.compile(r'^images/[0-9a-f]{20}(_[a-z]+)?\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# body — байты страницы (сжатые, если gzipped); expires — по time.monotonic()
+CachedPage = namedtuple('CachedPage', 'body gzipped mimetype expires')
+
+
+class PageCache:
+	"""Потокобезопасный LRU готовых страниц с ограничением суммарного размера.
+
+	Страница живёт не дольше ttl секунд (TTL кэша каталога): версия каталога в
+	ключе не видит записей других процессов без общей версии, а страница, собранная
+	до чужого коммита, не должна жить дольше данных, из которых собрана.
+	"""
+
+	def __init__(self, max_bytes=32 * 1024 * 1024, compress=True, wait=5.0, ttl=60):
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.compress = compress
+		self.wait = wait
+		self._entries = OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+		self._inflight = {}
+
+	def get(self, key):
+		with self._lock:
+			page = self._entries.get(key)
+			if page is None:
+				return None
+			if page.expires <= time.monotonic():
+				del self._entries[key]
+				self._size -= len(page.body)
+				return None
+			self._entries.move_to_end(key)
+			return page
+
+	def set(self, key, body, mimetype):
+		gzipped = self.compress
+		if gzipped:
+			body = gzip.compress(body, compresslevel=6)
+		if len(body) > self.max_bytes:
+			return None
+		page = CachedPage(body, gzipped, mimetype, time.monotonic() + self.ttl)
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self._size -= len(old.body)
+			self._entries[key] = page
+			self._size += len(body)
+			while self._size > self.max_bytes:
+				_, evicted = self._entries.popitem(last=False)
+				self._size -= len(evicted.body)
+		return page
+
+	def get_or_render(self, key, render):
+		"""Страница из кэша или (None, ответ) от render; render вызывается
+		одним потоком на ключ, остальные ждут его результата до wait секунд"""
+		page = self.get(key)
+		if page is not None:
+			return page, None
+		with self._lock:
+			event = self._inflight.get(key)
+			leader = event is None
+			if leader:
+				event = self._inflight[key] = threading.Event()
+		if not leader:
+			event.wait(self.wait)
+			page = self.get(key)
+			if page is not None:
+				return page, None
+			# Первый запрос упал или ответ нельзя кэшировать — строим сами
+			return None, render(None)
+		try:
+			return None, render(key)
+		finally:
+			with self._lock:
+				self._inflight.pop(key, None)
+			event.set()
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+
+	@property
+	def size(self):
+		return self._size
+
+	def __len__(self):
+		return len(self._entries)
+
+
+def templates_digest(app):
+	"""Хэш содержимого шаблонов: новая выкладка меняет ETag всех страниц"""
+	digest = hashlib.sha1()
+	folder = os.path.join(app.root_path, app.template_folder or 'templates')
+	for root, dirs, files in os.walk(folder):
+		dirs.sort()
+		for name in sorted(files):
+			path = os.path.join(root, name)
+			digest.update(os.path.relpath(path, folder).encode())
+			with open(path, 'rb') as f:
+				digest.update(f.read())
+	return digest.hexdigest()[:12]
+
+
+def _is_anonymous():
+	# Без обращения к current_user: загрузка пользователя — это запрос к БД
+	remember_cookie = current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')
+	return '_user_id' not in session and remember_cookie not in request.cookies and '_flashes' not in session
+
+
+def page_etag():
+	key = '|'.join((current_app.config.get('HTTP_CACHE_BUILD', ''), catalog.get_catalog_version().get(),
+					request.full_path))
+	return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _cache_headers(response):
+	response.cache_control.public = True
+	max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+	if max_age:
+		response.cache_control.max_age = int(max_age)
+	else:
+		# Хранить можно, но перед показом — переспросить (ответ 304 дешёвый)
+		response.cache_control.no_cache = True
+	response.vary.add('Cookie')
+	return response
+
+
+def _cacheable_response(response):
+	# Прочитанное с реплики могло отстать от версии каталога в ETag
+	return (response.status_code == 200 and not session.modified and not response.headers.getlist('Set-Cookie')
+			and not replica_used())
+
+
+def _page_response(page):
+	body = page.body
+	response = current_app.response_class(mimetype=page.mimetype)
+	if page.gzipped and 'gzip' in request.accept_encodings:
+		response.headers['Content-Encoding'] = 'gzip'
+	elif page.gzipped:
+		body = gzip.decompress(body)
+	response.set_data(body)
+	response.headers['X-Page-Cache'] = 'HIT'
+	return response
+
+
+def cacheable(view):
+	"""Публичная страница: ETag, 304 и кэш готового HTML для анонимных посетителей"""
+	@wraps(view)
+	def wrapper(*args, **kwargs):
+		if request.method not in ('GET', 'HEAD') or not _is_anonymous():
+			return view(*args, **kwargs)
+		etag = page_etag()
+		if request.if_none_match.contains_weak(etag):
+			response = current_app.response_class(status=304)
+			response.set_etag(etag, weak=True)
+			return _cache_headers(response)
+
+		cache = current_app.extensions.get('page_cache')
+
+		def render(key):
+			response = make_response(view(*args, **kwargs))
+			if key is not None and _cacheable_response(response):
+				cache.set(key, response.get_data(), response.mimetype)
+				response.headers['X-Page-Cache'] = 'MISS'
+			return response
+
+		if cache is None:
+			response = make_response(view(*args, **kwargs))
+		else:
+			page, response = cache.get_or_render(etag, render)
+			if page is not None:
+				response = _page_response(page)
+			if cache.compress:
+				response.vary.add('Accept-Encoding')
+		if _cacheable_response(response):
+			response.set_etag(etag, weak=True)
+			_cache_headers(response)
+		return response
+	return wrapper
+
+
+def _static_headers(response):
+	if request.endpoint == 'static' and response.status_code in (200, 206, 304):
+		if HASHED_STATIC.match((request.view_args or {}).get('filename', '')):
+			response.cache_control.no_cache = None
+			response.cache_control.public = True
+			response.cache_control.max_age = IMMUTABLE_MAX_AGE
+			response.cache_control.immutable = True
+	return response
+
+
+def init_http_cache(app):
+	"""HTTP_CACHE_BUILD (например, хэш коммита) по умолчанию — хэш шаблонов;
+	PAGE_CACHE_BYTES=0 отключает кэш страниц"""
+	if not app.config.get('HTTP_CACHE_BUILD'):
+		app.config['HTTP_CACHE_BUILD'] = templates_digest(app)
+	max_bytes = app.config.get('PAGE_CACHE_BYTES', 32 * 1024 * 1024)
+	if max_bytes:
+		app.extensions['page_cache'] = PageCache(max_bytes, compress=app.config.get('PAGE_CACHE_COMPRESS', True),
+												 wait=app.config.get('PAGE_CACHE_WAIT', 5.0),
+												 ttl=float(app.config.get('CATALOG_CACHE_TTL', 60)))
+	app.after_request(_static_headers)
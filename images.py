@@ -0,0 +1,246 @@
+# images.py
+"""Загрузка изображений товаров и их уменьшенные копии.
+
+Оригинал сохраняется в static/images под именем из хэша содержимого, копии
+thumb/card/detail строит фоновая задача images.build_variants (jobs.py) и лежат рядом:
+images/<имя>_<вариант>.<webp|jpeg>. Пока копии нет, отдаётся оригинал.
+Без Pillow копии не строятся, сайт показывает оригиналы.
+
+Какие файлы есть на диске, помнит ImageManifest: шаблоны проверяют путь по
+множеству в памяти, а не через os.path.exists на каждую карточку.
+"""
+import hashlib
+import os
+import threading
+import time
+from flask import current_app
+from werkzeug.utils import secure_filename
+from jobs import enqueue, task
+from models import Product
+
+try:
+	from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен
+	Image = None
+
+IMAGES_DIR = 'images'
+BLANK_IMAGE = 'blank.jpg'
+
+# Вариант -> максимальный размер (ширина, высота)
+VARIANTS = {
+	'thumb': (160, 160),
+	'card': (480, 480),
+	'detail': (1200, 1200),
+}
+
+_FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+class ImageManifest:
+	"""Множество файлов static/images (пути вида images/<имя>).
+
+	Свои загрузки и удаления процесс отмечает сразу. Изменения из других
+	процессов видны по mtime каталога, который проверяется не чаще раза
+	в check_interval секунд.
+	"""
+
+	def __init__(self, static_folder, check_interval=2.0):
+		self.folder = os.path.join(static_folder, IMAGES_DIR)
+		self.check_interval = check_interval
+		self._lock = threading.Lock()
+		self._files = frozenset()
+		self._mtime = None
+		self._checked = 0.0
+		self.rescan()
+
+	def _folder_mtime(self):
+		try:
+			return os.stat(self.folder).st_mtime_ns
+		except FileNotFoundError:
+			return None
+
+	def rescan(self):
+		with self._lock:
+			self._mtime = self._folder_mtime()
+			try:
+				names = os.listdir(self.folder)
+			except FileNotFoundError:
+				names = []
+			self._files = frozenset(f'{IMAGES_DIR}/{name}' for name in names if not name.endswith('.tmp'))
+			self._checked = time.monotonic()
+
+	def _check(self):
+		now = time.monotonic()
+		if now - self._checked < self.check_interval:
+			return
+		self._checked = now
+		if self._folder_mtime() != self._mtime:
+			self.rescan()
+
+	def __contains__(self, relative):
+		self._check()
+		return relative.replace(os.sep, '/') in self._files
+
+	def add(self, *relatives):
+		with self._lock:
+			self._files = self._files | {r.replace(os.sep, '/') for r in relatives}
+
+	def discard(self, *relatives):
+		with self._lock:
+			self._files = self._files - {r.replace(os.sep, '/') for r in relatives}
+
+
+def get_manifest(app=None):
+	app = app or current_app
+	manifest = app.extensions.get('image_manifest')
+	if manifest is None:
+		manifest = app.extensions['image_manifest'] = ImageManifest(
+			app.static_folder, app.config.get('IMAGE_MANIFEST_CHECK', 2.0))
+	return manifest
+
+
+def _static_path(relative):
+	return os.path.join(current_app.static_folder, relative)
+
+
+def _extension():
+	return _FORMATS[current_app.config.get('IMAGE_VARIANT_FORMAT', 'webp')][1]
+
+
+def variant_name(original, variant, extension):
+	"""images/abc.jpg, card -> images/abc_card.webp"""
+	stem = os.path.splitext(original)[0]
+	return f'{stem}_{variant}.{extension}'
+
+
+def variant_names(original):
+	return [variant_name(original, variant, ext) for variant in VARIANTS for _, ext in _FORMATS.values()]
+
+
+def image_path(product_image, variant=None):
+	"""Путь внутри static для шаблона: копия нужного размера, оригинал или заглушка"""
+	if not product_image:
+		return BLANK_IMAGE
+	manifest = get_manifest()
+	if variant:
+		candidate = variant_name(product_image, variant, _extension())
+		if candidate in manifest:
+			return candidate
+	if product_image in manifest:
+		return product_image
+	return BLANK_IMAGE
+
+
+def save_upload(file):
+	"""Сохраняет загруженный файл под именем из хэша содержимого и ставит копии в очередь.
+
+	Возвращает путь относительно static (images/<хэш>.<расширение>).
+	"""
+	data = file.read()
+	extension = os.path.splitext(secure_filename(file.filename or ''))[1].lower() or '.jpg'
+	digest = hashlib.sha256(data).hexdigest()[:20]
+	relative = f'{IMAGES_DIR}/{digest}{extension}'
+	path = _static_path(relative)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	# Одинаковое содержимое — одинаковое имя: повторная загрузка ничего не пишет
+	if not os.path.exists(path):
+		tmp = f'{path}.{os.getpid()}.tmp'
+		with open(tmp, 'wb') as f:
+			f.write(data)
+		os.replace(tmp, path)
+	get_manifest().add(relative)
+	schedule_variants(relative)
+	return relative
+
+
+def delete_image(product_image):
+	"""Удаляет оригинал и все его копии"""
+	relatives = [product_image] + variant_names(product_image)
+	get_manifest().discard(*relatives)
+	for relative in relatives:
+		try:
+			os.remove(_static_path(relative))
+		except FileNotFoundError:
+			pass
+
+
+def build_variants(product_image, static_folder, image_format='webp'):
+	"""Строит недостающие копии изображения; возвращает список созданных путей"""
+	if Image is None:
+		return []
+	pil_format, extension = _FORMATS[image_format]
+	source = os.path.join(static_folder, product_image)
+	created = []
+	with Image.open(source) as original:
+		original = ImageOps.exif_transpose(original)
+		for variant, size in VARIANTS.items():
+			relative = variant_name(product_image, variant, extension)
+			target = os.path.join(static_folder, relative)
+			if os.path.exists(target):
+				continue
+			copy = original.copy()
+			copy.thumbnail(size)
+			if pil_format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+				copy = copy.convert('RGB')
+			# Пишем во временный файл, чтобы шаблон не увидел недописанную копию
+			tmp = f'{target}.{os.getpid()}.tmp'
+			copy.save(tmp, pil_format, quality=82)
+			os.replace(tmp, target)
+			created.append(relative)
+	return created
+
+
+def _build_logged(product_image, static_folder, image_format, logger, manifest=None):
+	try:
+		created = build_variants(product_image, static_folder, image_format)
+		if manifest is not None:
+			manifest.add(*created)
+		return created
+	except Exception:
+		logger.exception('Не удалось построить копии %s', product_image)
+		return []
+
+
+@task('images.build_variants')
+def build_variants_task(product_image):
+	"""Задача: строит копии и добавляет их в манифест; ошибка — повтор по правилам очереди"""
+	created = build_variants(product_image, current_app.static_folder,
+							 current_app.config.get('IMAGE_VARIANT_FORMAT', 'webp'))
+	get_manifest().add(*created)
+	return created
+
+
+@task('images.remove_unused')
+def remove_unused_image(product_image, product_id):
+	"""Задача: удаляет файл изображения, если на него не ссылаются другие товары (имена по хэшу могут совпадать)"""
+	if product_image and not Product.query.filter(Product.product_image == product_image,
+												  Product.id != product_id).first():
+		delete_image(product_image)
+
+
+def schedule_variants(product_image):
+	"""Ставит построение копий в очередь задач (без Pillow — ничего не делает)"""
+	if Image is None:
+		return
+	enqueue('images.build_variants', product_image=product_image)
+
+
+def init_images(app):
+	"""Строит манифест изображений и команду flask images-build"""
+	get_manifest(app)
+
+	@app.cli.command('images-build')
+	def images_build():
+		"""Строит недостающие копии для всех изображений в static/images"""
+		if Image is None:
+			print('Pillow не установлен, копии не строятся')
+			return
+		folder = os.path.join(app.static_folder, IMAGES_DIR)
+		image_format = app.config.get('IMAGE_VARIANT_FORMAT', 'webp')
+		suffixes = tuple(f'_{variant}.{ext}' for variant in VARIANTS for _, ext in _FORMATS.values())
+		count = 0
+		for name in sorted(os.listdir(folder)):
+			if name.endswith(suffixes) or name.endswith('.tmp'):
+				continue
+			count += len(_build_logged(f'{IMAGES_DIR}/{name}', app.static_folder, image_format, app.logger,
+									   get_manifest(app)))
+		print(f'Создано копий: {count}')
@@ -0,0 +1,175 @@
+# instrumentation.py
+"""Инструментирование запросов: число SQL-запросов, время БД и шаблонов на каждый HTTP-запрос.
+
+Итог отдаётся в заголовке Server-Timing и пишется JSON-строкой в лог
+'vibe.requests'. Запросы к БД дольше SLOW_QUERY_MS пишутся в лог
+'vibe.slow_queries' вместе с формой параметров (типы, без значений) и тем, что
+их выполнило: endpoint HTTP-запроса, задача очереди (job) или команда flask (command).
+"""
+import heapq
+import json
+import logging
+import time
+import click
+from flask import current_app, g, has_app_context, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+request_log = logging.getLogger('vibe.requests')
+slow_query_log = logging.getLogger('vibe.slow_queries')
+
+# Сколько самых медленных запросов держать в статистике запроса
+SLOWEST_KEPT = 3
+
+_engine_hooks_installed = False
+
+
+class RequestStats:
+	"""Счётчики одного HTTP-запроса"""
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.query_count = 0
+		self.db_time = 0.0
+		self.template_time = 0.0
+		self.slowest = []
+		self._template_starts = []
+
+	def add_query(self, statement, duration):
+		self.query_count += 1
+		self.db_time += duration
+		entry = (duration, self.query_count, statement)
+		if len(self.slowest) < SLOWEST_KEPT:
+			heapq.heappush(self.slowest, entry)
+		else:
+			heapq.heappushpop(self.slowest, entry)
+
+	def slowest_statements(self):
+		return [{'ms': round(d * 1000, 2), 'sql': s} for d, _, s in sorted(self.slowest, reverse=True)]
+
+
+def parameter_shape(parameters):
+	"""Форма параметров запроса: имена и типы вместо значений"""
+	if isinstance(parameters, dict):
+		return {key: type(value).__name__ for key, value in parameters.items()}
+	if isinstance(parameters, (list, tuple)):
+		if parameters and isinstance(parameters[0], (dict, list, tuple)):
+			return {'executemany': len(parameters), 'row': parameter_shape(parameters[0])}
+		return [type(value).__name__ for value in parameters]
+	return type(parameters).__name__
+
+
+def _current_stats():
+	if has_request_context():
+		return g.get('_request_stats')
+	return None
+
+
+def _source():
+	"""Кто выполняет запрос к БД: задача очереди, HTTP-запрос или команда flask"""
+	job = g.get('_job_name')
+	if job:
+		return {'job': job}
+	if has_request_context():
+		return {'endpoint': request.endpoint}
+	command = click.get_current_context(silent=True)
+	if command is not None:
+		return {'command': command.info_name}
+	return {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	starts = conn.info.get('query_start_time')
+	if not starts:
+		return
+	duration = time.perf_counter() - starts.pop()
+	stats = _current_stats()
+	if stats is not None:
+		stats.add_query(statement, duration)
+	# Медленные запросы пишутся и вне HTTP-запроса: задачи, команды, потоковые выгрузки
+	if not has_app_context():
+		return
+	threshold = current_app.config.get('SLOW_QUERY_MS')
+	if threshold is not None and duration * 1000 >= threshold:
+		slow_query_log.warning(json.dumps({
+			'event': 'slow_query',
+			'ms': round(duration * 1000, 2),
+			**_source(),
+			'statement': statement,
+			'parameters': parameter_shape(parameters),
+		}, ensure_ascii=False))
+
+
+def _handle_error(exception_context):
+	connection = exception_context.connection
+	if connection is not None and connection.info.get('query_start_time'):
+		connection.info['query_start_time'].pop()
+
+
+def _before_render(sender, template, context, **extra):
+	stats = _current_stats()
+	if stats is not None:
+		stats._template_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+	stats = _current_stats()
+	if stats is not None and stats._template_starts:
+		stats.template_time += time.perf_counter() - stats._template_starts.pop()
+
+
+def _start_request():
+	g._request_stats = RequestStats()
+
+
+def _finish_request(response):
+	stats = g.pop('_request_stats', None)
+	if stats is None:
+		return response
+	total = time.perf_counter() - stats.started
+	if current_app.config.get('SERVER_TIMING_HEADER', True):
+		response.headers.add('Server-Timing', ', '.join([
+			f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries"',
+			f'tpl;dur={stats.template_time * 1000:.2f}',
+			f'total;dur={total * 1000:.2f}',
+		]))
+	request_log.info(json.dumps({
+		'event': 'request',
+		'method': request.method,
+		'path': request.path,
+		'endpoint': request.endpoint,
+		'status': response.status_code,
+		'ms': round(total * 1000, 2),
+		'db_ms': round(stats.db_time * 1000, 2),
+		'queries': stats.query_count,
+		'template_ms': round(stats.template_time * 1000, 2),
+		'slowest': stats.slowest_statements(),
+	}, ensure_ascii=False))
+	return response
+
+
+def init_instrumentation(app):
+	"""Подключает сбор статистики к приложению (INSTRUMENTATION_ENABLED=False отключает)"""
+	global _engine_hooks_installed
+	if not app.config.get('INSTRUMENTATION_ENABLED', True):
+		return
+	if not _engine_hooks_installed:
+		# Слушаем класс Engine: так учитываются все движки, включая созданные позже
+		event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+		event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+		event.listen(Engine, 'handle_error', _handle_error)
+		_engine_hooks_installed = True
+	log = logging.getLogger('vibe')
+	if not log.handlers:
+		handler = logging.StreamHandler()
+		handler.setFormatter(logging.Formatter('%(message)s'))
+		log.addHandler(handler)
+		log.setLevel(app.config.get('REQUEST_LOG_LEVEL', 'INFO'))
+	before_render_template.connect(_before_render, app)
+	template_rendered.connect(_after_render, app)
+	app.before_request(_start_request)
+	app.after_request(_finish_request)
@@ -0,0 +1,375 @@
+# jobs.py
+"""Фоновые задачи: побочные эффекты запросов выполняются вне запроса.
+
+Задача — функция, зарегистрированная декоратором task('имя'); аргументы
+передаются именованными и должны сериализоваться в JSON. Очередь выбирает
+JOBS_BACKEND:
+
+- thread (по умолчанию) — пул потоков процесса (JOBS_WORKERS); задачи не
+  переживают перезапуск;
+- db — таблица jobs; выполняет их отдельный процесс `flask jobs-worker`
+  (пул потоков --threads, таких процессов может быть несколько);
+- eager — сразу в текущем потоке (тесты, отладка).
+
+enqueue ставит задачу немедленно. enqueue_on_commit — после коммита текущей
+транзакции db.session (при откате задача отбрасывается); в очереди db строка
+задачи пишется в ту же транзакцию.
+
+Упавшая задача повторяется до max_attempts раз с экспоненциальной задержкой
+(JOBS_BACKOFF * 2^(попытка-1), не больше JOBS_BACKOFF_MAX). Задача, чей
+воркер пропал, возвращается в очередь через JOBS_LEASE секунд. Время ожидания
+в очереди и выполнения по каждой задаче отдаёт /admin/jobs.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import abort, current_app, g, has_app_context, jsonify
+from flask_login import current_user
+from sqlalchemy import and_, event, func, or_, select, update
+from models import db, Job
+
+job_log = logging.getLogger('vibe.jobs')
+
+# имя -> (функция, max_attempts)
+_tasks = {}
+
+
+class UnknownTask(LookupError):
+	"""Задача с таким именем не зарегистрирована"""
+
+
+def task(name, max_attempts=None):
+	"""Регистрирует функцию как задачу name; функция остаётся обычной"""
+	def register(func):
+		_tasks[name] = (func, max_attempts)
+		return func
+	return register
+
+
+def _lookup(name):
+	try:
+		return _tasks[name]
+	except KeyError:
+		raise UnknownTask(name) from None
+
+
+class JobStats:
+	"""Счётчики и время ожидания/выполнения по именам задач"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._tasks = {}
+
+	def record(self, name, wait, runtime, outcome):
+		"""outcome — done, retry или failed"""
+		with self._lock:
+			entry = self._tasks.setdefault(name, {'done': 0, 'retry': 0, 'failed': 0,
+												  'wait': [0, 0.0, 0.0], 'run': [0, 0.0, 0.0]})
+			entry[outcome] += 1
+			for key, value in (('wait', wait), ('run', runtime)):
+				timing = entry[key]
+				timing[0] += 1
+				timing[1] += value
+				timing[2] = max(timing[2], value)
+
+	def status(self):
+		with self._lock:
+			result = {}
+			for name, entry in self._tasks.items():
+				result[name] = {key: entry[key] for key in ('done', 'retry', 'failed')}
+				for key in ('wait', 'run'):
+					count, total, longest = entry[key]
+					result[name][f'{key}_avg_ms'] = round(total / count * 1000, 2) if count else 0.0
+					result[name][f'{key}_max_ms'] = round(longest * 1000, 2)
+			return result
+
+
+class EagerQueue:
+	"""Выполняет задачи сразу в текущем потоке; повторы — без задержки"""
+	backend = 'eager'
+
+	def __init__(self, app=None, max_attempts=3, backoff=5.0, backoff_max=600.0):
+		self.app = app
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.backoff_max = backoff_max
+		self.stats = JobStats()
+
+	def delay(self, attempt):
+		"""Задержка перед попыткой attempt + 1"""
+		return min(self.backoff_max, self.backoff * 2 ** (attempt - 1))
+
+	def attempts_for(self, name):
+		return _lookup(name)[1] or self.max_attempts
+
+	def _call(self, name, kwargs):
+		func = _lookup(name)[0]
+		app = self.app or (current_app._get_current_object() if has_app_context() else None)
+		if app is None:
+			return func(**kwargs)
+		# Свой контекст — своя сессия БД: задача из after_commit не трогает завершённую транзакцию
+		with app.app_context():
+			# Имя задачи — в логе медленных запросов вместо endpoint
+			g._job_name = name
+			return func(**kwargs)
+
+	def _attempt(self, name, kwargs, attempt, due):
+		"""Одна попытка; возвращает задержку до повтора или None"""
+		started = time.monotonic()
+		try:
+			self._call(name, kwargs)
+		except Exception as exc:
+			runtime = time.monotonic() - started
+			if attempt < self.attempts_for(name):
+				self.stats.record(name, started - due, runtime, 'retry')
+				job_log.warning('Задача %s упала (попытка %d): %s', name, attempt, exc)
+				return self.delay(attempt)
+			self.stats.record(name, started - due, runtime, 'failed')
+			job_log.exception('Задача %s не выполнена за %d попыток', name, attempt)
+			return None
+		self.stats.record(name, started - due, time.monotonic() - started, 'done')
+		return None
+
+	def submit(self, name, kwargs):
+		_lookup(name)
+		attempt = 1
+		while self._attempt(name, kwargs, attempt, time.monotonic()) is not None:
+			attempt += 1
+
+	def status(self):
+		return {'backend': self.backend, 'tasks': self.stats.status()}
+
+	def shutdown(self):
+		pass
+
+
+class ThreadQueue(EagerQueue):
+	"""Пул потоков процесса; повтор ставится таймером после задержки"""
+	backend = 'thread'
+
+	def __init__(self, app, workers=2, **kwargs):
+		super().__init__(app, **kwargs)
+		self.workers = workers
+		self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+		self._lock = threading.Lock()
+		self._pending = 0
+
+	def _run(self, name, kwargs, attempt, due):
+		try:
+			retry_in = self._attempt(name, kwargs, attempt, due)
+		finally:
+			with self._lock:
+				self._pending -= 1
+		if retry_in is not None:
+			timer = threading.Timer(retry_in, self._schedule, (name, kwargs, attempt + 1))
+			timer.daemon = True
+			timer.start()
+
+	def _schedule(self, name, kwargs, attempt=1):
+		with self._lock:
+			self._pending += 1
+		self._pool.submit(self._run, name, kwargs, attempt, time.monotonic())
+
+	def submit(self, name, kwargs):
+		_lookup(name)
+		self._schedule(name, kwargs)
+
+	def status(self):
+		status = super().status()
+		with self._lock:
+			status.update(workers=self.workers, pending=self._pending)
+		return status
+
+	def shutdown(self):
+		self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class DatabaseQueue(EagerQueue):
+	"""Задачи в таблице jobs; выполняет их run_worker (flask jobs-worker)"""
+	backend = 'db'
+
+	def __init__(self, app, lease=600.0, **kwargs):
+		super().__init__(app, **kwargs)
+		self.lease = lease
+
+	def make_job(self, name, kwargs, run_at=None):
+		now = datetime.utcnow()
+		return Job(name=name, payload=json.dumps(kwargs), status='queued', attempts=0,
+				   max_attempts=self.attempts_for(name), created_at=now, run_at=run_at or now)
+
+	def submit(self, name, kwargs):
+		"""Отдельная транзакция: задача сохранена, что бы ни случилось с текущей"""
+		job = self.make_job(name, kwargs)
+		values = {column.key: getattr(job, column.key) for column in Job.__table__.columns if column.key != 'id'}
+		with db.engine.begin() as conn:
+			conn.execute(Job.__table__.insert().values(**values))
+
+	def claim(self):
+		"""Забирает одну готовую задачу; возвращает её id или None"""
+		now = datetime.utcnow()
+		ready = or_(and_(Job.status == 'queued', Job.run_at <= now),
+					and_(Job.status == 'running', Job.started_at < now - timedelta(seconds=self.lease)))
+		query = select(Job.id, Job.status, Job.started_at).where(ready).order_by(Job.run_at, Job.id).limit(1)
+		if db.session.get_bind().dialect.name == 'postgresql':
+			query = query.with_for_update(skip_locked=True)
+		row = db.session.execute(query).first()
+		if row is None:
+			db.session.rollback()
+			return None
+		# Условие на status/started_at: из двух воркеров задачу получит один
+		claimed = db.session.execute(
+			update(Job)
+			.where(Job.id == row.id, Job.status == row.status, Job.started_at.is_not_distinct_from(row.started_at))
+			.values(status='running', started_at=now, attempts=Job.attempts + 1)
+		).rowcount
+		db.session.commit()
+		return row.id if claimed else None
+
+	def run_claimed(self, job_id):
+		with self.app.app_context():
+			job = db.session.get(Job, job_id)
+			name, kwargs, attempt = job.name, json.loads(job.payload), job.attempts
+			wait = (job.started_at - job.run_at).total_seconds()
+			started = time.monotonic()
+			try:
+				_lookup(name)[0](**kwargs)
+			except Exception as exc:
+				runtime = time.monotonic() - started
+				db.session.rollback()
+				job = db.session.get(Job, job_id)
+				job.last_error = f'{type(exc).__name__}: {exc}'
+				if attempt < job.max_attempts and not isinstance(exc, UnknownTask):
+					job.status = 'queued'
+					job.run_at = datetime.utcnow() + timedelta(seconds=self.delay(attempt))
+					self.stats.record(name, wait, runtime, 'retry')
+					job_log.warning('Задача %s #%d упала (попытка %d): %s', name, job_id, attempt, exc)
+				else:
+					job.status = 'failed'
+					job.finished_at = datetime.utcnow()
+					self.stats.record(name, wait, runtime, 'failed')
+					job_log.exception('Задача %s #%d не выполнена за %d попыток', name, job_id, attempt)
+			else:
+				runtime = time.monotonic() - started
+				job = db.session.get(Job, job_id)
+				job.status = 'done'
+				job.finished_at = datetime.utcnow()
+				self.stats.record(name, wait, runtime, 'done')
+			db.session.commit()
+
+	def status(self):
+		status = super().status()
+		counts = db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+		status['jobs'] = dict(counts)
+		oldest = db.session.execute(
+			select(func.min(Job.run_at)).where(Job.status == 'queued', Job.run_at <= datetime.utcnow())).scalar()
+		status['lag_seconds'] = round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0
+		return status
+
+
+def run_worker(queue, threads=4, poll_interval=1.0, once=False, stop=None):
+	"""Цикл воркера: забирает задачи, пока есть свободные потоки.
+	once — выйти, когда готовых задач не останется"""
+	stop = stop or threading.Event()
+	slots = threading.Semaphore(threads)
+	processed = 0
+	with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jobs-worker') as pool:
+		while not stop.is_set():
+			slots.acquire()
+			with queue.app.app_context():
+				job_id = queue.claim()
+			if job_id is None:
+				slots.release()
+				if once:
+					break
+				stop.wait(poll_interval)
+				continue
+			processed += 1
+			pool.submit(queue.run_claimed, job_id).add_done_callback(lambda future: slots.release())
+	return processed
+
+
+_default = None
+
+
+def get_queue():
+	"""Очередь приложения; без неё (скрипты, тесты без init_jobs) задачи выполняются сразу"""
+	global _default
+	if has_app_context() and 'jobs' in current_app.extensions:
+		return current_app.extensions['jobs']
+	if _default is None:
+		_default = EagerQueue()
+	return _default
+
+
+def enqueue(name, **kwargs):
+	get_queue().submit(name, kwargs)
+
+
+def enqueue_on_commit(name, **kwargs):
+	queue = get_queue()
+	if isinstance(queue, DatabaseQueue):
+		db.session.add(queue.make_job(name, kwargs))
+	else:
+		_lookup(name)
+		db.session.info.setdefault('pending_jobs', []).append((name, kwargs))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _submit_pending_jobs(session):
+	pending = session.info.pop('pending_jobs', None)
+	for name, kwargs in pending or ():
+		get_queue().submit(name, kwargs)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending_jobs(session):
+	session.info.pop('pending_jobs', None)
+
+
+def _jobs_endpoint():
+	if not current_user.is_authenticated or not current_user.is_admin():
+		abort(404)
+	return jsonify(get_queue().status())
+
+
+def init_jobs(app):
+	"""Очередь по JOBS_BACKEND, маршрут /admin/jobs и команды flask jobs-worker / jobs-enqueue"""
+	options = {
+		'max_attempts': app.config.get('JOBS_MAX_ATTEMPTS', 3),
+		'backoff': app.config.get('JOBS_BACKOFF', 5.0),
+		'backoff_max': app.config.get('JOBS_BACKOFF_MAX', 600.0),
+	}
+	backend = app.config.get('JOBS_BACKEND') or 'thread'
+	if backend == 'db':
+		queue = DatabaseQueue(app, lease=app.config.get('JOBS_LEASE', 600.0), **options)
+	elif backend == 'thread':
+		queue = ThreadQueue(app, workers=app.config.get('JOBS_WORKERS', 2), **options)
+	elif backend == 'eager':
+		queue = EagerQueue(app, **options)
+	else:
+		raise ValueError(f'Неизвестный JOBS_BACKEND: {backend}')
+	app.extensions['jobs'] = queue
+	app.add_url_rule('/admin/jobs', 'jobs_status', _jobs_endpoint)
+
+	@app.cli.command('jobs-worker')
+	@click.option('--threads', default=4, show_default=True, help='сколько задач выполнять одновременно')
+	@click.option('--poll', default=None, type=float, help='пауза между опросами пустой очереди, с')
+	@click.option('--once', is_flag=True, help='выйти, когда готовых задач не останется')
+	def jobs_worker(threads, poll, once):
+		"""Выполняет задачи из таблицы jobs (JOBS_BACKEND=db)"""
+		if not isinstance(queue, DatabaseQueue):
+			raise click.ClickException('Воркер нужен только для JOBS_BACKEND=db')
+		poll = app.config.get('JOBS_POLL_INTERVAL', 1.0) if poll is None else poll
+		processed = run_worker(queue, threads=threads, poll_interval=poll, once=once)
+		print(f'Выполнено задач: {processed}')
+
+	@app.cli.command('jobs-enqueue')
+	@click.argument('name')
+	@click.option('--kwargs', default='{}', help='аргументы задачи в JSON')
+	def jobs_enqueue(name, kwargs):
+		"""Ставит задачу в очередь, например: flask jobs-enqueue stats.refresh"""
+		queue.submit(name, json.loads(kwargs))
@@ -0,0 +1,33 @@
+# loaders.py
+"""Именованные профили загрузки связей (selectinload/joinedload).
+
+Все связи в models.py ленивые, поэтому шаблон, обходящий item.product или
+order.customer, делает по запросу на строку. Профиль подгружает нужные связи
+заранее: Cart.query.options(*load_profile('cart')).
+"""
+from sqlalchemy.orm import joinedload
+from models import Cart, Order, Product
+
+# Профили строятся функциями: backref-связи (Cart.product, Product.category и т.п.)
+# появляются только после настройки мапперов
+LOADER_PROFILES = {
+	# Корзина, оформление заказа: товар каждой позиции
+	'cart': lambda: (
+		joinedload(Cart.product),
+	),
+	# Списки заказов (админка, кабинет продавца): покупатель и продавец
+	'order_list': lambda: (
+		joinedload(Order.customer),
+		joinedload(Order.seller),
+	),
+	# Таблицы товаров в админке: категория и поставщик
+	'product_list': lambda: (
+		joinedload(Product.category),
+		joinedload(Product.supplier),
+	),
+}
+
+
+def load_profile(name):
+	"""Опции загрузчика для профиля name"""
+	return LOADER_PROFILES[name]()
@@ -1,79 +1,130 @@
 import os
 from flask import Flask
 from flask_login import LoginManager
-from flask import request, redirect, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-from models import db, User, Role
+from models import db
 from routes import auth_bp
 from admin import init_admin
+from catalog import init_catalog
+from search import init_search
+from stats import init_stats
+from admin_metrics import init_admin_metrics
+from instrumentation import init_instrumentation
+from images import init_images
+from cart import init_cart
+from bootstrap import init_bootstrap
+from db_pool import engine_options, init_db_pool
+from replicas import replica_binds
+from http_cache import init_http_cache
+from passwords import init_passwords
+from throttle import init_throttle
+from principals import init_principals, load_principal
+from jobs import init_jobs
 
 
 load_dotenv()
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
-db.init_app(app)
+def create_app(config=None):
+	"""Создаёт приложение. Обращений к БД при создании нет: роли и админа
+	заводит команда flask bootstrap"""
+	app = Flask(__name__)
+	app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
+	app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+	app.config['CATALOG_CACHE_TTL'] = float(os.getenv('CATALOG_CACHE_TTL', 60))
+	app.config['CATALOG_CACHE_SIZE'] = int(os.getenv('CATALOG_CACHE_SIZE', 256))
+	app.config['CATALOG_VERSION_URL'] = os.getenv('CATALOG_VERSION_URL')
+	app.config['HTTP_CACHE_MAX_AGE'] = int(os.getenv('HTTP_CACHE_MAX_AGE', 0))
+	app.config['HTTP_CACHE_BUILD'] = os.getenv('HTTP_CACHE_BUILD', '')
+	app.config['PAGE_CACHE_BYTES'] = int(os.getenv('PAGE_CACHE_BYTES', 32 * 1024 * 1024))
+	app.config['PAGE_CACHE_COMPRESS'] = os.getenv('PAGE_CACHE_COMPRESS', '1') == '1'
+	app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.getenv('STATIC_MAX_AGE', 3600))
+	app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND')
+	app.config['ADMIN_METRICS_TTL'] = float(os.getenv('ADMIN_METRICS_TTL', 30))
+	app.config['INSTRUMENTATION_ENABLED'] = os.getenv('INSTRUMENTATION_ENABLED', '1') == '1'
+	app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+	app.config['REQUEST_LOG_LEVEL'] = os.getenv('REQUEST_LOG_LEVEL', 'INFO')
+	app.config['EXPORT_BATCH'] = int(os.getenv('EXPORT_BATCH', 1000))
+	app.config['JOBS_BACKEND'] = os.getenv('JOBS_BACKEND', 'thread')
+	app.config['JOBS_WORKERS'] = int(os.getenv('JOBS_WORKERS', 2))
+	app.config['JOBS_MAX_ATTEMPTS'] = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+	app.config['JOBS_BACKOFF'] = float(os.getenv('JOBS_BACKOFF', 5))
+	app.config['JOBS_BACKOFF_MAX'] = float(os.getenv('JOBS_BACKOFF_MAX', 600))
+	app.config['JOBS_LEASE'] = float(os.getenv('JOBS_LEASE', 600))
+	app.config['JOBS_POLL_INTERVAL'] = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+	app.config['IMAGE_VARIANT_FORMAT'] = os.getenv('IMAGE_VARIANT_FORMAT', 'webp')
+	app.config['IMAGE_MANIFEST_CHECK'] = float(os.getenv('IMAGE_MANIFEST_CHECK', 2))
+	app.config['CART_CACHE_URL'] = os.getenv('CART_CACHE_URL')
+	app.config['CART_CACHE_TTL'] = float(os.getenv('CART_CACHE_TTL', 600))
+	app.config['CART_CACHE_SIZE'] = int(os.getenv('CART_CACHE_SIZE', 10000))
+	app.config['CART_BATCH_MAX'] = int(os.getenv('CART_BATCH_MAX', 50))
+	app.config['PRINCIPAL_CACHE_TTL'] = float(os.getenv('PRINCIPAL_CACHE_TTL', 30))
+	app.config['PRINCIPAL_CACHE_SIZE'] = int(os.getenv('PRINCIPAL_CACHE_SIZE', 10000))
+	app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+	app.config['ARGON2_TIME_COST'] = int(os.getenv('ARGON2_TIME_COST', 3))
+	app.config['ARGON2_MEMORY_COST'] = int(os.getenv('ARGON2_MEMORY_COST', 65536))
+	app.config['ARGON2_PARALLELISM'] = int(os.getenv('ARGON2_PARALLELISM', 4))
+	app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 0))
+	app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 32))
+	app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+	app.config['THROTTLE_ENABLED'] = os.getenv('THROTTLE_ENABLED', '1') == '1'
+	app.config['THROTTLE_URL'] = os.getenv('THROTTLE_URL')
+	app.config['THROTTLE_RULES'] = os.getenv('THROTTLE_RULES')
+	app.config['THROTTLE_MAX_KEYS'] = int(os.getenv('THROTTLE_MAX_KEYS', 100000))
+	app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', 0))
+	app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5))
+	app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+	app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+	app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+	app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+	app.config['DB_POOL_WAIT_LOG_MS'] = float(os.getenv('DB_POOL_WAIT_LOG_MS', 100))
+	app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+	app.config['DB_PGBOUNCER'] = os.getenv('DB_PGBOUNCER', '0') == '1'
+	app.config['DB_REPLICA_URLS'] = os.getenv('DB_REPLICA_URLS', '')
+	app.config['DB_REPLICA_PIN_SECONDS'] = float(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+	if config:
+		app.config.update(config)
+	# За nginx/балансировщиком адрес клиента (и ключ ограничений по IP) — из X-Forwarded-For;
+	# значение — число доверенных прокси перед приложением
+	if app.config['PROXY_FIX_X_FOR']:
+		app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+	app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+	# Binds не наследуют SQLALCHEMY_ENGINE_OPTIONS: настройки пула задаём каждой реплике
+	binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+	for key, url in replica_binds(app.config['DB_REPLICA_URLS']).items():
+		binds.setdefault(key, dict(engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url)), url=url))
+	app.config['SQLALCHEMY_BINDS'] = binds
 
-login_manager = LoginManager(app)
-# login_manager.login_view = 'auth.login'
+	db.init_app(app)
+	init_db_pool(app)
+	# Первым из before_request: лишние запросы отсекаются до любой работы
+	init_throttle(app)
+	init_instrumentation(app)
+	init_jobs(app)
 
-@login_manager.user_loader
-def load_user(user_id):
-	return db.session.get(User, int(user_id))
+	login_manager = LoginManager(app)
+	# login_manager.login_view = 'auth.login'
 
+	# Снимок пользователя из кэша вместо загрузки User и Role на каждый запрос
+	login_manager.user_loader(load_principal)
 
-app.register_blueprint(auth_bp)
-init_admin(app)
+	app.register_blueprint(auth_bp)
+	init_admin(app)
+	init_catalog(app)
+	init_search(app)
+	init_stats(app)
+	init_admin_metrics(app)
+	init_images(app)
+	init_cart(app)
+	init_principals(app)
+	init_bootstrap(app)
+	init_http_cache(app)
+	init_passwords(app)
+	return app
 
-with app.app_context():
-	# При первом старте, разблокировать
-	# db.create_all()
 
-	# desired_roles = ['Admin', 'Seller', 'User']
-	# for role_name in desired_roles:
-	# 	role = Role.query.filter_by(name=role_name).first()
-	# 	if not role:
-	# 		role = Role(name=role_name)
-	# 		db.session.add(role)
-	# 		print(f"Создана роль: {role_name}")
-	# 	else:
-	# 		print(f"Роль уже существует: {role_name} (id={role.id})")
-	# db.session.commit()
-
-	admin_role = Role.query.filter_by(name='Admin').first()
-	if not admin_role:
-		raise Exception("Роль Admin не найдена! Что-то пошло не так.")
-
-	admin_username = os.getenv('ADMIN_USERNAME', 'admin').strip()
-	admin_email = os.getenv('ADMIN_EMAIL', f"{admin_username}@example.com").strip()
-	admin_password = os.getenv('ADMIN_PASSWORD', 'admin123').strip()
-
-	admin_user = User.query.filter_by(email=admin_email).first()
-	if admin_user:
-		if admin_user.role_id != admin_role.id or admin_user.role.name != 'Admin':
-			print(f"Предупреждение: Пользователь {admin_email} был не админом → исправляем роль!")
-			admin_user.role_id = admin_role.id
-		admin_user.username = admin_username
-		admin_user.is_active = True
-		admin_user.first_name = 'Админ'
-		admin_user.last_name = 'Системы'
-		admin_user.set_password(admin_password)
-	else:
-		admin_user = User(
-			username=admin_username,
-			email=admin_email,
-			role_id=admin_role.id,
-			is_active=True,
-			first_name='Админ',
-			last_name='Системы'
-		)
-		admin_user.set_password(admin_password)
-		db.session.add(admin_user)
-		print(f"Админ создан: {admin_email} / {admin_password}")
-
-	db.session.commit()
+app = create_app()
 
 if __name__ == '__main__':
-	app.run(debug=True)
\ No newline at end of file
+	app.run(debug=True)
@@ -0,0 +1,88 @@
+"""Окружение Alembic: схема — metadata моделей, подключение — движок приложения.
+
+Адрес БД берётся из конфигурации приложения (SQLALCHEMY_DATABASE_URI);
+alembic -x url=... задаёт другой адрес, например для проверки на копии.
+"""
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import Column, ForeignKey, Index, Integer, MetaData, Table, Text, create_engine
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.pool import NullPool
+
+from models import db
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Устаревшие модели, которых нет в схеме (reviews ссылается на order_details)
+IGNORED_TABLES = {'reviews'}
+
+target_metadata = MetaData(naming_convention=db.metadata.naming_convention)
+for _table in db.metadata.tables.values():
+    if _table.name not in IGNORED_TABLES:
+        _table.to_metadata(target_metadata)
+
+
+def add_search_table(metadata):
+    """product_search вне моделей (миграция 0004): описана здесь, чтобы alembic check
+    сверял её в PostgreSQL; в других БД её нет"""
+    Table(
+        'product_search', metadata,
+        Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        Column('content', Text, nullable=False),
+        Column('document', TSVECTOR, nullable=False),
+        Index('idx_product_search_document', 'document', postgresql_using='gin'),
+        Index('idx_product_search_content_trgm', 'content', postgresql_using='gin',
+              postgresql_ops={'content': 'gin_trgm_ops'}),
+    )
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    if type_ == 'table':
+        return name not in IGNORED_TABLES
+    table = getattr(obj, 'table', None)
+    return table is None or table.name not in IGNORED_TABLES
+
+
+def database_url():
+    url = context.get_x_argument(as_dictionary=True).get('url')
+    if url:
+        return url
+    from main import create_app
+    return create_app().config['SQLALCHEMY_DATABASE_URI']
+
+
+def run_migrations_offline():
+    context.configure(url=database_url(), target_metadata=target_metadata, include_object=include_object,
+                      literal_binds=True, dialect_opts={'paramstyle': 'named'})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        # Соединение передано из кода (тесты, flask-команды)
+        _run(connection)
+        return
+    engine = create_engine(database_url(), poolclass=NullPool)
+    with engine.connect() as connection:
+        _run(connection)
+
+
+def _run(connection):
+    if connection.dialect.name == 'postgresql' and 'product_search' not in target_metadata.tables:
+        add_search_table(target_metadata)
+    # Каждая миграция в своей транзакции: индексы CONCURRENTLY строятся вне транзакции (autocommit_block)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object,
+                      render_as_batch=connection.dialect.name == 'sqlite', transaction_per_migration=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
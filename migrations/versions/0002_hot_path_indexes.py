@@ -0,0 +1,42 @@
+"""Индексы для горячих запросов: каталог, корзина, заказы, админка.
+
+Корзина по user_id и паре (user_id, product_id) уже обслуживается
+уникальным индексом uq_cart_user_product (database/cart_unique.sql).
+В PostgreSQL индексы строятся CONCURRENTLY, без блокировки записи в таблицы.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 16:05:00.000000
+"""
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_users_role_id_created_at', 'users', ['role_id', 'created_at', 'id']),
+    ('ix_products_catalog_price', 'products', ['is_published', 'category_id', 'price', 'id']),
+    ('ix_products_created_by_created_at', 'products', ['created_by', 'created_at', 'id']),
+    # Был в database/updated_structure_3.sql, поэтому может уже существовать
+    ('idx_products_created_at', 'products', ['created_at']),
+    ('ix_products_price', 'products', ['price']),
+    ('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at']),
+    ('ix_orders_seller_id_created_at', 'orders', ['seller_id', 'created_at']),
+    ('ix_orders_created_at', 'orders', ['created_at', 'id']),
+    ('ix_order_items_order_id', 'order_items', ['order_id']),
+    ('ix_order_items_product_id', 'order_items', ['product_id']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,56 @@
+"""Поисковый индекс товаров product_search (search.PostgresSearchBackend).
+
+Только для PostgreSQL: tsvector, GIN и pg_trgm. Повторяет database/search_index.sql,
+поэтому на БД, где скрипт уже выполнен, ничего не меняет. В SQLite поиск
+работает в памяти процесса (MemorySearchBackend), таблица не нужна.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 21:10:00.000000
+"""
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def _is_postgres():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if not _is_postgres():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS product_search (
+            product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+            content TEXT NOT NULL,
+            document TSVECTOR NOT NULL
+        )
+    """)
+    op.execute('CREATE INDEX IF NOT EXISTS idx_product_search_document ON product_search USING GIN (document)')
+    op.execute('CREATE INDEX IF NOT EXISTS idx_product_search_content_trgm '
+               'ON product_search USING GIN (content gin_trgm_ops)')
+    # Первичное заполнение; дальше индекс поддерживает приложение
+    op.execute("""
+        INSERT INTO product_search (product_id, content, document)
+        SELECT p.id,
+               concat_ws(' ', p.productname, c.category_name, u.username),
+               setweight(to_tsvector('simple', coalesce(p.productname, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(c.category_name, '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(u.username, '')), 'C')
+        FROM products p
+        JOIN categories c ON c.id = p.category_id
+        JOIN users u ON u.id = p.created_by
+        ON CONFLICT (product_id) DO NOTHING
+    """)
+
+
+def downgrade():
+    if not _is_postgres():
+        return
+    # Расширение pg_trgm не удаляем: им могут пользоваться и другие объекты БД
+    op.execute('DROP TABLE IF EXISTS product_search')
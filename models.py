@@ -1,10 +1,13 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy import event, false
+from replicas import RoutingSession
+from passwords import hash_password, verify_password, needs_rehash
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class Role(db.Model):
@@ -18,8 +21,45 @@ class Role(db.Model):
         return f'<Role {self.name}>'
 
 
+def _role_ids():
+	# Кэш id ролей по нормализованному имени — у каждого приложения свой: роли меняются
+	# редко, а фильтр по id, в отличие от lower(trim(name)), использует индекс
+	return current_app.extensions.setdefault('role_ids', {})
+
+
+def get_role_id(name):
+	"""id роли по имени без учёта регистра и пробелов; None, если роли нет"""
+	key = name.strip().lower()
+	cache = _role_ids()
+	if key not in cache:
+		role_id = db.session.query(Role.id).filter(db.func.lower(db.func.trim(Role.name)) == key).scalar()
+		if role_id is None:
+			return None
+		cache[key] = role_id
+	return cache[key]
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_role_changes(session, flush_context):
+	if any(isinstance(obj, Role) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+		session.info['roles_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _clear_role_ids(session):
+	if session.info.pop('roles_changed', False) and has_app_context():
+		_role_ids().clear()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_role_changes(session):
+	session.info.pop('roles_changed', None)
+
+
 class User(UserMixin, db.Model):
 	__tablename__ = 'users'
+	# Списки клиентов/продавцов в админке: фильтр по роли, курсор по (created_at, id)
+	__table_args__ = (db.Index('ix_users_role_id_created_at', 'role_id', 'created_at', 'id'),)
 
 	id = db.Column(db.Integer, primary_key=True)
 	username = db.Column(db.String(64), unique=True, nullable=False)
@@ -53,10 +93,14 @@ class User(UserMixin, db.Model):
 	supplier = db.relationship('Supplier', backref='user', uselist=False, lazy=True)
 
 	def set_password(self, password):
-		self.password_hash = generate_password_hash(password)
+		self.password_hash = hash_password(password)
 
 	def check_password(self, password):
-		return check_password_hash(self.password_hash, password)
+		return verify_password(self.password_hash, password)
+
+	def password_needs_rehash(self):
+		"""Хэш сделан устаревшим методом или стоимостью (см. passwords.py)"""
+		return needs_rehash(self.password_hash)
 
 	def is_admin(self):
 		return bool(self.role and getattr(self.role, 'name', '').lower() == 'admin')
@@ -65,6 +109,12 @@ class User(UserMixin, db.Model):
 		return f'<User {self.username}>'
 
 
+def has_role(name):
+	"""Условие «у пользователя роль name»; если роли нет — заведомо ложное, а не role_id IS NULL"""
+	role_id = get_role_id(name)
+	return User.role_id == role_id if role_id is not None else false()
+
+
 class Category(db.Model):
 	__tablename__ = 'categories'
 
@@ -86,6 +136,15 @@ class Supplier(db.Model):
 
 class Product(db.Model):
 	__tablename__ = 'products'
+	__table_args__ = (
+		# Каталог: опубликованные товары категории с фильтром и сортировкой по цене
+		db.Index('ix_products_catalog_price', 'is_published', 'category_id', 'price', 'id'),
+		# «Мои товары» продавца, новые первыми
+		db.Index('ix_products_created_by_created_at', 'created_by', 'created_at', 'id'),
+		db.Index('idx_products_created_at', 'created_at'),
+		# Топ самых дорогих и дешёвых товаров
+		db.Index('ix_products_price', 'price'),
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	productname = db.Column(db.String(100), nullable=False)
@@ -107,6 +166,9 @@ class Product(db.Model):
 
 class Cart(db.Model):
 	__tablename__ = 'cart'
+	# Одна строка на товар в корзине: повторное добавление увеличивает quantity (см. cart.py).
+	# Уникальный индекс (user_id, product_id) обслуживает и выборку корзины по user_id
+	__table_args__ = (db.UniqueConstraint('user_id', 'product_id', name='uq_cart_user_product'),)
 
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -117,6 +179,13 @@ class Cart(db.Model):
 
 class Order(db.Model):
 	__tablename__ = 'orders'
+	__table_args__ = (
+		# Последние заказы покупателя и сводка продавца
+		db.Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+		db.Index('ix_orders_seller_id_created_at', 'seller_id', 'created_at'),
+		# Новые заказы за период и курсор админки по (created_at, id)
+		db.Index('ix_orders_created_at', 'created_at', 'id'),
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -138,8 +207,8 @@ class OrderItem(db.Model):
 	__tablename__ = 'order_items'
 
 	id = db.Column(db.Integer, primary_key=True)
-	order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-	product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+	order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+	product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
 	quantity = db.Column(db.Integer, nullable=False)
 	price = db.Column(db.Numeric(10, 2), nullable=False)
 	created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -152,6 +221,43 @@ class OrderItem(db.Model):
 		return f'<OrderItem {self.id}>'
 
 
+class ProductStat(db.Model):
+	"""Предрасчитанная статистика продаж товара (обновляется при оформлении заказа)"""
+	__tablename__ = 'product_stats'
+
+	product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+	order_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+	units_sold = db.Column(db.Integer, nullable=False, default=0)
+	revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+	# Связи
+	product = db.relationship('Product', backref=db.backref('stats', uselist=False, lazy=True,
+														   cascade='all, delete-orphan', passive_deletes=True))
+
+
+class Job(db.Model):
+	"""Фоновая задача очереди в БД (jobs.py, JOBS_BACKEND=db)"""
+	__tablename__ = 'jobs'
+	# Воркер выбирает готовые задачи: status = 'queued' AND run_at <= now ORDER BY run_at
+	__table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(100), nullable=False)
+	payload = db.Column(db.Text, nullable=False, default='{}')
+	status = db.Column(db.String(16), nullable=False, default='queued')
+	attempts = db.Column(db.Integer, nullable=False, default=0)
+	max_attempts = db.Column(db.Integer, nullable=False, default=3)
+	last_error = db.Column(db.Text)
+	created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	started_at = db.Column(db.DateTime)
+	finished_at = db.Column(db.DateTime)
+
+	def __repr__(self):
+		return f'<Job {self.id} {self.name} {self.status}>'
+
+
 class UserRole(db.Model):
 	__tablename__ = 'user_roles'
 
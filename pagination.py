@@ -0,0 +1,123 @@
+# pagination.py
+"""Keyset-пагинация (поиск по ключу вместо OFFSET) с непрозрачными курсорами"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import tuple_
+from models import db
+
+
+class KeysetPage:
+	"""Страница, полученная по курсору"""
+
+	def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+		self.items = items
+		self.next_cursor = next_cursor
+		self.prev_cursor = prev_cursor
+		self.total = total
+
+	@property
+	def has_next(self):
+		return self.next_cursor is not None
+
+	@property
+	def has_prev(self):
+		return self.prev_cursor is not None
+
+
+def _dump_value(value):
+	if isinstance(value, datetime):
+		return ['dt', value.isoformat()]
+	if isinstance(value, Decimal):
+		return ['dec', str(value)]
+	return ['v', value]
+
+
+def _load_value(item):
+	kind, value = item
+	if kind == 'dt':
+		return datetime.fromisoformat(value)
+	if kind == 'dec':
+		return Decimal(value)
+	if kind == 'v':
+		return value
+	raise ValueError(f'Неизвестный тип значения в курсоре: {kind}')
+
+
+def encode_cursor(values, direction):
+	payload = json.dumps({'k': [_dump_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+	return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+	"""Разбирает курсор; ValueError, если он повреждён"""
+	try:
+		padded = token + '=' * (-len(token) % 4)
+		payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+		direction = payload['d']
+		values = [_load_value(item) for item in payload['k']]
+	except (ValueError, KeyError, TypeError) as e:
+		raise ValueError('Некорректный курсор') from e
+	if direction not in ('next', 'prev'):
+		raise ValueError('Некорректный курсор')
+	return values, direction
+
+
+def approximate_count(query):
+	"""Оценка числа строк: в PostgreSQL — по плану EXPLAIN без прохода по таблице, иначе COUNT(*)"""
+	query = query.order_by(None)
+	connection = db.session.connection()
+	if connection.dialect.name != 'postgresql':
+		return query.count()
+	compiled = query.statement.compile(dialect=connection.dialect)
+	plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+	if isinstance(plan, str):
+		plan = json.loads(plan)
+	return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_paginate(query, columns, descending=True, cursor=None, per_page=20, with_total=False):
+	"""Возвращает KeysetPage, упорядоченную по columns (последний столбец — уникальный, обычно id).
+
+	Время выборки не зависит от глубины страницы: фильтр по кортежу ключей
+	использует составной индекс, а COUNT(*) не выполняется.
+	Строки с NULL в столбцах ключа в выдачу не попадают.
+	"""
+	values, direction = (None, 'next')
+	if cursor:
+		try:
+			values, direction = decode_cursor(cursor)
+		except ValueError:
+			values, direction = (None, 'next')
+		if values is not None and len(values) != len(columns):
+			values, direction = (None, 'next')
+
+	key = tuple_(*columns)
+	forward = direction == 'next'
+	# При движении назад выбираем в обратном порядке и затем разворачиваем
+	ascending = descending != forward
+	page_query = query
+	if values is not None:
+		bound = tuple_(*values)
+		page_query = page_query.filter(key > bound if ascending else key < bound)
+	order = [c.asc() if ascending else c.desc() for c in columns]
+	rows = page_query.order_by(*order).limit(per_page + 1).all()
+
+	has_more = len(rows) > per_page
+	rows = rows[:per_page]
+	if not forward:
+		rows.reverse()
+
+	def row_key(row):
+		return [getattr(row, c.key) for c in columns]
+
+	next_cursor = prev_cursor = None
+	if rows:
+		if has_more if forward else values is not None:
+			next_cursor = encode_cursor(row_key(rows[-1]), 'next')
+		if (values is not None) if forward else has_more:
+			prev_cursor = encode_cursor(row_key(rows[0]), 'prev')
+
+	total = approximate_count(query) if with_total else None
+	return KeysetPage(rows, next_cursor, prev_cursor, total)
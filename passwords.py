@@ -0,0 +1,192 @@
+# passwords.py
+"""Хэширование паролей с настраиваемым алгоритмом, ограниченной очередью и метриками.
+
+Алгоритм и стоимость задаёт PASSWORD_HASH_METHOD в формате werkzeug
+(scrypt:32768:8:1, pbkdf2:sha256:600000) или argon2 (нужен пакет argon2-cffi,
+параметры ARGON2_TIME_COST / ARGON2_MEMORY_COST / ARGON2_PARALLELISM).
+Проверяются хэши любого из этих форматов; needs_rehash говорит, что хэш
+сделан не текущим методом, и при входе пароль перехэшируется.
+
+PASSWORD_HASH_WORKERS > 0 выносит хэширование в пул процессов. В любом режиме
+одновременно выполняется и ждёт не больше PASSWORD_HASH_QUEUE операций:
+сверх этого HashingBusy сразу, чтобы всплеск входов не занял все воркеры.
+Метрики отдаёт /admin/hashing (только администраторам).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import abort, current_app, has_app_context, jsonify
+from flask_login import current_user
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+	import argon2
+except ImportError:  # argon2-cffi нужен только для PASSWORD_HASH_METHOD=argon2
+	argon2 = None
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+hash_log = logging.getLogger('vibe.passwords')
+
+
+class HashingBusy(RuntimeError):
+	"""Очередь хэширования заполнена; запрос стоит повторить позже"""
+
+
+def _argon2_hasher(params):
+	return argon2.PasswordHasher(**(params or {}))
+
+
+def _hash(method, argon2_params, password):
+	if method == 'argon2':
+		return _argon2_hasher(argon2_params).hash(password)
+	return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password):
+	if stored.startswith('$argon2'):
+		if argon2 is None:
+			return False
+		try:
+			return argon2.PasswordHasher().verify(stored, password)
+		except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+			return False
+	return check_password_hash(stored, password)
+
+
+class HashingService:
+	"""Хэширование и проверка паролей: в потоке запроса или в пуле процессов"""
+
+	def __init__(self, method=DEFAULT_METHOD, argon2_params=None, workers=0, max_queue=32, timeout=10.0):
+		if method == 'argon2' and argon2 is None:
+			hash_log.warning('argon2-cffi не установлен, пароли хэшируются методом %s', DEFAULT_METHOD)
+			method = DEFAULT_METHOD
+		self.method = method
+		self.argon2_params = argon2_params
+		self.max_queue = max_queue
+		self.timeout = timeout
+		self._pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+		self._prefix = None
+		self._lock = threading.Lock()
+		self._pending = 0
+		self.rejected = 0
+		self.rehashed = 0
+		self._timings = {'hash': [0, 0.0, 0.0], 'verify': [0, 0.0, 0.0]}
+
+	def _run(self, operation, func, *args):
+		with self._lock:
+			if self._pending >= self.max_queue:
+				self.rejected += 1
+				raise HashingBusy(f'В очереди хэширования {self._pending} операций')
+			self._pending += 1
+		started = time.perf_counter()
+		if self._pool is None:
+			try:
+				return func(*args)
+			finally:
+				self._release(operation, started)
+		try:
+			future = self._pool.submit(func, *args)
+		except BaseException:
+			self._release(operation, started)
+			raise
+		# Слот занят, пока задача работает в пуле: запрос, переставший ждать по таймауту,
+		# не освобождает воркер
+		future.add_done_callback(lambda _: self._release(operation, started))
+		try:
+			return future.result(timeout=self.timeout)
+		except FutureTimeoutError:
+			raise HashingBusy('Хэширование не уложилось в PASSWORD_HASH_TIMEOUT') from None
+
+	def _release(self, operation, started):
+		elapsed = time.perf_counter() - started
+		with self._lock:
+			self._pending -= 1
+			timing = self._timings[operation]
+			timing[0] += 1
+			timing[1] += elapsed
+			timing[2] = max(timing[2], elapsed)
+
+	def hash(self, password):
+		return self._run('hash', _hash, self.method, self.argon2_params, password)
+
+	def verify(self, stored, password):
+		if not stored:
+			return False
+		return self._run('verify', _verify, stored, password)
+
+	def needs_rehash(self, stored):
+		"""Сделан ли хэш не текущим методом или с другой стоимостью"""
+		if self.method == 'argon2':
+			return not stored.startswith('$argon2') or _argon2_hasher(self.argon2_params).check_needs_rehash(stored)
+		if self._prefix is None:
+			# werkzeug дописывает в метод значения по умолчанию (pbkdf2:sha256 -> pbkdf2:sha256:1000000)
+			self._prefix = generate_password_hash('', method=self.method).split('$', 1)[0]
+		return stored.split('$', 1)[0] != self._prefix
+
+	def record_rehash(self):
+		with self._lock:
+			self.rehashed += 1
+
+	def status(self):
+		with self._lock:
+			status = {'method': self.method, 'workers': self._pool._max_workers if self._pool else 0,
+					  'pending': self._pending, 'max_queue': self.max_queue,
+					  'rejected': self.rejected, 'rehashed': self.rehashed}
+			for operation, (count, total, longest) in self._timings.items():
+				status[operation] = {'count': count, 'avg_ms': round(total / count * 1000, 2) if count else 0.0,
+									 'max_ms': round(longest * 1000, 2)}
+		return status
+
+	def shutdown(self):
+		if self._pool is not None:
+			self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_default = None
+
+
+def get_hasher():
+	"""Сервис приложения; вне приложения (скрипты) — с настройками по умолчанию"""
+	global _default
+	if has_app_context() and 'password_hasher' in current_app.extensions:
+		return current_app.extensions['password_hasher']
+	if _default is None:
+		_default = HashingService()
+	return _default
+
+
+def hash_password(password):
+	return get_hasher().hash(password)
+
+
+def verify_password(stored, password):
+	return get_hasher().verify(stored, password)
+
+
+def needs_rehash(stored):
+	return get_hasher().needs_rehash(stored)
+
+
+def _hashing_endpoint():
+	if not current_user.is_authenticated or not current_user.is_admin():
+		abort(404)
+	return jsonify(get_hasher().status())
+
+
+def init_passwords(app):
+	"""Создаёт сервис хэширования по PASSWORD_HASH_* и маршрут /admin/hashing"""
+	argon2_params = {
+		'time_cost': app.config.get('ARGON2_TIME_COST', 3),
+		'memory_cost': app.config.get('ARGON2_MEMORY_COST', 65536),
+		'parallelism': app.config.get('ARGON2_PARALLELISM', 4),
+	}
+	app.extensions['password_hasher'] = HashingService(
+		method=app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD,
+		argon2_params=argon2_params,
+		workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+		max_queue=app.config.get('PASSWORD_HASH_QUEUE', 32),
+		timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+	)
+	app.add_url_rule('/admin/hashing', 'password_hashing', _hashing_endpoint)
@@ -0,0 +1,129 @@
+# principals.py
+"""Дешёвая загрузка пользователя для Flask-Login.
+
+user_loader возвращает не модель User, а Principal — неизменяемый снимок
+(id, имя, email, роль, активность) на __slots__. Снимки хранятся в LRU
+памяти процесса с коротким TTL, так что обычная страница вошедшего
+пользователя не делает ни одного запроса ради current_user; промах стоит
+одного запроса (users JOIN roles) вместо двух.
+
+Снимок сбрасывается после коммита любого изменения пользователя (смена роли
+в админке и в edit_profile, блокировка, правка профиля), изменение ролей
+сбрасывает все. Другие процессы увидят изменение не позже PRINCIPAL_CACHE_TTL.
+
+Остальные поля (first_name и т. п.) читаются из полной модели: principal.load()
+или просто обращение к атрибуту; запись — только через load().
+"""
+from flask import current_app
+from sqlalchemy import event, select
+from models import db, Role, User
+from ttl_cache import TTLCache
+
+
+class Principal:
+	"""Снимок вошедшего пользователя для current_user"""
+	__slots__ = ('id', 'username', 'email', 'role_id', 'role_name', 'active')
+
+	is_authenticated = True
+	is_anonymous = False
+
+	def __init__(self, id, username, email, role_id, role_name, active):
+		for name, value in zip(self.__slots__, (id, username, email, role_id, role_name, active)):
+			object.__setattr__(self, name, value)
+
+	def __setattr__(self, name, value):
+		raise AttributeError(f'Principal неизменяем; для записи используйте load().{name}')
+
+	def __getattr__(self, name):
+		# Сюда попадают только атрибуты не из снимка
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return getattr(self.load(), name)
+
+	@property
+	def is_active(self):
+		return bool(self.active)
+
+	def get_id(self):
+		return str(self.id)
+
+	def is_admin(self):
+		return (self.role_name or '').lower() == 'admin'
+
+	def load(self):
+		"""Полная модель User из текущей сессии БД"""
+		return db.session.get(User, self.id)
+
+	def __eq__(self, other):
+		return isinstance(other, (Principal, User)) and other.get_id() == self.get_id()
+
+	def __hash__(self):
+		return hash(self.id)
+
+	def __repr__(self):
+		return f'<Principal {self.username}>'
+
+
+def get_principal_cache():
+	return current_app.extensions['principal_cache']
+
+
+def load_principal(user_id):
+	"""user_loader: снимок из кэша или один запрос users JOIN roles"""
+	try:
+		user_id = int(user_id)
+	except (TypeError, ValueError):
+		return None
+	principal_cache = get_principal_cache()
+	token = principal_cache.token()
+	principal = principal_cache.get(user_id)
+	if principal is None:
+		row = db.session.execute(
+			select(User.id, User.username, User.email, User.role_id, Role.name, User.is_active)
+			.outerjoin(Role, Role.id == User.role_id)
+			.where(User.id == user_id)
+		).first()
+		if row is None:
+			return None
+		principal = Principal(*row)
+		principal_cache.set(user_id, principal, token)
+	return principal
+
+
+def invalidate_principals(user_ids):
+	principal_cache = get_principal_cache()
+	for user_id in user_ids:
+		principal_cache.delete(user_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_principal_changes(session, flush_context):
+	for obj in list(session.dirty) + list(session.deleted):
+		if isinstance(obj, User) and obj.id is not None:
+			session.info.setdefault('principal_users', set()).add(obj.id)
+		elif isinstance(obj, Role):
+			session.info['principal_roles'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_principals(session):
+	users = session.info.pop('principal_users', None)
+	roles = session.info.pop('principal_roles', False)
+	if 'principal_cache' not in current_app.extensions:
+		return
+	if roles:
+		get_principal_cache().clear()
+	elif users:
+		invalidate_principals(users)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_principal_changes(session):
+	session.info.pop('principal_users', None)
+	session.info.pop('principal_roles', None)
+
+
+def init_principals(app):
+	"""Кэш снимков в app.extensions: PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL (0 — без кэша)"""
+	app.extensions['principal_cache'] = TTLCache(maxsize=int(app.config.get('PRINCIPAL_CACHE_SIZE', 10000)),
+												 ttl=float(app.config.get('PRINCIPAL_CACHE_TTL', 30)))
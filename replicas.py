@@ -0,0 +1,131 @@
+# replicas.py
+"""Чтение каталога и отчётов с реплик БД.
+
+Реплики задаются в DB_REPLICA_URLS (через запятую) и подключаются как binds
+'replica0', 'replica1', ... Маршруты только для чтения помечаются декоратором
+read_replica: их SELECT уходят на реплику, выбранную один раз на запрос.
+
+На основной БД остаются:
+- запись (flush, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE);
+- всё, что сессия выполняет после первой записи в запросе;
+- запросы пользователя в течение DB_REPLICA_PIN_SECONDS после его записи
+  (оформление заказа, правка товара), чтобы он сразу видел свои изменения,
+  даже если реплика отстаёт;
+- чтение внутри primary_reads(): им заполняются общие кэши, которые иначе
+  сохранили бы данные отстающей реплики под новой версией каталога.
+
+replica_used() говорит, читал ли запрос с реплики: такой ответ нельзя класть
+в общий кэш.
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, session as web_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica'
+_PIN_KEY = '_primary_until'
+
+
+def replica_binds(urls):
+	"""SQLALCHEMY_BINDS для списка адресов реплик (строка через запятую или список)"""
+	if isinstance(urls, str):
+		urls = urls.split(',')
+	urls = [url.strip() for url in urls or () if url and url.strip()]
+	return {f'{REPLICA_PREFIX}{i}': url for i, url in enumerate(urls)}
+
+
+def read_replica(view):
+	"""Помечает маршрут как только читающий: запросы можно отправить на реплику"""
+	@wraps(view)
+	def wrapper(*args, **kwargs):
+		g._read_replica = True
+		return view(*args, **kwargs)
+	return wrapper
+
+
+def pin_primary():
+	"""До конца запроса и на DB_REPLICA_PIN_SECONDS для пользователя читать с основной БД"""
+	if not has_request_context():
+		return
+	g._pinned_primary = True
+	seconds = current_app.config.get('DB_REPLICA_PIN_SECONDS', 5)
+	if seconds:
+		web_session[_PIN_KEY] = time.time() + seconds
+
+
+@contextmanager
+def primary_reads():
+	"""Чтение внутри блока идёт с основной БД даже в маршрутах read_replica"""
+	if not has_request_context():
+		yield
+		return
+	g._primary_reads = g.get('_primary_reads', 0) + 1
+	try:
+		yield
+	finally:
+		g._primary_reads -= 1
+
+
+def replica_used():
+	"""Выполнялся ли в текущем запросе хоть один запрос на реплике"""
+	return has_request_context() and bool(g.get('_replica_used'))
+
+
+def _use_replica(session, clause):
+	if not has_request_context() or not g.get('_read_replica') or g.get('_pinned_primary'):
+		return False
+	if g.get('_primary_reads'):
+		return False
+	if session._flushing or session.info.get('wrote'):
+		return False
+	if isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None:
+		return False
+	if web_session.get(_PIN_KEY, 0) > time.time():
+		g._pinned_primary = True
+		return False
+	return True
+
+
+def _replica_engine(engines):
+	if '_replica_engine' not in g:
+		names = [name for name in engines if name and name.startswith(REPLICA_PREFIX)]
+		g._replica_engine = engines[random.choice(names)] if names else None
+	return g._replica_engine
+
+
+class RoutingSession(Session):
+	"""Сессия Flask-SQLAlchemy, отправляющая чтение помеченных маршрутов на реплику"""
+
+	def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+		if bind is None and _use_replica(self, clause):
+			engine = _replica_engine(self._db.engines)
+			if engine is not None:
+				g._replica_used = True
+				return engine
+		return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(session, flush_context):
+	session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_dml(orm_execute_state):
+	if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+		orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_after_write(session):
+	if session.info.pop('wrote', False):
+		pin_primary()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _reset_write(session):
+	session.info.pop('wrote', None)
@@ -1,38 +1,46 @@
 # routes.py
+from decimal import Decimal
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Role, UserRole, Product, Category, Order, OrderItem, Cart
-from sqlalchemy import and_, or_, text
-from werkzeug.utils import secure_filename
-import os
-from datetime import datetime
+from models import db, User, Role, UserRole, Product, Category, Order, Cart, ProductStat
+from catalog import CATALOG_SORTS, get_catalog_page, get_catalog_slice, get_categories
+from pagination import keyset_paginate
+import search as search_index
+from checkout import EmptyCartError, place_order
+import cart as cart_service
+from loaders import load_profile
+from images import image_path, save_upload
+from jobs import enqueue_on_commit
+from replicas import read_replica
+from http_cache import cacheable
+from passwords import HashingBusy, get_hasher, hash_password
+from sqlalchemy import text
 
 auth_bp = Blueprint('auth', __name__)
 
-# Создаем папку для изображений, если она не существует
-UPLOAD_FOLDER = os.path.join('static', 'images')
-if not os.path.exists(UPLOAD_FOLDER):
-	os.makedirs(UPLOAD_FOLDER)
+@auth_bp.app_template_global('cart_summary')
+def cart_summary():
+	"""Сводка корзины текущего пользователя для шапки и личного кабинета (из кэша, без запроса к cart)"""
+	if not current_user.is_authenticated:
+		return None
+	return cart_service.get_cart_summary(current_user.id)
 
-def get_product_image_path(product):
-	"""Возвращает путь к изображению товара или путь к заглушке"""
-	if product.product_image:
-		image_path = os.path.join('static', product.product_image)
-		if os.path.exists(image_path):
-			return product.product_image
-	return 'blank.jpg'
+def get_product_image_path(product, variant=None):
+	"""Возвращает путь к изображению товара (копии размера variant, если она готова) или к заглушке"""
+	return image_path(product.product_image, variant)
 
 @auth_bp.route('/checkout')
 @login_required
 def checkout():
 	try:
-		cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-		total_cart_amount = sum([(item.product.price or 0) * (item.quantity or 0) for item in cart_items])
+		# Сумма и пустая корзина — по строкам из БД: кэш сводки (для шапки) может отставать
+		cart_items = Cart.query.options(*load_profile('cart')).filter_by(user_id=current_user.id).all()
 		if not cart_items:
 			flash('Корзина пуста', 'error')
 			return redirect(url_for('auth.products'))
-		return render_template('user/checkout.html', cart_items=cart_items, total_cart_amount=total_cart_amount)
+		total = sum((Decimal(item.product.price) * (item.quantity or 0) for item in cart_items), Decimal('0'))
+		return render_template('user/checkout.html', cart_items=cart_items,
+							   total_cart_amount=total.quantize(Decimal('0.01')))
 	except Exception as e:
 		flash(f'Ошибка при загрузке оформления заказа: {str(e)}', 'error')
 		return redirect(url_for('auth.products'))
@@ -41,40 +49,16 @@ def checkout():
 @login_required
 def process_checkout():
 	try:
-		cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-		if not cart_items:
-			flash('Корзина пуста', 'error')
-			return redirect(url_for('auth.products'))
-
-		total_amount = sum([(item.product.price or 0) * (item.quantity or 0) for item in cart_items])
-
-		first_item = cart_items[0]
-		seller_id = first_item.product.created_by
-
-		order = Order(
-			user_id=current_user.id,
-			seller_id=seller_id,
-			total_amount=total_amount,
-			status='pending'
-		)
-		db.session.add(order)
-		db.session.flush()
-
-		for item in cart_items:
-			order_item = OrderItem(
-				order_id=order.id,
-				product_id=item.product_id,
-				quantity=item.quantity,
-				price=item.product.price
-			)
-			db.session.add(order_item)
-
-		for item in cart_items:
-			db.session.delete(item)
-
+		# Заказы по продавцам, их позиции и очистка корзины — несколько SQL-операций
+		# независимо от размера корзины
+		place_order(current_user.id)
 		db.session.commit()
 		flash('Заказ успешно оформлен', 'success')
 		return redirect(url_for('auth.dashboard'))
+	except EmptyCartError:
+		db.session.rollback()
+		flash('Корзина пуста', 'error')
+		return redirect(url_for('auth.products'))
 	except Exception as e:
 		db.session.rollback()
 		flash(f'Ошибка при оформлении заказа: {str(e)}', 'error')
@@ -86,21 +70,13 @@ def cart_update(item_id):
 	try:
 		data = request.get_json(silent=True) or {}
 		action = data.get('action')
-		item = Cart.query.get_or_404(item_id)
-		if item.user_id != current_user.id:
-			return jsonify({"success": False}), 403
-
-		if action == 'increase':
-			item.quantity = (item.quantity or 0) + 1
-		elif action == 'decrease':
-			item.quantity = (item.quantity or 0) - 1
-			if item.quantity <= 0:
-				db.session.delete(item)
-				db.session.commit()
-				return jsonify({"success": True})
-		else:
+		deltas = {'increase': 1, 'decrease': -1}
+		if action not in deltas:
 			return jsonify({"success": False}), 400
 
+		# Количество меняется одним UPDATE, строка с нулём удаляется одним DELETE
+		if not cart_service.change_item(current_user.id, item_id, deltas[action]):
+			return jsonify({"success": False}), 404
 		db.session.commit()
 		return jsonify({"success": True})
 	except Exception as e:
@@ -111,27 +87,38 @@ def cart_update(item_id):
 @login_required
 def cart_remove(item_id):
 	try:
-		item = Cart.query.get_or_404(item_id)
-		if item.user_id != current_user.id:
-			return jsonify({"success": False}), 403
-		db.session.delete(item)
+		if not cart_service.remove_line(current_user.id, item_id):
+			return jsonify({"success": False}), 404
 		db.session.commit()
 		return jsonify({"success": True})
 	except Exception as e:
 		db.session.rollback()
 		return jsonify({"success": False, "error": str(e)}), 500
 
+@auth_bp.route('/cart/batch', methods=['POST'])
+@login_required
+def cart_batch():
+	"""Несколько операций с корзиной за один запрос; в ответе новые итоги корзины"""
+	try:
+		data = request.get_json(silent=True) or {}
+		totals = cart_service.apply_operations(current_user.id, data.get('operations'))
+		db.session.commit()
+		return jsonify({"success": True, "cart": totals})
+	except cart_service.CartError as e:
+		db.session.rollback()
+		return jsonify({"success": False, "error": str(e)}), 400
+	except Exception as e:
+		db.session.rollback()
+		return jsonify({"success": False, "error": str(e)}), 500
+
 @auth_bp.route('/add_to_cart/<int:product_id>', methods=['POST'])
 @login_required
 def add_to_cart(product_id):
 	try:
-		product = Product.query.get_or_404(product_id)
-		item = Cart.query.filter_by(user_id=current_user.id, product_id=product_id).first()
-		if item:
-			item.quantity = (item.quantity or 0) + 1
-		else:
-			item = Cart(user_id=current_user.id, product_id=product_id, quantity=1)
-			db.session.add(item)
+		# Upsert: повторное добавление увеличивает количество в той же строке
+		if not cart_service.add_item(current_user.id, product_id):
+			flash('Товар не найден', 'error')
+			return redirect(url_for('auth.products'))
 		db.session.commit()
 		flash('Товар добавлен в корзину', 'success')
 		return redirect(request.referrer or url_for('auth.products'))
@@ -141,6 +128,7 @@ def add_to_cart(product_id):
 		return redirect(url_for('auth.products'))
 
 @auth_bp.route('/')
+@cacheable
 def index():
 	return render_template('index.html')
 
@@ -155,7 +143,22 @@ def login():
 
 		user = User.query.filter_by(email=email).first()
 
-		if user and user.check_password(password):
+		try:
+			verified = bool(user) and user.check_password(password)
+		except HashingBusy:
+			flash('Сервер перегружен, попробуйте войти через несколько секунд', 'error')
+			return render_template('login.html'), 503
+
+		if verified and user.password_needs_rehash():
+			# Старый хэш (другой алгоритм или стоимость) заменяем, пока пароль известен
+			try:
+				user.set_password(password)
+				db.session.commit()
+				get_hasher().record_rehash()
+			except HashingBusy:
+				pass  # перехэшируем при следующем входе
+
+		if verified:
 			login_user(user, remember=True)
 
 			next_page = request.args.get('next')
@@ -178,18 +181,22 @@ def login():
 
 
 @auth_bp.route('/about')
+@cacheable
 def about():
 	return render_template('about.html')
 
 @auth_bp.route('/contacts')
+@cacheable
 def contacts():
 	return render_template('contacts.html')
 
 @auth_bp.route('/privacy')
+@cacheable
 def privacy():
 	return render_template('privacy.html')
 
 @auth_bp.route('/agreement')
+@cacheable
 def agreement():
 	return render_template('agreement.html')
 
@@ -198,8 +205,10 @@ def agreement():
 def dashboard():
 	try:
 		if current_user.role_id == 2:
-			total_orders = Order.query.filter_by(seller_id=current_user.id).count()
-			total_spent = db.session.query(db.func.sum(Order.total_amount)).filter_by(seller_id=current_user.id).scalar() or 0
+			# Заказы разделены по продавцам при оформлении, поэтому считаем только свои
+			total_orders, total_spent = db.session.query(db.func.count(Order.id), db.func.sum(Order.total_amount))\
+				.filter(Order.seller_id == current_user.id).one()
+			total_spent = total_spent or 0
 			
 			return render_template('dashboard.html',
 								total_orders=total_orders,
@@ -242,7 +251,7 @@ def register():
 			# Генерируем username на основе email
 			username = email.split('@')[0]  # Берем часть email до @
 			
-			hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+			hashed_password = hash_password(password)
 			
 			# Сбрасываем последовательность ID
 			db.session.execute(text("SELECT setval('users_id_seq', (SELECT MAX(id) FROM users))"))
@@ -293,7 +302,7 @@ def input_form():
 				last_name=last_name,
 				email=email,
 				phone=int(phone),
-				user_password=generate_password_hash('default_password', method='pbkdf2:sha256')  # Генерируем временный пароль
+				user_password=hash_password('default_password')  # Генерируем временный пароль
 			)
 			
 			# Добавляем пользователя в базу данных
@@ -319,6 +328,7 @@ def input_form():
 	return render_template('input_form.html')
 
 @auth_bp.route('/products')
+@cacheable
 def products():
 	try:
 		# Получаем параметры фильтрации
@@ -326,25 +336,18 @@ def products():
 		min_price = request.args.get('min_price', type=float)
 		max_price = request.args.get('max_price', type=float)
 		page = request.args.get('page', 1, type=int)
-		per_page = 12  # Количество товаров на странице
-
-		# Создаем базовый запрос
-		query = Product.query.filter_by(is_published=True)
-
-		# Применяем фильтры
-		if category_id:
-			query = query.filter_by(category_id=category_id)
-		if min_price is not None:
-			query = query.filter(Product.price >= min_price)
-		if max_price is not None:
-			query = query.filter(Product.price <= max_price)
-
-		# Получаем все категории для фильтра
-		categories = Category.query.all()
-
-		# Применяем пагинацию
-		pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+		sort = request.args.get('sort')
+		cursor = request.args.get('cursor')
+		cursor_mode = sort in CATALOG_SORTS
+
+		# Страница каталога и категории читаются из кэша, при промахе — из БД.
+		# При выбранной сортировке листаем по курсору вместо номера страницы
+		if cursor_mode:
+			pagination = get_catalog_slice(category_id, min_price, max_price, sort, cursor)
+		else:
+			pagination = get_catalog_page(category_id, min_price, max_price, page)
 		products = pagination.items
+		categories = get_categories()
 
 		return render_template('products.html',
 							products=products,
@@ -352,6 +355,8 @@ def products():
 							selected_category=category_id,
 							min_price=min_price,
 							max_price=max_price,
+							sort=sort if cursor_mode else None,
+							cursor_mode=cursor_mode,
 							pagination=pagination,
 							get_product_image_path=get_product_image_path)
 	except Exception as e:
@@ -363,20 +368,22 @@ def products():
 def edit_profile():
 	if request.method == 'POST':
 		try:
-			current_user.first_name = request.form['first_name']
-			current_user.middle_name = request.form['middle_name']
-			current_user.last_name = request.form['last_name']
-			current_user.email = request.form['email']
+			# current_user — снимок только для чтения, изменяем модель
+			user = current_user.load()
+			user.first_name = request.form['first_name']
+			user.middle_name = request.form['middle_name']
+			user.last_name = request.form['last_name']
+			user.email = request.form['email']
 			
-			# Обновляем роль пользователя
+			# Обновляем роль пользователя (снимок сбросится после коммита)
 			new_role_id = int(request.form['role_id'])
-			if new_role_id != current_user.role_id:
-				current_user.role_id = new_role_id
+			if new_role_id != user.role_id:
+				user.role_id = new_role_id
 				flash('Роль успешно изменена', 'success')
 			
 			# Если пользователь ввел новый пароль
 			if request.form['password']:
-				current_user.password_hash = generate_password_hash(request.form['password'], method='pbkdf2:sha256')
+				user.set_password(request.form['password'])
 				flash('Пароль успешно изменен', 'success')
 			
 			db.session.commit()
@@ -399,15 +406,21 @@ def my_products():
 			flash('У вас нет прав для просмотра списка товаров', 'error')
 			return redirect(url_for('auth.products'))
 		
-		# Получаем товары текущего пользователя
-		products = Product.query.filter_by(created_by=current_user.id).all()
+		# Получаем товары текущего пользователя, новые первыми, постранично по курсору
+		pagination = keyset_paginate(
+			Product.query.filter_by(created_by=current_user.id),
+			(Product.created_at, Product.id),
+			cursor=request.args.get('cursor'),
+			per_page=24
+		)
 		
 		# Получаем все категории для отображения
-		categories = Category.query.all()
+		categories = get_categories()
 		
 		return render_template('my_products.html',
-							products=products,
+							products=pagination.items,
 							categories=categories,
+							pagination=pagination,
 							get_product_image_path=get_product_image_path)
 	except Exception as e:
 		flash(f'Ошибка при загрузке товаров: {str(e)}', 'error')
@@ -437,12 +450,8 @@ def add_product():
 			if 'product_image' in request.files:
 				file = request.files['product_image']
 				if file and file.filename:
-					# Генерируем уникальное имя файла
-					filename = secure_filename(file.filename)
-					unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-					# Сохраняем файл
-					file.save(os.path.join(UPLOAD_FOLDER, unique_filename))
-					product_image = os.path.join('images', unique_filename)
+					# Имя файла — хэш содержимого, уменьшенные копии строятся в фоне
+					product_image = save_upload(file)
 			
 			# Создаем новый товар
 			product = Product(
@@ -497,18 +506,12 @@ def edit_product(product_id):
 			if 'product_image' in request.files:
 				file = request.files['product_image']
 				if file and file.filename:
-					# Удаляем старое изображение, если оно существует
-					if product.product_image:
-						old_image_path = os.path.join('static', product.product_image)
-						if os.path.exists(old_image_path):
-							os.remove(old_image_path)
-					
-					# Генерируем уникальное имя файла
-					filename = secure_filename(file.filename)
-					unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-					# Сохраняем файл
-					file.save(os.path.join(UPLOAD_FOLDER, unique_filename))
-					product.product_image = os.path.join('images', unique_filename)
+					new_image = save_upload(file)
+					# Старое изображение с копиями удаляется после коммита, если оно больше не нужно
+					if product.product_image and product.product_image != new_image:
+						enqueue_on_commit('images.remove_unused', product_image=product.product_image,
+										  product_id=product.id)
+					product.product_image = new_image
 			
 			db.session.commit()
 			flash('Товар успешно обновлен', 'success')
@@ -542,11 +545,9 @@ def delete_product(product_id):
 		return redirect(url_for('auth.my_products'))
 	
 	try:
-		# Удаляем изображение товара, если оно существует
+		# Изображение товара удаляется в фоне после коммита, если оно существует
 		if product.product_image:
-			image_path = os.path.join('static', product.product_image)
-			if os.path.exists(image_path):
-				os.remove(image_path)
+			enqueue_on_commit('images.remove_unused', product_image=product.product_image, product_id=product.id)
 		
 		# Удаляем товар из базы данных
 		db.session.delete(product)
@@ -561,23 +562,25 @@ def delete_product(product_id):
 
 @auth_bp.route('/product_stats')
 @login_required
+@read_replica
 def product_stats():
 	"""Страница с многотабличным запросом - статистика товаров"""
 	try:
-		# Получаем статистику товаров с информацией о категориях и продавцах
+		# Получаем статистику товаров с информацией о категориях и продавцах.
+		# Агрегаты заранее посчитаны в product_stats, история заказов не читается
 		stats = db.session.query(
 			Product,
 			Category.category_name,
 			User.username,
-			db.func.count(OrderItem.id).label('order_count')
+			db.func.coalesce(ProductStat.order_count, 0).label('order_count'),
+			db.func.coalesce(ProductStat.units_sold, 0).label('units_sold'),
+			db.func.coalesce(ProductStat.revenue, 0).label('revenue')
 		).join(
 			Category, Product.category_id == Category.id
 		).join(
 			User, Product.created_by == User.id
 		).outerjoin(
-			OrderItem, Product.id == OrderItem.product_id
-		).group_by(
-			Product.id, Category.id, User.id
+			ProductStat, Product.id == ProductStat.product_id
 		).all()
 		
 		return render_template('product_stats.html', 
@@ -589,28 +592,19 @@ def product_stats():
 
 @auth_bp.route('/search_products', methods=['GET', 'POST'])
 @login_required
+@read_replica
 def search_products():
 	"""Страница поиска товаров"""
-	if request.method == 'POST':
+	search_term = request.values.get('search_term', '').strip()
+	if search_term:
 		try:
-			search_term = request.form.get('search_term', '')
-			# Поиск по названию товара, категории и имени продавца
-			products = db.session.query(
-				Product, Category, User
-			).join(
-				Category, Product.category_id == Category.id
-			).join(
-				User, Product.created_by == User.id
-			).filter(
-				or_(
-					Product.productname.ilike(f'%{search_term}%'),
-					Category.category_name.ilike(f'%{search_term}%'),
-					User.username.ilike(f'%{search_term}%')
-				)
-			).all()
+			# Поиск по названию товара, категории и имени продавца через поисковый индекс
+			page = request.args.get('page', 1, type=int)
+			results = search_index.search_products(search_term, page=page)
 			
 			return render_template('search_products.html', 
-								products=products, 
+								products=results.items, 
+								results=results,
 								search_term=search_term,
 								get_product_image_path=get_product_image_path)
 		except Exception as e:
@@ -620,6 +614,7 @@ def search_products():
 
 @auth_bp.route('/top_products')
 @login_required
+@read_replica
 def top_products():
 	try:
 		# Самые дорогие товары
@@ -628,17 +623,17 @@ def top_products():
 		# Самые дешевые товары
 		cheapest = Product.query.order_by(Product.price.asc()).limit(10).all()
 		
-		# Самые популярные товары (по количеству заказов)
+		# Самые популярные товары (по количеству заказов из product_stats)
 		most_popular = db.session.query(
 			Product,
-			db.func.count(OrderItem.id).label('order_count')
+			ProductStat.order_count
 		).join(
-			OrderItem,
-			Product.id == OrderItem.product_id
-		).group_by(
-			Product.id
+			ProductStat,
+			Product.id == ProductStat.product_id
+		).filter(
+			ProductStat.order_count > 0
 		).order_by(
-			db.desc('order_count')
+			ProductStat.order_count.desc()
 		).limit(10).all()
 		
 		# Самые старые товары
@@ -0,0 +1,307 @@
+# search.py
+"""Полнотекстовый поиск товаров по названию, категории и продавцу.
+
+Два бэкенда:
+* PostgresSearchBackend — таблица product_search с tsvector и триграммами
+  (см. database/search_index.sql), поиск по GIN-индексам;
+* MemorySearchBackend — инвертированный индекс в памяти процесса, для тестов
+  и SQLite.
+
+Индекс обновляется при создании, изменении и удалении товаров, а также при
+переименовании категории или продавца.
+"""
+import re
+import threading
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import event, inspect, or_, text
+from models import db, Product, Category, User
+
+SEARCH_PER_PAGE = 12
+
+# Вес поля в ранжировании: название важнее категории, категория важнее продавца
+FIELD_WEIGHTS = {'productname': 3, 'category_name': 2, 'username': 1}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value):
+	return [t.lower() for t in _TOKEN_RE.findall(value or '')]
+
+
+class SearchPage:
+	"""Страница результатов: items — кортежи (Product, Category, User) в порядке релевантности"""
+
+	def __init__(self, items, page, per_page, has_next):
+		self.items = items
+		self.page = page
+		self.per_page = per_page
+		self.has_next = has_next
+
+	@property
+	def has_prev(self):
+		return self.page > 1
+
+	@property
+	def prev_num(self):
+		return self.page - 1 if self.has_prev else None
+
+	@property
+	def next_num(self):
+		return self.page + 1 if self.has_next else None
+
+
+class MemorySearchBackend:
+	"""Инвертированный индекс: терм -> {product_id: вес}. Термы ищутся по префиксу"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._postings = {}
+		self._doc_terms = {}
+		self._sorted_terms = None
+		self._loaded = False
+		self._stale_products = set()
+		self._stale_categories = set()
+		self._stale_users = set()
+
+	def _add(self, product_id, fields):
+		weights = {}
+		for field, value in fields.items():
+			for term in tokenize(value):
+				weights[term] = max(weights.get(term, 0), FIELD_WEIGHTS[field])
+		for term, weight in weights.items():
+			self._postings.setdefault(term, {})[product_id] = weight
+		self._doc_terms[product_id] = set(weights)
+		self._sorted_terms = None
+
+	def _remove(self, product_id):
+		for term in self._doc_terms.pop(product_id, ()):
+			postings = self._postings.get(term)
+			if postings is not None:
+				postings.pop(product_id, None)
+				if not postings:
+					del self._postings[term]
+		self._sorted_terms = None
+
+	def _documents(self, condition=None):
+		query = db.session.query(Product.id, Product.productname, Category.category_name, User.username)\
+			.join(Category, Product.category_id == Category.id)\
+			.join(User, Product.created_by == User.id)
+		if condition is not None:
+			query = query.filter(condition)
+		for product_id, productname, category_name, username in query:
+			yield product_id, {'productname': productname, 'category_name': category_name, 'username': username}
+
+	def rebuild(self):
+		with self._lock:
+			self._postings.clear()
+			self._doc_terms.clear()
+			self._stale_products.clear()
+			self._stale_categories.clear()
+			self._stale_users.clear()
+			for product_id, fields in self._documents():
+				self._add(product_id, fields)
+			self._loaded = True
+
+	def mark_stale(self, product_ids=(), category_ids=(), user_ids=()):
+		with self._lock:
+			self._stale_products.update(product_ids)
+			self._stale_categories.update(category_ids)
+			self._stale_users.update(user_ids)
+
+	def apply_changes(self, connection, product_ids, category_ids, user_ids):
+		# Индекс в памяти обновится только после коммита (см. _apply_after_commit)
+		pass
+
+	def _refresh_stale(self):
+		if not (self._stale_products or self._stale_categories or self._stale_users):
+			return
+		products, categories, users = self._stale_products, self._stale_categories, self._stale_users
+		self._stale_products, self._stale_categories, self._stale_users = set(), set(), set()
+		condition = or_(Product.id.in_(products), Product.category_id.in_(categories),
+						Product.created_by.in_(users))
+		seen = set()
+		for product_id, fields in self._documents(condition):
+			self._remove(product_id)
+			self._add(product_id, fields)
+			seen.add(product_id)
+		for product_id in products - seen:
+			self._remove(product_id)
+
+	def _matching(self, token):
+		"""Товары, у которых есть терм, начинающийся с token; точное совпадение весит вдвое больше"""
+		if self._sorted_terms is None:
+			self._sorted_terms = sorted(self._postings)
+		terms = self._sorted_terms
+		scores = {}
+		i = bisect_left(terms, token)
+		while i < len(terms) and terms[i].startswith(token):
+			bonus = 2 if terms[i] == token else 1
+			for product_id, weight in self._postings[terms[i]].items():
+				scores[product_id] = max(scores.get(product_id, 0), weight * bonus)
+			i += 1
+		return scores
+
+	def search_ids(self, term, offset, limit):
+		tokens = tokenize(term)
+		if not tokens:
+			return []
+		if not self._loaded:
+			self.rebuild()
+		with self._lock:
+			self._refresh_stale()
+			ranked = None
+			for token in tokens:
+				scores = self._matching(token)
+				if ranked is None:
+					ranked = scores
+				else:
+					ranked = {pid: ranked[pid] + s for pid, s in scores.items() if pid in ranked}
+				if not ranked:
+					return []
+		ordered = sorted(ranked.items(), key=lambda item: (-item[1], item[0]))
+		return [product_id for product_id, _ in ordered[offset:offset + limit]]
+
+
+# Документ товара: название (вес A), категория (B) и имя продавца (C)
+_DOCUMENT_SELECT = """
+	SELECT p.id,
+	       concat_ws(' ', p.productname, c.category_name, u.username),
+	       setweight(to_tsvector('simple', coalesce(p.productname, '')), 'A') ||
+	       setweight(to_tsvector('simple', coalesce(c.category_name, '')), 'B') ||
+	       setweight(to_tsvector('simple', coalesce(u.username, '')), 'C')
+	FROM products p
+	JOIN categories c ON c.id = p.category_id
+	JOIN users u ON u.id = p.created_by
+"""
+
+_UPSERT_SQL = text(
+	'INSERT INTO product_search (product_id, content, document)' + _DOCUMENT_SELECT + """
+	WHERE p.id = ANY(:product_ids) OR p.category_id = ANY(:category_ids) OR p.created_by = ANY(:user_ids)
+	ON CONFLICT (product_id) DO UPDATE
+	SET content = EXCLUDED.content, document = EXCLUDED.document
+""")
+
+_REBUILD_SQL = text('INSERT INTO product_search (product_id, content, document)' + _DOCUMENT_SELECT)
+
+_SEARCH_SQL = text("""
+	SELECT ps.product_id
+	FROM product_search ps
+	WHERE ps.document @@ to_tsquery('simple', :tsquery) OR ps.content ILIKE :pattern
+	ORDER BY ts_rank_cd(ps.document, to_tsquery('simple', :tsquery)) + similarity(ps.content, :term) DESC,
+	         ps.product_id
+	LIMIT :limit OFFSET :offset
+""")
+
+
+class PostgresSearchBackend:
+	"""Поиск по product_search: префиксный tsquery по GIN(tsvector) плюс ILIKE по GIN(gin_trgm_ops)"""
+
+	def rebuild(self):
+		db.session.execute(text('TRUNCATE product_search'))
+		db.session.execute(_REBUILD_SQL)
+		db.session.commit()
+
+	def mark_stale(self, product_ids=(), category_ids=(), user_ids=()):
+		pass
+
+	def apply_changes(self, connection, product_ids, category_ids, user_ids):
+		# Обновляем индекс в той же транзакции, что и сами товары; удалённые
+		# строки убирает ON DELETE CASCADE
+		connection.execute(_UPSERT_SQL, {
+			'product_ids': list(product_ids),
+			'category_ids': list(category_ids),
+			'user_ids': list(user_ids),
+		})
+
+	def search_ids(self, term, offset, limit):
+		tokens = tokenize(term)
+		if not tokens:
+			return []
+		escaped = term.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+		rows = db.session.execute(_SEARCH_SQL, {
+			'tsquery': ' & '.join(f'{t}:*' for t in tokens),
+			'pattern': f'%{escaped}%',
+			'term': term,
+			'limit': limit,
+			'offset': offset,
+		})
+		return [row[0] for row in rows]
+
+
+def get_backend():
+	return current_app.extensions['search_backend']
+
+
+def search_products(term, page=1, per_page=SEARCH_PER_PAGE):
+	"""Ранжированный и постраничный поиск; возвращает SearchPage"""
+	page = max(page or 1, 1)
+	ids = get_backend().search_ids(term, (page - 1) * per_page, per_page + 1)
+	has_next = len(ids) > per_page
+	ids = ids[:per_page]
+	if not ids:
+		return SearchPage([], page, per_page, False)
+	rows = db.session.query(Product, Category, User)\
+		.join(Category, Product.category_id == Category.id)\
+		.join(User, Product.created_by == User.id)\
+		.filter(Product.id.in_(ids)).all()
+	position = {product_id: i for i, product_id in enumerate(ids)}
+	rows.sort(key=lambda row: position[row[0].id])
+	return SearchPage(rows, page, per_page, has_next)
+
+
+def _changed(obj, *names):
+	insp = inspect(obj)
+	return any(insp.attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+	products, categories, users = set(), set(), set()
+	for obj in session.new:
+		if isinstance(obj, Product):
+			products.add(obj.id)
+	for obj in session.dirty:
+		if isinstance(obj, Product) and _changed(obj, 'productname', 'category_id', 'created_by'):
+			products.add(obj.id)
+		elif isinstance(obj, Category) and _changed(obj, 'category_name'):
+			categories.add(obj.id)
+		elif isinstance(obj, User) and _changed(obj, 'username'):
+			users.add(obj.id)
+	for obj in session.deleted:
+		if isinstance(obj, Product):
+			products.add(obj.id)
+	if not (products or categories or users) or 'search_backend' not in current_app.extensions:
+		return
+	get_backend().apply_changes(session.connection(), products, categories, users)
+	pending = session.info.setdefault('search_changes', (set(), set(), set()))
+	pending[0].update(products)
+	pending[1].update(categories)
+	pending[2].update(users)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_after_commit(session):
+	pending = session.info.pop('search_changes', None)
+	if pending:
+		get_backend().mark_stale(*pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_search_changes(session):
+	session.info.pop('search_changes', None)
+
+
+def init_search(app):
+	"""Бэкенд в app.extensions (SEARCH_BACKEND: postgres/memory) и команда flask search-reindex"""
+	uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+	default = 'postgres' if uri.startswith('postgres') else 'memory'
+	name = app.config.get('SEARCH_BACKEND') or default
+	backend = PostgresSearchBackend() if name == 'postgres' else MemorySearchBackend()
+	app.extensions['search_backend'] = backend
+
+	@app.cli.command('search-reindex')
+	def search_reindex():
+		"""Полностью перестраивает поисковый индекс товаров"""
+		backend.rebuild()
+		print('Поисковый индекс перестроен')
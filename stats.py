@@ -0,0 +1,67 @@
+# stats.py
+"""Материализованная статистика продаж товаров (таблица product_stats)"""
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, OrderItem, ProductStat
+from jobs import task
+
+
+def _insert(session):
+	dialect = session.get_bind().dialect.name
+	if dialect == 'postgresql':
+		return postgresql.insert(ProductStat)
+	if dialect == 'sqlite':
+		return sqlite.insert(ProductStat)
+	raise RuntimeError(f'Инкрементальное обновление статистики не поддерживается для {dialect}')
+
+
+def _aggregate(*criteria):
+	"""Агрегаты по строкам заказов: order_count, units_sold, revenue на товар"""
+	return select(
+		OrderItem.product_id,
+		func.count(OrderItem.id),
+		func.coalesce(func.sum(OrderItem.quantity), 0),
+		func.coalesce(func.sum(OrderItem.quantity * OrderItem.price), 0),
+		func.current_timestamp(),
+	).where(*criteria).group_by(OrderItem.product_id)
+
+
+_COLUMNS = ['product_id', 'order_count', 'units_sold', 'revenue', 'updated_at']
+
+
+def record_orders(order_ids):
+	"""Прибавляет к статистике строки указанных заказов. Вызывать до коммита заказа,
+	чтобы статистика и заказ попали в одну транзакцию"""
+	order_ids = list(order_ids)
+	if not order_ids:
+		return
+	db.session.flush()
+	stmt = _insert(db.session).from_select(_COLUMNS, _aggregate(OrderItem.order_id.in_(order_ids)))
+	stmt = stmt.on_conflict_do_update(
+		index_elements=[ProductStat.product_id],
+		set_={
+			'order_count': ProductStat.order_count + stmt.excluded.order_count,
+			'units_sold': ProductStat.units_sold + stmt.excluded.units_sold,
+			'revenue': ProductStat.revenue + stmt.excluded.revenue,
+			'updated_at': stmt.excluded.updated_at,
+		}
+	)
+	db.session.execute(stmt)
+
+
+@task('stats.refresh')
+def refresh_product_stats():
+	"""Полный пересчёт статистики по всей истории заказов (также задача stats.refresh)"""
+	db.session.execute(ProductStat.__table__.delete())
+	db.session.execute(ProductStat.__table__.insert().from_select(_COLUMNS, _aggregate(OrderItem.product_id.isnot(None))))
+	db.session.commit()
+
+
+def init_stats(app):
+	@app.cli.command('stats-refresh')
+	def stats_refresh():
+		"""Пересчитывает таблицу product_stats"""
+		started = datetime.utcnow()
+		refresh_product_stats()
+		print(f'Статистика товаров пересчитана за {(datetime.utcnow() - started).total_seconds():.2f} с')
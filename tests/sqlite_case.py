@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+from contextlib import contextmanager
+from flask import Flask
+from flask_login import LoginManager
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import db, Role, User, Category, Supplier, Product, Cart, Order, OrderItem, ProductStat
+from catalog import init_catalog
+from cart import init_cart
+from principals import init_principals, load_principal
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """Приложение на SQLite в памяти с продавцом, поставщиком и двумя категориями"""
+    models = (Role, User, Category, Supplier, Product, Cart, Order, OrderItem, ProductStat)
+    # Подключать ли маршруты routes.auth_bp (нужен test_client и вход пользователя)
+    with_routes = False
+    # Дополнительная конфигурация до db.init_app (например, SQLALCHEMY_BINDS)
+    config = {}
+
+    def setUp(self):
+        self.app = Flask(__name__, root_path=ROOT)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SECRET_KEY'] = 'test'
+        self.app.config.update(self.config)
+        db.init_app(self.app)
+        init_catalog(self.app)
+        init_cart(self.app)
+        init_principals(self.app)
+        if self.with_routes:
+            from routes import auth_bp
+            login_manager = LoginManager(self.app)
+            login_manager.user_loader(load_principal)
+            self.app.register_blueprint(auth_bp)
+            self.client = self.app.test_client()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(db.engine, tables=[m.__table__ for m in self.models])
+
+        self.seller_role = Role(name='Seller')
+        db.session.add(self.seller_role)
+        db.session.flush()
+        self.seller = User(username='seller', email='seller@example.com', password_hash='x',
+                           role_id=self.seller_role.id)
+        self.shoes = Category(category_name='Обувь')
+        self.hats = Category(category_name='Шапки')
+        db.session.add_all([self.seller, self.shoes, self.hats])
+        db.session.flush()
+        self.supplier = Supplier(supplier_name='Поставщик', user_id=self.seller.id)
+        db.session.add(self.supplier)
+        db.session.flush()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all(bind_key=None)
+        self.ctx.pop()
+
+    def make_product(self, name, price, category_id, is_published=True, **kwargs):
+        product = Product(productname=name, price=price, category_id=category_id,
+                          supplier_id=self.supplier.id, created_by=self.seller.id,
+                          is_published=is_published, **kwargs)
+        db.session.add(product)
+        return product
+
+    def login(self, user):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """Падает, если внутри блока выполнено больше limit SQL-запросов"""
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        if len(statements) > limit:
+            listing = '\n'.join(f'{i}. {sql}' for i, sql in enumerate(statements, 1))
+            self.fail(f'Выполнено {len(statements)} запросов при бюджете {limit}:\n{listing}')
@@ -0,0 +1,109 @@
+"""Время холодного старта: импорт main в новом процессе и вызов create_app().
+
+Каждый замер — отдельный интерпретатор, как при старте воркера. По умолчанию
+используется SQLite в памяти: create_app не должен обращаться к БД, поэтому
+результат не зависит от доступности PostgreSQL.
+
+Примеры:
+    python tests/startup_benchmark.py --runs 20
+    python tests/startup_benchmark.py --output startup.json --baseline startup_base.json
+    python tests/startup_benchmark.py --importtime
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from benchmark import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.create_app()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Время старта приложения')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='куда сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение медианы (доля)')
+    parser.add_argument('--importtime', action='store_true', help='показать самые долгие импорты (python -X importtime)')
+    return parser.parse_args(argv)
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    env.setdefault('INSTRUMENTATION_ENABLED', '0')
+    return env
+
+
+def measure(runs):
+    imports, factories = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _PROBE], cwd=ROOT, env=_env(),
+                             capture_output=True, text=True, check=True).stdout.split()
+        imports.append(float(out[-2]) * 1000)
+        factories.append(float(out[-1]) * 1000)
+    return {'import_main': summarize(imports), 'create_app': summarize(factories)}
+
+
+def summarize(values):
+    values = sorted(values)
+    return {'runs': len(values), 'median_ms': round(median(values), 1),
+            'p95_ms': round(percentile(values, 95), 1), 'min_ms': round(values[0], 1)}
+
+
+def slowest_imports(limit=15):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, env=_env(),
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = measure(args.runs)
+    for name, r in results.items():
+        print(f"{name:12} median {r['median_ms']:7.1f} мс  p95 {r['p95_ms']:7.1f} мс  min {r['min_ms']:7.1f} мс")
+    if args.importtime:
+        print('Самые долгие импорты (с вложенными):')
+        for cumulative_us, name in slowest_imports():
+            print(f'{cumulative_us / 1000:8.1f} мс  {name}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        worse = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous and previous['median_ms']:
+                change = current['median_ms'] / previous['median_ms'] - 1
+                print(f'{name:12} median {change:+.0%}')
+                if change > args.tolerance:
+                    worse.append(name)
+        if worse:
+            print('Ухудшение относительно базового прогона: ' + ', '.join(worse))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
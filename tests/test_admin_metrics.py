@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlite_case import SQLiteTestCase
+from models import db, Role, User, Order
+from admin_metrics import compute_dashboard_metrics, get_dashboard_metrics, init_admin_metrics
+
+
+class DashboardMetricsTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        client_role = Role(name=' User ')
+        db.session.add(client_role)
+        db.session.flush()
+        old = datetime.utcnow() - timedelta(days=60)
+        db.session.add_all([
+            User(username='new_client', email='c1@example.com', password_hash='x', role_id=client_role.id),
+            User(username='old_client', email='c2@example.com', password_hash='x', role_id=client_role.id, created_at=old),
+        ])
+        self.make_product('Кеды', 100, self.shoes.id)
+        self.make_product('Панама', 50, self.hats.id, created_at=old)
+        db.session.flush()
+        db.session.add(Order(user_id=self.seller.id, seller_id=self.seller.id, total_amount=100))
+        db.session.commit()
+        init_admin_metrics(self.app)
+
+    def test_counters(self):
+        metrics = compute_dashboard_metrics()
+        self.assertEqual((metrics.users_count, metrics.products_count, metrics.orders_count), (3, 2, 1))
+        self.assertEqual((metrics.new_orders, metrics.new_products), (1, 1))
+        self.assertEqual((metrics.new_clients, metrics.new_sellers), (1, 1))
+        self.assertEqual(metrics.products[0].category_name, 'Обувь')
+        self.assertEqual({u.role_name for u in metrics.users}, {' User ', 'Seller'})
+
+    def test_counters_take_one_round_trip_and_are_cached(self):
+        # Роли, один агрегат на все счётчики и два списка последних записей
+        with self.assertMaxQueries(5):
+            get_dashboard_metrics()
+        with self.assertMaxQueries(0):
+            get_dashboard_metrics()
+
+    def test_renamed_role_is_not_matched(self):
+        self.assertEqual(compute_dashboard_metrics().new_sellers, 1)
+        # Закэшированный id роли сбрасывается коммитом, а отсутствующая роль не превращается в IS NULL
+        self.seller_role.name = 'Продавец'
+        db.session.commit()
+        self.assertEqual(compute_dashboard_metrics().new_sellers, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
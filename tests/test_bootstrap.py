@@ -0,0 +1,83 @@
+import os
+import unittest
+from unittest import mock
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlite_case import SQLiteTestCase
+from models import db, Role, User
+from bootstrap import init_bootstrap
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+import main
+
+
+class BootstrapTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        init_bootstrap(self.app)
+        self.runner = self.app.test_cli_runner()
+        self.env = {'ADMIN_USERNAME': 'root', 'ADMIN_EMAIL': 'root@example.com', 'ADMIN_PASSWORD': 'first'}
+
+    def bootstrap(self, **env):
+        with mock.patch.dict(os.environ, dict(self.env, **env)):
+            result = self.runner.invoke(args=['bootstrap'])
+        self.assertIsNone(result.exception, result.output)
+        db.session.expire_all()
+        return result
+
+    def test_creates_roles_and_admin(self):
+        self.bootstrap()
+        self.assertEqual({r.name for r in Role.query}, {'Admin', 'Seller', 'User'})
+        admin = User.query.filter_by(email='root@example.com').one()
+        self.assertTrue(admin.is_admin())
+        self.assertTrue(admin.check_password('first'))
+
+    def test_rehash_only_when_password_changes(self):
+        self.bootstrap()
+        with mock.patch.object(User, 'set_password') as set_password:
+            self.bootstrap()
+        set_password.assert_not_called()
+
+        self.bootstrap(ADMIN_PASSWORD='second')
+        self.assertTrue(User.query.filter_by(email='root@example.com').one().check_password('second'))
+
+
+class AppFactoryTests(unittest.TestCase):
+    def test_create_app_does_not_touch_database(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', count)
+        try:
+            app = main.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'INSTRUMENTATION_ENABLED': False,
+                                   'JOBS_BACKEND': 'eager'})
+        finally:
+            event.remove(Engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+        self.assertIn('auth', app.blueprints)
+
+    def test_apps_do_not_share_caches(self):
+        config = {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'INSTRUMENTATION_ENABLED': False, 'JOBS_BACKEND': 'eager'}
+        first = main.create_app(dict(config, CATALOG_CACHE_TTL=5))
+        second = main.create_app(config)
+        for name in ('catalog_cache', 'catalog_version', 'search_backend', 'cart_cache', 'principal_cache',
+                     'admin_metrics'):
+            self.assertIsNot(first.extensions[name], second.extensions[name], name)
+        self.assertEqual(first.extensions['catalog_cache'].ttl, 5)
+        self.assertEqual(second.extensions['catalog_cache'].ttl, 60)
+
+    def test_proxy_fix(self):
+        config = {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'INSTRUMENTATION_ENABLED': False, 'JOBS_BACKEND': 'eager',
+                  'THROTTLE_ENABLED': False}
+        for hops, expected in ((0, '127.0.0.1'), (1, '203.0.113.7')):
+            app = main.create_app(dict(config, PROXY_FIX_X_FOR=hops))
+            app.add_url_rule('/ip', 'ip', lambda: request.remote_addr)
+            resp = app.test_client().get('/ip', headers={'X-Forwarded-For': '198.51.100.1, 203.0.113.7'})
+            self.assertEqual(resp.get_data(as_text=True), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
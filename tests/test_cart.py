@@ -0,0 +1,153 @@
+import unittest
+from decimal import Decimal
+from sqlalchemy.exc import IntegrityError
+from sqlite_case import SQLiteTestCase
+from models import db, Cart
+import cart
+
+
+class CartTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        self.sneakers = self.make_product('Кеды', Decimal('100.00'), self.shoes.id)
+        self.panama = self.make_product('Панама', Decimal('50.00'), self.hats.id)
+        db.session.commit()
+        self.login(self.seller)
+
+    def quantities(self):
+        db.session.expire_all()
+        return {c.product_id: c.quantity for c in Cart.query.filter_by(user_id=self.seller.id)}
+
+    def test_repeated_add_keeps_one_row(self):
+        for _ in range(3):
+            self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        self.assertEqual(self.quantities(), {self.sneakers.id: 3})
+
+    def test_add_missing_product(self):
+        resp = self.client.post('/add_to_cart/9999')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(self.quantities(), {})
+
+    def test_duplicate_rows_rejected(self):
+        db.session.add_all([Cart(user_id=self.seller.id, product_id=self.panama.id),
+                            Cart(user_id=self.seller.id, product_id=self.panama.id)])
+        with self.assertRaises(IntegrityError):
+            db.session.flush()
+        db.session.rollback()
+
+    def test_decrease_to_zero_deletes(self):
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        item_id = Cart.query.filter_by(user_id=self.seller.id).one().id
+        resp = self.client.post(f'/cart/update/{item_id}', json={'action': 'increase'})
+        self.assertTrue(resp.get_json()['success'])
+        self.assertEqual(self.quantities(), {self.sneakers.id: 2})
+        self.client.post(f'/cart/update/{item_id}', json={'action': 'decrease'})
+        self.client.post(f'/cart/update/{item_id}', json={'action': 'decrease'})
+        self.assertEqual(self.quantities(), {})
+        resp = self.client.post(f'/cart/update/{item_id}', json={'action': 'decrease'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_decrease_runs_one_statement_per_outcome(self):
+        cart.add_item(self.seller.id, self.sneakers.id, 2)
+        with self.assertMaxQueries(2) as statements:
+            self.assertTrue(cart.add_item(self.seller.id, self.sneakers.id, -1))
+        self.assertEqual([s.split()[0] for s in statements], ['DELETE', 'UPDATE'])
+        with self.assertMaxQueries(1) as statements:
+            self.assertTrue(cart.add_item(self.seller.id, self.sneakers.id, -1))
+        self.assertTrue(statements[0].startswith('DELETE'))
+        self.assertEqual(self.quantities(), {})
+        self.assertFalse(cart.add_item(self.seller.id, self.sneakers.id, -1))
+
+    def test_batch(self):
+        self.client.post(f'/add_to_cart/{self.panama.id}')
+        with self.assertMaxQueries(10):
+            resp = self.client.post('/cart/batch', json={'operations': [
+                {'product_id': self.sneakers.id, 'delta': 2},
+                {'product_id': self.sneakers.id, 'delta': -1},
+                {'product_id': self.panama.id, 'quantity': 4},
+            ]})
+        self.assertEqual(resp.get_json(), {'success': True,
+                                           'cart': {'items': 2, 'quantity': 5, 'total': '300.00'}})
+        resp = self.client.post('/cart/batch', json={'operations': [{'product_id': self.panama.id, 'quantity': 0}]})
+        self.assertEqual(resp.get_json()['cart'], {'items': 1, 'quantity': 1, 'total': '100.00'})
+
+    def test_batch_rejects_bad_operation(self):
+        resp = self.client.post('/cart/batch', json={'operations': [{'product_id': 'x', 'delta': 1}]})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post('/cart/batch', json={'operations': []})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch_size_is_capped(self):
+        self.app.config['CART_BATCH_MAX'] = 2
+        operation = {'product_id': self.sneakers.id, 'delta': 1}
+        resp = self.client.post('/cart/batch', json={'operations': [operation] * 3})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+        resp = self.client.post('/cart/batch', json={'operations': [operation] * 2})
+        self.assertEqual(self.quantities(), {self.sneakers.id: 2})
+
+
+class FakeRedis:
+    """Минимальный клиент с get/set/incr, как у redis.Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+class CartSummaryCacheTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        self.sneakers = self.make_product('Кеды', Decimal('100.00'), self.shoes.id)
+        db.session.commit()
+        self.login(self.seller)
+
+    def test_summary_cached_until_cart_changes(self):
+        self.assertEqual(cart.get_cart_summary(self.seller.id), cart.EMPTY_CART)
+        with self.assertMaxQueries(0):
+            cart.get_cart_summary(self.seller.id)
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        summary = cart.get_cart_summary(self.seller.id)
+        self.assertEqual((summary.items, summary.quantity, summary.total), (1, 2, Decimal('200.00')))
+        self.assertEqual(summary.lines, ((self.sneakers.id, 2, Decimal('100.00')),))
+
+    def test_price_change_invalidates(self):
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        self.assertEqual(cart.get_cart_summary(self.seller.id).total, Decimal('100.00'))
+        self.sneakers.price = Decimal('80.00')
+        db.session.commit()
+        self.assertEqual(cart.get_cart_summary(self.seller.id).total, Decimal('80.00'))
+
+    def test_checkout_empties_summary(self):
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        self.assertEqual(cart.get_cart_summary(self.seller.id).items, 1)
+        self.client.post('/process_checkout')
+        self.assertEqual(cart.get_cart_summary(self.seller.id), cart.EMPTY_CART)
+
+    def test_shared_backend(self):
+        client = FakeRedis()
+        self.app.extensions['cart_cache'] = cart.SharedCartCache(client)
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        first = cart.get_cart_summary(self.seller.id)
+        with self.assertMaxQueries(0):
+            self.assertEqual(cart.get_cart_summary(self.seller.id), first)
+        self.client.post(f'/add_to_cart/{self.sneakers.id}')
+        self.assertEqual(cart.get_cart_summary(self.seller.id).quantity, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db, Category, Product
+from sqlalchemy import update
+from catalog import CatalogVersion, get_catalog_cache, get_catalog_page, get_categories, make_page_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+
+class CatalogInvalidationTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product('Кеды', 100, self.shoes.id)
+        db.session.commit()
+
+    def test_page_is_served_from_cache(self):
+        page = get_catalog_page(None, None, None, 1)
+        self.assertEqual([p.productname for p in page.items], ['Кеды'])
+        self.assertIs(get_catalog_page(None, None, None, 1), page)
+
+    def test_publish_invalidates_only_matching_pages(self):
+        get_catalog_page(None, None, None, 1)
+        get_catalog_page(self.shoes.id, None, None, 1)
+        get_catalog_page(self.hats.id, None, None, 1)
+        get_catalog_page(None, 500, None, 1)
+        hat = self.make_product('Панама', 200, self.hats.id, False)
+        db.session.commit()
+
+        hat = db.session.get(Product, hat.id)
+        hat.is_published = True
+        db.session.commit()
+
+        self.assertIsNone(get_catalog_cache().get(make_page_key(None, None, None, 1)))
+        self.assertIsNone(get_catalog_cache().get(make_page_key(self.hats.id, None, None, 1)))
+        self.assertIsNotNone(get_catalog_cache().get(make_page_key(self.shoes.id, None, None, 1)))
+        self.assertIsNotNone(get_catalog_cache().get(make_page_key(None, 500, None, 1)))
+        self.assertEqual([p.productname for p in get_catalog_page(self.hats.id, None, None, 1).items], ['Панама'])
+
+    def test_category_move_invalidates_old_and_new_pages(self):
+        get_catalog_page(self.shoes.id, None, None, 1)
+        get_catalog_page(self.hats.id, None, None, 1)
+        self.product.category_id = self.hats.id
+        db.session.commit()
+        self.assertIsNone(get_catalog_cache().get(make_page_key(self.shoes.id, None, None, 1)))
+        self.assertIsNone(get_catalog_cache().get(make_page_key(self.hats.id, None, None, 1)))
+
+    def test_rollback_keeps_cache(self):
+        get_catalog_page(None, None, None, 1)
+        self.product.price = 150
+        db.session.flush()
+        db.session.rollback()
+        self.assertIsNotNone(get_catalog_cache().get(make_page_key(None, None, None, 1)))
+
+    def test_shared_version_bump_from_other_process_refreshes_page(self):
+        client = FakeRedis()
+        self.app.extensions['catalog_version'] = CatalogVersion(client)
+        self.assertEqual(get_catalog_page(None, None, None, 1).items[0].price, 100)
+        # Другой процесс меняет товар: наш кэш не сброшен, но общая версия выросла
+        db.session.execute(update(Product).where(Product.id == self.product.id).values(price=150))
+        self.assertEqual(get_catalog_page(None, None, None, 1).items[0].price, 100)
+        client.incr('vibe:catalog:version')
+        self.assertEqual(get_catalog_page(None, None, None, 1).items[0].price, 150)
+
+    def test_category_change_invalidates_category_list(self):
+        self.assertEqual(len(get_categories()), 2)
+        db.session.add(Category(category_name='Куртки'))
+        db.session.commit()
+        self.assertEqual(len(get_categories()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+from sqlite_case import SQLiteTestCase
+from models import db, Cart, Order, OrderItem, Product, ProductStat, Supplier, User
+from sqlalchemy import insert
+from cart import EMPTY_CART
+import checkout
+
+
+class CheckoutTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        self.customer = User(username='customer', email='customer@example.com', password_hash='x',
+                             role_id=self.seller_role.id)
+        db.session.add(self.customer)
+        db.session.flush()
+        self.login(self.customer)
+
+    def fill_cart(self, count):
+        products = [self.make_product(f'Товар {i}', Decimal(100 + i), self.shoes.id) for i in range(count)]
+        db.session.flush()
+        db.session.add_all(Cart(user_id=self.customer.id, product_id=p.id, quantity=2) for p in products)
+        db.session.commit()
+        return products
+
+    def checkout(self):
+        return self.client.post('/process_checkout')
+
+    def test_order_built_from_cart(self):
+        products = self.fill_cart(3)
+        resp = self.checkout()
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn('/dashboard', resp.headers['Location'])
+
+        order = Order.query.one()
+        self.assertEqual(order.user_id, self.customer.id)
+        self.assertEqual(order.seller_id, self.seller.id)
+        self.assertEqual(Decimal(order.total_amount), Decimal('606.00'))
+        items = {i.product_id: (i.quantity, Decimal(i.price)) for i in OrderItem.query}
+        self.assertEqual(items, {p.id: (2, Decimal(p.price)) for p in products})
+        self.assertEqual(Cart.query.filter_by(user_id=self.customer.id).count(), 0)
+        self.assertEqual(ProductStat.query.count(), 3)
+
+    def test_order_per_seller(self):
+        other = User(username='other', email='other@example.com', password_hash='x', role_id=self.seller_role.id)
+        db.session.add(other)
+        db.session.flush()
+        supplier = Supplier(supplier_name='Другой', user_id=other.id)
+        db.session.add(supplier)
+        db.session.flush()
+        foreign = [Product(productname=f'Чужой {i}', price=Decimal(10), category_id=self.hats.id,
+                           supplier_id=supplier.id, created_by=other.id, is_published=True) for i in range(2)]
+        db.session.add_all(foreign)
+        db.session.flush()
+        db.session.add_all(Cart(user_id=self.customer.id, product_id=p.id, quantity=1) for p in foreign)
+        own = self.fill_cart(2)
+
+        self.checkout()
+        orders = {o.seller_id: o for o in Order.query}
+        self.assertEqual(set(orders), {self.seller.id, other.id})
+        self.assertEqual(Decimal(orders[other.id].total_amount), Decimal('20.00'))
+        self.assertEqual(Decimal(orders[self.seller.id].total_amount), Decimal('402.00'))
+        self.assertEqual({i.product_id for i in orders[other.id].order_items}, {p.id for p in foreign})
+        self.assertEqual({i.product_id for i in orders[self.seller.id].order_items}, {p.id for p in own})
+
+    def test_query_count_does_not_grow_with_cart(self):
+        # Пустая корзина: снимок пользователя попадает в кэш до замеров
+        self.checkout()
+        self.fill_cart(1)
+        with self.assertMaxQueries(20) as small:
+            self.checkout()
+        self.fill_cart(30)
+        with self.assertMaxQueries(20) as large:
+            self.checkout()
+        self.assertEqual(len(small), len(large))
+
+    def test_page_does_not_trust_cached_summary(self):
+        self.fill_cart(2)
+        # Сводка другого воркера ещё не знает о добавленных товарах
+        with mock.patch('cart.get_cart_summary', return_value=EMPTY_CART):
+            resp = self.client.get('/checkout')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('402.00', resp.get_data(as_text=True))
+
+    def test_row_added_after_lock_stays_in_cart(self):
+        products = self.fill_cart(2)
+        late = self.make_product('Поздний', Decimal('5.00'), self.hats.id)
+        db.session.commit()
+        late_id = late.id
+        lock_cart = checkout.lock_cart
+
+        def lock_then_add(user_id):
+            ids = lock_cart(user_id)
+            # Параллельный /add_to_cart закоммитил строку уже после блокировки
+            db.session.execute(insert(Cart).values(user_id=user_id, product_id=late_id, quantity=1))
+            return ids
+
+        with mock.patch('checkout.lock_cart', lock_then_add):
+            checkout.place_order(self.customer.id)
+        db.session.commit()
+        order = Order.query.one()
+        self.assertEqual(Decimal(order.total_amount), Decimal('402.00'))
+        self.assertEqual({i.product_id for i in order.order_items}, {p.id for p in products})
+        self.assertEqual([c.product_id for c in Cart.query.filter_by(user_id=self.customer.id)], [late_id])
+
+    def test_empty_cart(self):
+        resp = self.checkout()
+        self.assertIn('/products', resp.headers['Location'])
+        self.assertEqual(Order.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
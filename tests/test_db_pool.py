@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+from sqlite_case import SQLiteTestCase
+from models import db, Role, User
+from db_pool import MeteredQueuePool, engine_options, init_db_pool, pool_status
+
+
+class EngineOptionsTests(unittest.TestCase):
+    def test_postgres_options(self):
+        options = engine_options({'SQLALCHEMY_DATABASE_URI': 'postgresql://db/shop', 'DB_POOL_SIZE': 20,
+                                  'DB_MAX_OVERFLOW': 5, 'DB_POOL_TIMEOUT': 3, 'DB_POOL_RECYCLE': 600,
+                                  'DB_STATEMENT_TIMEOUT_MS': 5000})
+        self.assertIs(options['poolclass'], MeteredQueuePool)
+        self.assertEqual((options['pool_size'], options['max_overflow'], options['pool_timeout'],
+                          options['pool_recycle']), (20, 5, 3, 600))
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    def test_pgbouncer_without_app_pool(self):
+        options = engine_options({'SQLALCHEMY_DATABASE_URI': 'postgresql://bouncer/shop', 'DB_POOL_SIZE': 0,
+                                  'DB_PGBOUNCER': True, 'DB_STATEMENT_TIMEOUT_MS': 5000})
+        self.assertIs(options['poolclass'], NullPool)
+        self.assertNotIn('connect_args', options)
+
+    def test_sqlite_keeps_own_pool(self):
+        self.assertEqual(engine_options({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}), {'pool_pre_ping': True})
+
+
+class MeteredPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///' + os.path.join(self.tmp, 'pool.db'), poolclass=MeteredQueuePool,
+                                    pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_counts_and_timeouts(self):
+        with self.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            status = pool_status(self.engine)
+            self.assertEqual((status['checked_out'], status['idle']), (1, 0))
+            with self.assertRaises(PoolTimeoutError):
+                self.engine.connect()
+        status = pool_status(self.engine)
+        self.assertEqual((status['checked_out'], status['idle'], status['timeouts']), (0, 1, 1))
+        self.assertEqual(status['waits'], 2)
+        self.assertGreaterEqual(status['wait_max_ms'], 50)
+
+
+    def test_recreated_pool_keeps_wait_log_threshold(self):
+        self.engine.pool.wait_log_threshold = 25
+        self.engine.dispose()
+        self.assertIsInstance(self.engine.pool, MeteredQueuePool)
+        self.assertEqual(self.engine.pool.wait_log_threshold, 25)
+
+class PoolEndpointTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        init_db_pool(self.app)
+
+    def test_hidden_from_non_admins(self):
+        self.login(self.seller)
+        self.assertEqual(self.client.get('/admin/pool').status_code, 404)
+
+    def test_admin_sees_pools(self):
+        admin_role = Role(name='Admin')
+        db.session.add(admin_role)
+        db.session.flush()
+        admin = User(username='admin', email='admin@example.com', password_hash='x', role_id=admin_role.id)
+        db.session.add(admin)
+        db.session.commit()
+        self.login(admin)
+        resp = self.client.get('/admin/pool')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('default', resp.get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
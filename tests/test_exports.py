@@ -0,0 +1,69 @@
+import csv
+import gzip
+import io
+import json
+import unittest
+from decimal import Decimal
+from sqlite_case import SQLiteTestCase
+from models import db, Order, Role, User
+from admin import init_admin
+
+
+class AdminExportTests(SQLiteTestCase):
+    with_routes = True
+    config = {'EXPORT_BATCH': 2}
+
+    def setUp(self):
+        super().setUp()
+        init_admin(self.app)
+        admin_role = Role(name='Admin')
+        db.session.add(admin_role)
+        db.session.flush()
+        self.admin = User(username='admin', email='admin@example.com', password_hash='x', role_id=admin_role.id)
+        db.session.add(self.admin)
+        db.session.flush()
+        for i in range(5):
+            db.session.add(Order(user_id=self.admin.id, seller_id=self.seller.id, total_amount=Decimal(100 + i),
+                                 status='paid' if i % 2 else 'pending'))
+        db.session.commit()
+
+    def test_csv_streams_in_batches(self):
+        self.login(self.admin)
+        resp = self.client.get('/admin/order/export.csv', buffered=False)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        self.assertIn('attachment; filename="orders-', resp.headers['Content-Disposition'])
+        chunks = [chunk for chunk in resp.response if chunk]
+        resp.close()
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0], ['id', 'user_id', 'seller_id', 'status', 'total_amount', 'created_at'])
+        self.assertEqual([row[4] for row in rows[1:]], ['100.00', '101.00', '102.00', '103.00', '104.00'])
+
+    def test_jsonl_with_filter_and_gzip(self):
+        self.login(self.admin)
+        resp = self.client.get('/admin/order/export.jsonl?status=paid&gzip=1')
+        self.assertEqual(resp.mimetype, 'application/gzip')
+        self.assertTrue(resp.headers['Content-Disposition'].endswith('.jsonl.gz"'))
+        lines = gzip.decompress(resp.data).decode().splitlines()
+        self.assertEqual([json.loads(line)['total_amount'] for line in lines], ['101.00', '103.00'])
+
+    def test_users_export_has_no_password_hash(self):
+        self.login(self.admin)
+        resp = self.client.get('/admin/user/export.csv?is_active=1')
+        header = resp.get_data(as_text=True).splitlines()[0]
+        self.assertNotIn('password_hash', header)
+
+    def test_bad_filter_value(self):
+        self.login(self.admin)
+        self.assertEqual(self.client.get('/admin/order/export.csv?user_id=abc').status_code, 400)
+        self.assertEqual(self.client.get('/admin/order/export.xml').status_code, 404)
+
+    def test_requires_admin(self):
+        self.login(self.seller)
+        resp = self.client.get('/admin/order/export.csv')
+        self.assertEqual(resp.status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
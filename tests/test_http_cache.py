@@ -0,0 +1,201 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db
+import catalog
+from http_cache import PageCache, init_http_cache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+class ConditionalGetTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        init_http_cache(self.app)
+        self.sneakers = self.make_product('Кеды', 100, self.shoes.id)
+        db.session.commit()
+
+    def test_not_modified_without_rendering(self):
+        first = self.client.get('/products')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        self.assertIn('Cookie', first.headers['Vary'])
+        etag = first.headers['ETag']
+        with self.assertMaxQueries(0):
+            second = self.client.get('/products', headers={'If-None-Match': etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        self.assertEqual(second.headers['ETag'], etag)
+
+    def test_product_write_changes_etag(self):
+        etag = self.client.get('/products').headers['ETag']
+        self.assertNotEqual(self.client.get('/products?page=2').headers['ETag'], etag)
+        self.sneakers.price = 150
+        db.session.commit()
+        resp = self.client.get('/products', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_static_pages(self):
+        resp = self.client.get('/about')
+        self.assertEqual(self.client.get('/about', headers={'If-None-Match': resp.headers['ETag']}).status_code, 304)
+
+    def test_logged_in_pages_not_cached(self):
+        self.login(self.seller)
+        resp = self.client.get('/products')
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('ETag', resp.headers)
+
+    def test_max_age(self):
+        self.app.config['HTTP_CACHE_MAX_AGE'] = 30
+        resp = self.client.get('/contacts')
+        self.assertEqual(resp.cache_control.max_age, 30)
+        self.assertTrue(resp.cache_control.public)
+
+
+class PageCacheRouteTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        init_http_cache(self.app)
+        self.sneakers = self.make_product('Кеды', 100, self.shoes.id)
+        db.session.commit()
+
+    def test_second_visit_served_from_cache(self):
+        first = self.client.get('/products')
+        self.assertEqual(first.headers['X-Page-Cache'], 'MISS')
+        with self.assertMaxQueries(0):
+            second = self.client.get('/products')
+        self.assertEqual(second.headers['X-Page-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+    def test_gzip_passed_through(self):
+        first = self.client.get('/about')
+        second = self.client.get('/about', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(second.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(second.data), first.data)
+        self.assertIn('Accept-Encoding', second.headers['Vary'])
+
+    def test_product_write_invalidates(self):
+        self.client.get('/products')
+        self.sneakers.productname = 'Кеды Vans'
+        db.session.commit()
+        resp = self.client.get('/products')
+        self.assertEqual(resp.headers['X-Page-Cache'], 'MISS')
+        self.assertIn('Кеды Vans', resp.get_data(as_text=True))
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get('/products')
+        self.login(self.seller)
+        resp = self.client.get('/products')
+        self.assertNotIn('X-Page-Cache', resp.headers)
+
+
+class PageCacheTests(unittest.TestCase):
+    def test_size_cap_evicts_least_recent(self):
+        cache = PageCache(max_bytes=25, compress=False)
+        cache.set('a', b'x' * 10, 'text/html')
+        cache.set('b', b'y' * 10, 'text/html')
+        cache.get('a')
+        cache.set('c', b'z' * 10, 'text/html')
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.size, 20)
+
+    def test_pages_expire_after_ttl(self):
+        cache = PageCache(compress=False, ttl=0.01)
+        cache.set('a', b'x' * 10, 'text/html')
+        self.assertIsNotNone(cache.get('a'))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_single_flight(self):
+        cache = PageCache(compress=False)
+        calls = []
+        started = threading.Event()
+
+        def render(key):
+            calls.append(key)
+            started.set()
+            time.sleep(0.05)
+            cache.set(key, b'page', 'text/html')
+            return 'response'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_render('k', render)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(cache.get_or_render('k', render)))
+                     for _ in range(5)]
+        for t in followers:
+            t.start()
+        for t in [leader] + followers:
+            t.join()
+        self.assertEqual(calls, ['k'])
+        self.assertEqual(sum(1 for page, _ in results if page is not None and page.body == b'page'), 5)
+
+
+class StaticCacheTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        init_http_cache(self.app)
+        self.static = tempfile.mkdtemp()
+        self.app.static_folder = self.static
+        os.makedirs(os.path.join(self.static, 'images'))
+        for name in ('images/0123456789abcdef0123_card.webp', 'logo.png'):
+            with open(os.path.join(self.static, name), 'wb') as f:
+                f.write(b'x')
+
+    def tearDown(self):
+        shutil.rmtree(self.static)
+        super().tearDown()
+
+    def test_hashed_files_are_immutable(self):
+        resp = self.client.get('/static/images/0123456789abcdef0123_card.webp')
+        self.assertTrue(resp.cache_control.immutable)
+        self.assertEqual(resp.cache_control.max_age, 365 * 24 * 3600)
+        resp.close()
+
+    def test_other_files_use_default_max_age(self):
+        self.app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600
+        resp = self.client.get('/static/logo.png')
+        self.assertFalse(resp.cache_control.immutable)
+        self.assertEqual(resp.cache_control.max_age, 3600)
+        resp.close()
+
+
+class CatalogVersionTests(unittest.TestCase):
+    def test_shared_version_is_common_to_processes(self):
+        client = FakeRedis()
+        first, second = catalog.CatalogVersion(client), catalog.CatalogVersion(client)
+        self.assertEqual(first.get(), second.get())
+        first.bump()
+        self.assertEqual(second.get(), '1')
+
+    def test_local_versions_differ_between_processes(self):
+        self.assertNotEqual(catalog.CatalogVersion().get(), catalog.CatalogVersion().get())
+
+
+if __name__ == '__main__':
+    unittest.main()
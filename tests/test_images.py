@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import images
+from sqlite_case import SQLiteTestCase
+from models import db, Product, Role
+from jobs import enqueue, init_jobs
+
+
+class ImagePipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.app = Flask(__name__, static_folder=self.static)
+        self.app.config['IMAGE_MANIFEST_CHECK'] = 60
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+        shutil.rmtree(self.static)
+
+    def upload(self, data, filename='photo.JPG'):
+        return images.save_upload(FileStorage(io.BytesIO(data), filename=filename))
+
+    def test_name_is_content_hash(self):
+        first = self.upload(b'same bytes')
+        second = self.upload(b'same bytes', filename='other.jpg')
+        third = self.upload(b'other bytes')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertTrue(first.startswith('images/') and first.endswith('.jpg'))
+        self.assertTrue(os.path.exists(os.path.join(self.static, first)))
+
+    def test_path_falls_back_to_original_then_blank(self):
+        original = self.upload(b'not really an image')
+        self.assertEqual(images.image_path(original, 'card'), original)
+        card = images.variant_name(original, 'card', 'webp')
+        images.get_manifest().add(card)
+        self.assertEqual(images.image_path(original, 'card'), card)
+
+        images.delete_image(original)
+        self.assertEqual(images.image_path(original, 'card'), images.BLANK_IMAGE)
+        self.assertEqual(images.image_path(None), images.BLANK_IMAGE)
+
+    def test_lookup_does_not_touch_filesystem(self):
+        original = self.upload(b'bytes')
+        with mock.patch('os.stat') as stat, mock.patch('os.path.exists') as exists:
+            for _ in range(40):
+                images.image_path(original, 'card')
+        stat.assert_not_called()
+        exists.assert_not_called()
+
+    def test_files_from_other_processes_seen_after_interval(self):
+        os.makedirs(os.path.join(self.static, 'images'))
+        manifest = images.get_manifest()
+        other = 'images/from_other_worker.jpg'
+        with open(os.path.join(self.static, other), 'wb'):
+            pass
+        self.assertEqual(images.image_path(other), images.BLANK_IMAGE)
+        manifest.check_interval = 0
+        self.assertEqual(images.image_path(other), other)
+
+    @unittest.skipIf(images.Image is None, 'нужен Pillow')
+    def test_variants_are_bounded(self):
+        buffer = io.BytesIO()
+        images.Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+        original = self.upload(buffer.getvalue())
+        for variant, (width, height) in images.VARIANTS.items():
+            path = images.image_path(original, variant)
+            self.assertNotEqual(path, original)
+            with images.Image.open(os.path.join(self.static, path)) as copy:
+                self.assertLessEqual(copy.width, width)
+                self.assertLessEqual(copy.height, height)
+
+
+class RemoveUnusedImageTests(SQLiteTestCase):
+    with_routes = True
+    config = {'JOBS_BACKEND': 'eager'}
+
+    def setUp(self):
+        super().setUp()
+        init_jobs(self.app)
+        # delete_product пускает только роль с id 2
+        seller_role = Role(name='Продавец')
+        db.session.add(seller_role)
+        db.session.flush()
+        self.seller.role_id = seller_role.id
+        self.shared = self.make_product('Кеды', 100, self.shoes.id, product_image='images/shared.jpg')
+        self.copy = self.make_product('Кеды 2', 100, self.shoes.id, product_image='images/shared.jpg')
+        self.bare = self.make_product('Панама', 50, self.hats.id)
+        db.session.commit()
+
+    def test_file_kept_while_referenced(self):
+        with mock.patch.object(images, 'delete_image') as delete_image:
+            enqueue('images.remove_unused', product_image='images/shared.jpg', product_id=self.shared.id)
+            delete_image.assert_not_called()
+            db.session.delete(self.copy)
+            db.session.commit()
+            enqueue('images.remove_unused', product_image='images/shared.jpg', product_id=self.shared.id)
+        delete_image.assert_called_once_with('images/shared.jpg')
+
+    def test_product_without_image_enqueues_nothing(self):
+        self.login(self.seller)
+        with mock.patch('routes.enqueue_on_commit') as enqueue_on_commit:
+            self.client.post(f'/delete_product/{self.bare.id}')
+        enqueue_on_commit.assert_not_called()
+        self.assertIsNone(db.session.get(Product, self.bare.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db, Cart
+from instrumentation import init_instrumentation, parameter_shape
+from jobs import enqueue, init_jobs, task
+
+
+@task('test.count_carts')
+def count_carts():
+    return Cart.query.count()
+
+
+class InstrumentationTests(SQLiteTestCase):
+    with_routes = True
+    config = {'JOBS_BACKEND': 'eager'}
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['SLOW_QUERY_MS'] = 0
+        init_instrumentation(self.app)
+        product = self.make_product('Кеды', 100, self.shoes.id)
+        db.session.flush()
+        db.session.add(Cart(user_id=self.seller.id, product_id=product.id, quantity=2))
+        db.session.commit()
+        self.login(self.seller)
+
+    def test_server_timing_and_request_log(self):
+        with self.assertLogs('vibe.requests', 'INFO') as logs:
+            resp = self.client.get('/checkout')
+        timing = resp.headers['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('queries"', timing)
+        self.assertIn('tpl;dur=', timing)
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['endpoint'], 'auth.checkout')
+        self.assertGreaterEqual(entry['queries'], 1)
+        self.assertLessEqual(len(entry['slowest']), 3)
+
+    def test_slow_queries_are_logged_with_parameter_shapes(self):
+        with self.assertLogs('vibe.slow_queries', 'WARNING') as logs:
+            self.client.get('/checkout')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['event'], 'slow_query')
+        self.assertIn('SELECT', entry['statement'])
+
+    def test_slow_queries_in_jobs_are_logged_with_job_name(self):
+        init_jobs(self.app)
+        with self.assertLogs('vibe.slow_queries', 'WARNING') as logs:
+            enqueue('test.count_carts')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['job'], 'test.count_carts')
+        self.assertNotIn('endpoint', entry)
+
+    def test_slow_queries_in_commands_are_logged_with_command_name(self):
+        @self.app.cli.command('count-carts')
+        def count_carts_command():
+            Cart.query.count()
+
+        with self.assertLogs('vibe.slow_queries', 'WARNING') as logs:
+            result = self.app.test_cli_runner().invoke(args=['count-carts'])
+        self.assertIsNone(result.exception)
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['command'], 'count-carts')
+
+    def test_parameter_shape_hides_values(self):
+        self.assertEqual(parameter_shape({'email': 'a@b.c', 'id': 5}), {'email': 'str', 'id': 'int'})
+        self.assertEqual(parameter_shape((5, 'x')), ['int', 'str'])
+        self.assertEqual(parameter_shape([(1,), (2,)]), {'executemany': 2, 'row': ['int']})
+
+
+if __name__ == '__main__':
+    unittest.main()
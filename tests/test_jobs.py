@@ -0,0 +1,147 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from sqlite_case import SQLiteTestCase
+from models import db, Job
+import jobs
+from jobs import EagerQueue, ThreadQueue, enqueue, enqueue_on_commit, init_jobs, run_worker, task
+
+calls = []
+
+
+@task('test.record')
+def record(value):
+    calls.append(value)
+
+
+@task('test.flaky', max_attempts=3)
+def flaky(fail_times):
+    calls.append('try')
+    if calls.count('try') <= fail_times:
+        raise RuntimeError('сбой')
+
+
+class EagerQueueTests(unittest.TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_retries_until_success(self):
+        queue = EagerQueue()
+        queue.submit('test.flaky', {'fail_times': 2})
+        self.assertEqual(calls, ['try'] * 3)
+        stats = queue.status()['tasks']['test.flaky']
+        self.assertEqual((stats['retry'], stats['done'], stats['failed']), (2, 1, 0))
+
+    def test_gives_up_after_max_attempts(self):
+        queue = EagerQueue()
+        with self.assertLogs('vibe.jobs', 'ERROR'):
+            queue.submit('test.flaky', {'fail_times': 5})
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(queue.status()['tasks']['test.flaky']['failed'], 1)
+
+    def test_backoff_is_capped(self):
+        queue = EagerQueue(backoff=5, backoff_max=30)
+        self.assertEqual([queue.delay(n) for n in (1, 2, 3, 4, 5)], [5, 10, 20, 30, 30])
+
+    def test_unknown_task(self):
+        with self.assertRaises(jobs.UnknownTask):
+            EagerQueue().submit('test.missing', {})
+
+
+class ThreadQueueTests(unittest.TestCase):
+    def test_retry_runs_in_background(self):
+        calls.clear()
+        queue = ThreadQueue(None, workers=1, backoff=0.01)
+        try:
+            queue.submit('test.flaky', {'fail_times': 1})
+            deadline = time.monotonic() + 2
+            while not queue.status()['tasks'].get('test.flaky', {}).get('done') and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(calls, ['try', 'try'])
+            self.assertEqual(queue.status()['pending'], 0)
+        finally:
+            queue.shutdown()
+
+
+class OnCommitTests(SQLiteTestCase):
+    config = {'JOBS_BACKEND': 'eager'}
+
+    def setUp(self):
+        super().setUp()
+        init_jobs(self.app)
+        calls.clear()
+
+    def test_runs_after_commit(self):
+        enqueue_on_commit('test.record', value=1)
+        self.assertEqual(calls, [])
+        db.session.commit()
+        self.assertEqual(calls, [1])
+
+    def test_dropped_on_rollback(self):
+        enqueue_on_commit('test.record', value=1)
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(calls, [])
+
+    def test_enqueue_runs_now(self):
+        enqueue('test.record', value=2)
+        self.assertEqual(calls, [2])
+
+
+class DatabaseQueueTests(SQLiteTestCase):
+    models = SQLiteTestCase.models + (Job,)
+    config = {'JOBS_BACKEND': 'db', 'JOBS_BACKOFF': 60}
+
+    def setUp(self):
+        super().setUp()
+        init_jobs(self.app)
+        self.queue = self.app.extensions['jobs']
+        db.session.commit()
+        calls.clear()
+
+    def work(self):
+        return run_worker(self.queue, threads=2, once=True)
+
+    def test_job_row_commits_with_transaction(self):
+        enqueue_on_commit('test.record', value=3)
+        db.session.rollback()
+        self.assertEqual(Job.query.count(), 0)
+        enqueue_on_commit('test.record', value=3)
+        db.session.commit()
+        self.assertEqual(self.work(), 1)
+        job = Job.query.one()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(calls, [3])
+
+    def test_failed_job_is_retried_later(self):
+        enqueue_on_commit('test.flaky', fail_times=1)
+        db.session.commit()
+        self.work()
+        job = Job.query.one()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('RuntimeError', job.last_error)
+        self.assertGreater(job.run_at, datetime.utcnow() + timedelta(seconds=50))
+        # Задержка не истекла — воркер задачу не берёт
+        self.assertEqual(self.work(), 0)
+
+        job.run_at = datetime.utcnow()
+        db.session.commit()
+        self.work()
+        db.session.expire_all()
+        self.assertEqual(Job.query.one().status, 'done')
+        status = self.queue.status()
+        self.assertEqual(status['jobs'], {'done': 1})
+        self.assertEqual(status['tasks']['test.flaky']['retry'], 1)
+
+    def test_stale_running_job_is_reclaimed(self):
+        db.session.add(Job(name='test.record', payload='{"value": 4}', status='running', attempts=1,
+                           started_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+        self.assertEqual(self.work(), 1)
+        db.session.expire_all()
+        job = Job.query.one()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db, Cart
+
+
+class CartQueryBudgetTests(SQLiteTestCase):
+    with_routes = True
+
+    def setUp(self):
+        super().setUp()
+        products = [self.make_product(f'Товар {i}', 100 + i, self.shoes.id) for i in range(10)]
+        db.session.flush()
+        db.session.add_all(Cart(user_id=self.seller.id, product_id=p.id, quantity=1) for p in products)
+        db.session.commit()
+        self.login(self.seller)
+
+    def test_checkout_does_not_load_products_one_by_one(self):
+        # Пользователь и корзина вместе с товарами — независимо от размера корзины
+        with self.assertMaxQueries(3):
+            resp = self.client.get('/checkout')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('Товар 9', resp.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine, inspect
+
+from sqlite_case import ROOT
+
+try:
+    from alembic import command
+    from alembic.config import Config
+except ImportError:
+    command = None
+
+
+@unittest.skipIf(command is None, 'нужен alembic')
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///' + os.path.join(self.tmp, 'schema.db'))
+        self.config = Config(os.path.join(ROOT, 'alembic.ini'))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, name, *args):
+        with self.engine.connect() as conn:
+            self.config.attributes['connection'] = conn
+            getattr(command, name)(self.config, *args)
+            conn.commit()
+
+    def test_head_matches_models(self):
+        self.run_command('upgrade', 'head')
+        # Падает с AutogenerateDiffsDetected, если модели разошлись с миграциями
+        self.run_command('check')
+        indexes = {ix['name'] for ix in inspect(self.engine).get_indexes('orders')}
+        self.assertIn('ix_orders_user_id_created_at', indexes)
+        # Поисковый индекс только для PostgreSQL; в SQLite поиск в памяти
+        self.assertNotIn('product_search', inspect(self.engine).get_table_names())
+
+    def test_downgrade_to_baseline_drops_indexes(self):
+        self.run_command('upgrade', 'head')
+        self.run_command('downgrade', '0001')
+        self.assertEqual(inspect(self.engine).get_indexes('order_items'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlite_case import SQLiteTestCase
+from models import db, Product
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+from catalog import get_catalog_slice, get_catalog_cache, make_slice_key
+
+
+class CursorTests(unittest.TestCase):
+    def test_roundtrip(self):
+        values = [datetime(2025, 4, 7, 2, 52), Decimal('10.50'), 7]
+        token = encode_cursor(values, 'prev')
+        self.assertEqual(decode_cursor(token), (values, 'prev'))
+
+    def test_garbage_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_cursor('не-курсор')
+
+
+class KeysetPaginationTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        start = datetime(2025, 1, 1)
+        # Одинаковые даты у пар товаров проверяют дотягивание по id
+        for i in range(10):
+            self.make_product(f'Товар {i}', 100 + i, self.shoes.id, created_at=start + timedelta(days=i // 2))
+        db.session.commit()
+        self.columns = (Product.created_at, Product.id)
+
+    def names(self, page):
+        return [p.productname for p in page.items]
+
+    def test_walks_forward_and_back(self):
+        query = Product.query
+        first = keyset_paginate(query, self.columns, per_page=4)
+        self.assertEqual(self.names(first), ['Товар 9', 'Товар 8', 'Товар 7', 'Товар 6'])
+        self.assertFalse(first.has_prev)
+
+        second = keyset_paginate(query, self.columns, cursor=first.next_cursor, per_page=4)
+        self.assertEqual(self.names(second), ['Товар 5', 'Товар 4', 'Товар 3', 'Товар 2'])
+
+        last = keyset_paginate(query, self.columns, cursor=second.next_cursor, per_page=4)
+        self.assertEqual(self.names(last), ['Товар 1', 'Товар 0'])
+        self.assertFalse(last.has_next)
+
+        back = keyset_paginate(query, self.columns, cursor=last.prev_cursor, per_page=4)
+        self.assertEqual(self.names(back), self.names(second))
+        back = keyset_paginate(query, self.columns, cursor=back.prev_cursor, per_page=4)
+        self.assertEqual(self.names(back), self.names(first))
+        self.assertFalse(back.has_prev)
+
+    def test_ascending_with_total(self):
+        page = keyset_paginate(Product.query, (Product.price, Product.id), descending=False,
+                               per_page=3, with_total=True)
+        self.assertEqual(self.names(page), ['Товар 0', 'Товар 1', 'Товар 2'])
+        self.assertEqual(page.total, 10)
+
+    def test_bad_cursor_starts_from_beginning(self):
+        page = keyset_paginate(Product.query, self.columns, cursor='мусор', per_page=2)
+        self.assertEqual(self.names(page), ['Товар 9', 'Товар 8'])
+
+    def test_catalog_slice_is_cached_and_invalidated(self):
+        first = get_catalog_slice(None, None, None, 'price')
+        self.assertIs(get_catalog_slice(None, None, None, 'price'), first)
+        self.make_product('Новинка', 1, self.shoes.id)
+        db.session.commit()
+        self.assertIsNone(get_catalog_cache().get(make_slice_key(None, None, None, 'price', None)))
+        self.assertEqual(get_catalog_slice(None, None, None, 'price').items[0].productname, 'Новинка')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import time
+import unittest
+from werkzeug.security import generate_password_hash
+from sqlite_case import SQLiteTestCase
+from models import db, User
+import passwords
+from passwords import HashingBusy, HashingService, init_passwords
+
+# Дешёвые параметры, чтобы тесты не тратили время на настоящую стоимость
+CHEAP = 'scrypt:1024:8:1'
+
+
+class HashingServiceTests(unittest.TestCase):
+    def test_hash_and_verify(self):
+        service = HashingService(CHEAP)
+        stored = service.hash('secret')
+        self.assertTrue(stored.startswith(CHEAP + '$'))
+        self.assertTrue(service.verify(stored, 'secret'))
+        self.assertFalse(service.verify(stored, 'wrong'))
+        self.assertFalse(service.verify(None, 'secret'))
+        self.assertEqual(service.status()['verify']['count'], 2)
+
+    def test_needs_rehash_on_method_or_cost_change(self):
+        service = HashingService('pbkdf2:sha256:1000')
+        self.assertFalse(service.needs_rehash(generate_password_hash('x', method='pbkdf2:sha256:1000')))
+        self.assertTrue(service.needs_rehash(generate_password_hash('x', method='pbkdf2:sha256:2000')))
+        self.assertTrue(service.needs_rehash(generate_password_hash('x', method=CHEAP)))
+
+    def test_default_cost_is_expanded(self):
+        service = HashingService('pbkdf2:sha256')
+        self.assertFalse(service.needs_rehash(generate_password_hash('x', method='pbkdf2:sha256')))
+
+    def test_queue_limit(self):
+        service = HashingService(CHEAP, max_queue=0)
+        with self.assertRaises(HashingBusy):
+            service.hash('secret')
+        self.assertEqual(service.status()['rejected'], 1)
+
+    def test_process_pool(self):
+        service = HashingService(CHEAP, workers=1)
+        try:
+            self.assertTrue(service.verify(service.hash('secret'), 'secret'))
+        finally:
+            service.shutdown()
+
+    def test_timed_out_job_keeps_its_slot(self):
+        service = HashingService(CHEAP, workers=1, max_queue=1, timeout=0.05)
+        try:
+            with self.assertRaises(HashingBusy):
+                service._run('hash', time.sleep, 0.5)
+            # Задача всё ещё занимает воркер: новая в очередь не встаёт
+            self.assertEqual(service.status()['pending'], 1)
+            with self.assertRaises(HashingBusy):
+                service.hash('secret')
+            self.assertEqual(service.status()['rejected'], 1)
+            deadline = time.monotonic() + 5
+            while service.status()['pending'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(service.status()['pending'], 0)
+            self.assertTrue(service.hash('secret'))
+        finally:
+            service.shutdown()
+
+    @unittest.skipIf(passwords.argon2 is None, 'нужен argon2-cffi')
+    def test_argon2(self):
+        service = HashingService('argon2', {'time_cost': 1, 'memory_cost': 1024, 'parallelism': 1})
+        stored = service.hash('secret')
+        self.assertTrue(service.verify(stored, 'secret'))
+        self.assertFalse(service.needs_rehash(stored))
+        self.assertTrue(service.needs_rehash(generate_password_hash('x', method=CHEAP)))
+
+
+class LoginRehashTests(SQLiteTestCase):
+    with_routes = True
+    config = {'PASSWORD_HASH_METHOD': CHEAP}
+
+    def setUp(self):
+        super().setUp()
+        init_passwords(self.app)
+        self.seller.password_hash = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+        db.session.commit()
+
+    def test_old_hash_upgraded_on_login(self):
+        resp = self.client.post('/login', data={'email': 'seller@example.com', 'password': 'secret'})
+        self.assertEqual(resp.status_code, 302)
+        stored = db.session.get(User, self.seller.id).password_hash
+        self.assertTrue(stored.startswith(CHEAP + '$'))
+        self.assertEqual(self.app.extensions['password_hasher'].status()['rehashed'], 1)
+
+    def test_wrong_password_keeps_hash(self):
+        old = self.seller.password_hash
+        resp = self.client.post('/login', data={'email': 'seller@example.com', 'password': 'wrong'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(db.session.get(User, self.seller.id).password_hash, old)
+
+    def test_busy_login_is_rejected(self):
+        self.app.extensions['password_hasher'].max_queue = 0
+        resp = self.client.post('/login', data={'email': 'seller@example.com', 'password': 'secret'})
+        self.assertEqual(resp.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
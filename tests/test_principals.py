@@ -0,0 +1,78 @@
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db, Role, User
+from principals import Principal, get_principal_cache, load_principal
+
+
+class PrincipalTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin_role = Role(name='Admin')
+        db.session.add(self.admin_role)
+        self.seller.first_name = 'Иван'
+        db.session.commit()
+
+    def test_snapshot_is_cached(self):
+        user_id = self.seller.id
+        with self.assertMaxQueries(1):
+            principal = load_principal(str(user_id))
+        self.assertEqual((principal.id, principal.username, principal.role_name), (user_id, 'seller', 'Seller'))
+        self.assertTrue(principal.is_authenticated and principal.is_active)
+        self.assertFalse(principal.is_admin())
+        with self.assertMaxQueries(0):
+            self.assertIs(load_principal(str(user_id)), principal)
+
+    def test_unknown_user(self):
+        self.assertIsNone(load_principal('999'))
+        self.assertIsNone(load_principal('abc'))
+
+    def test_immutable_and_full_model_on_demand(self):
+        principal = load_principal(self.seller.id)
+        with self.assertRaises(AttributeError):
+            principal.role_id = self.admin_role.id
+        self.assertEqual(principal.first_name, 'Иван')
+        self.assertIsInstance(principal.load(), User)
+        self.assertEqual(principal, self.seller)
+
+    def test_role_change_invalidates(self):
+        load_principal(self.seller.id)
+        self.seller.role_id = self.admin_role.id
+        db.session.commit()
+        self.assertTrue(load_principal(self.seller.id).is_admin())
+
+    def test_rollback_keeps_snapshot(self):
+        principal = load_principal(self.seller.id)
+        self.seller.role_id = self.admin_role.id
+        db.session.flush()
+        db.session.rollback()
+        self.assertIs(load_principal(self.seller.id), principal)
+
+    def test_role_rename_clears_all(self):
+        load_principal(self.seller.id)
+        self.seller_role.name = 'Продавец'
+        db.session.commit()
+        self.assertEqual(len(get_principal_cache()), 0)
+        self.assertEqual(load_principal(self.seller.id).role_name, 'Продавец')
+
+
+class EditProfileTests(SQLiteTestCase):
+    with_routes = True
+
+    def test_edit_profile_updates_snapshot(self):
+        admin_role = Role(name='Admin')
+        db.session.add(admin_role)
+        db.session.commit()
+        self.login(self.seller)
+        self.assertFalse(load_principal(self.seller.id).is_admin())
+        resp = self.client.post('/edit_profile', data={
+            'first_name': 'Пётр', 'middle_name': '', 'last_name': 'Петров', 'email': 'seller@example.com',
+            'role_id': admin_role.id, 'password': ''})
+        self.assertIn('/dashboard', resp.headers['Location'])
+        principal = load_principal(self.seller.id)
+        self.assertIsInstance(principal, Principal)
+        self.assertTrue(principal.is_admin())
+        self.assertEqual(principal.last_name, 'Петров')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from flask import g
+from sqlalchemy import select, update
+from sqlite_case import SQLiteTestCase
+from models import db, Product, ProductStat
+from replicas import replica_binds
+
+
+class ReplicaBindsTests(unittest.TestCase):
+    def test_binds_from_env_string(self):
+        self.assertEqual(replica_binds('postgresql://r1/shop, postgresql://r2/shop,'),
+                         {'replica0': 'postgresql://r1/shop', 'replica1': 'postgresql://r2/shop'})
+        self.assertEqual(replica_binds(''), {})
+
+
+class ReplicaRoutingTests(SQLiteTestCase):
+    """Две базы SQLite в памяти: основная и отстающая от неё реплика"""
+    with_routes = True
+    config = {'SQLALCHEMY_BINDS': {'replica0': 'sqlite://'}, 'DB_REPLICA_PIN_SECONDS': 5}
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product('Старое имя', 100, self.shoes.id)
+        db.session.commit()
+        self.replicate()
+        self.product.productname = 'Новое имя'
+        db.session.commit()
+        self.login(self.seller)
+
+    def replicate(self):
+        """Копирует все таблицы основной БД на реплику"""
+        replica = db.engines['replica0']
+        tables = [m.__table__ for m in self.models]
+        db.metadata.create_all(replica, tables=tables)
+        with db.engine.connect() as source, replica.begin() as target:
+            for table in tables:
+                rows = [dict(row._mapping) for row in source.execute(table.select())]
+                if rows:
+                    target.execute(table.insert(), rows)
+
+    def next_request(self):
+        # Контекст приложения в тестах общий для всех запросов клиента, как и g
+        for name in ('_read_replica', '_pinned_primary', '_replica_engine', '_replica_used'):
+            g.pop(name, None)
+
+    def test_read_route_uses_replica(self):
+        page = self.client.get('/product_stats').get_data(as_text=True)
+        self.assertIn('Старое имя', page)
+        self.assertNotIn('Новое имя', page)
+
+    def test_reads_pinned_to_primary_after_write(self):
+        self.client.post(f'/add_to_cart/{self.product.id}')
+        with self.client.session_transaction() as session:
+            self.assertIn('_primary_until', session)
+        self.next_request()
+        self.assertIn('Новое имя', self.client.get('/product_stats').get_data(as_text=True))
+
+    def test_pin_expires(self):
+        self.app.config['DB_REPLICA_PIN_SECONDS'] = 0
+        self.client.post(f'/add_to_cart/{self.product.id}')
+        self.next_request()
+        self.assertIn('Старое имя', self.client.get('/product_stats').get_data(as_text=True))
+
+    def test_writes_and_locks_go_to_primary(self):
+        replica, primary = db.engines['replica0'], db.engines[None]
+        with self.app.test_request_context():
+            g._read_replica = True
+            self.assertIs(db.session.get_bind(clause=select(Product)), replica)
+            self.assertIs(db.session.get_bind(clause=select(Product).with_for_update()), primary)
+            self.assertIs(db.session.get_bind(clause=update(Product).values(price=1)), primary)
+            db.session.add(ProductStat(product_id=self.product.id, order_count=1, units_sold=1, revenue=100))
+            db.session.flush()
+            # После записи в запросе чтение тоже идёт с основной БД
+            self.assertIs(db.session.get_bind(clause=select(Product)), primary)
+            db.session.rollback()
+
+    def test_catalog_cache_filled_from_primary(self):
+        from http_cache import init_http_cache
+        init_http_cache(self.app)
+        with self.client.session_transaction() as session:
+            session.clear()
+        self.next_request()
+        resp = self.client.get('/products')
+        self.assertIn('Новое имя', resp.get_data(as_text=True))
+        self.assertIsNotNone(resp.headers.get('ETag'))
+
+    def test_replica_reads_are_not_cached(self):
+        from http_cache import _cacheable_response
+        with self.app.test_request_context():
+            g._read_replica = True
+            self.assertTrue(_cacheable_response(self.app.response_class('x')))
+            db.session.execute(select(Product.id)).all()
+            self.assertFalse(_cacheable_response(self.app.response_class('x')))
+
+    def test_unmarked_routes_use_primary(self):
+        with self.app.test_request_context():
+            self.assertIs(db.session.get_bind(clause=select(Product)), db.engines[None])
+
+
+if __name__ == '__main__':
+    unittest.main()
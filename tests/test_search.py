@@ -0,0 +1,57 @@
+import unittest
+from sqlite_case import SQLiteTestCase
+from models import db, Product
+import search
+
+
+class MemorySearchTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        search.init_search(self.app)
+        self.sneakers = self.make_product('Кеды Adidas Samba', 100, self.shoes.id)
+        self.boots = self.make_product('Ботинки зимние', 200, self.shoes.id)
+        self.panama = self.make_product('Панама Adidas', 50, self.hats.id)
+        db.session.commit()
+
+    def names(self, term, **kwargs):
+        return [product.productname for product, _, _ in search.search_products(term, **kwargs).items]
+
+    def test_ranks_name_above_category(self):
+        self.make_product('Шапки-ушанки', 70, self.shoes.id)
+        db.session.commit()
+        self.assertEqual(self.names('шапки'), ['Шапки-ушанки', 'Панама Adidas'])
+        self.assertEqual(self.names('обувь'), ['Кеды Adidas Samba', 'Ботинки зимние', 'Шапки-ушанки'])
+        self.assertEqual(self.names('adidas панама'), ['Панама Adidas'])
+
+    def test_prefix_and_seller(self):
+        self.assertEqual(self.names('ботин'), ['Ботинки зимние'])
+        self.assertEqual(len(self.names('seller')), 3)
+
+    def test_pagination(self):
+        first = search.search_products('seller', page=1, per_page=2)
+        second = search.search_products('seller', page=2, per_page=2)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len(first.items) + len(second.items), 3)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.names('ботинки'), ['Ботинки зимние'])
+        boots = db.session.get(Product, self.boots.id)
+        boots.productname = 'Сапоги зимние'
+        self.make_product('Ботинки летние', 300, self.shoes.id)
+        db.session.delete(db.session.get(Product, self.panama.id))
+        db.session.commit()
+        self.assertEqual(self.names('ботинки'), ['Ботинки летние'])
+        self.assertEqual(self.names('сапоги'), ['Сапоги зимние'])
+        self.assertEqual(self.names('панама'), [])
+
+    def test_category_rename_is_reindexed(self):
+        self.names('шапки')
+        self.hats.category_name = 'Головные уборы'
+        db.session.commit()
+        self.assertEqual(self.names('уборы'), ['Панама Adidas'])
+        self.assertEqual(self.names('шапки'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
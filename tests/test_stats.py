@@ -0,0 +1,41 @@
+import unittest
+from decimal import Decimal
+from sqlite_case import SQLiteTestCase
+from models import db, Order, OrderItem, ProductStat
+from stats import record_orders, refresh_product_stats
+
+
+class ProductStatsTests(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sneakers = self.make_product('Кеды', Decimal('100.00'), self.shoes.id)
+        self.panama = self.make_product('Панама', Decimal('50.00'), self.hats.id)
+        db.session.flush()
+
+    def place_order(self, *lines):
+        order = Order(user_id=self.seller.id, seller_id=self.seller.id,
+                      total_amount=sum(p.price * q for p, q in lines))
+        db.session.add(order)
+        db.session.flush()
+        for product, quantity in lines:
+            db.session.add(OrderItem(order_id=order.id, product_id=product.id, quantity=quantity, price=product.price))
+        record_orders([order.id])
+        db.session.commit()
+        return order
+
+    def snapshot(self):
+        return {s.product_id: (s.order_count, s.units_sold, Decimal(s.revenue)) for s in ProductStat.query}
+
+    def test_incremental_update_matches_full_refresh(self):
+        self.place_order((self.sneakers, 2), (self.panama, 1))
+        self.place_order((self.sneakers, 3))
+        incremental = self.snapshot()
+        self.assertEqual(incremental[self.sneakers.id], (2, 5, Decimal('500.00')))
+        self.assertEqual(incremental[self.panama.id], (1, 1, Decimal('50.00')))
+
+        refresh_product_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+
+if __name__ == '__main__':
+    unittest.main()
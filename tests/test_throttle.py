@@ -0,0 +1,138 @@
+import unittest
+from unittest import mock
+from flask import Flask
+from sqlite_case import SQLiteTestCase
+from models import db
+import throttle
+from throttle import Limit, MemoryBuckets, SharedBuckets, init_throttle, parse_rules
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.ttl = {}
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def expire(self, key, seconds):
+        self.ttl[key] = seconds
+
+
+class ParseRulesTests(unittest.TestCase):
+    def test_parse(self):
+        rules = parse_rules('auth.login=ip:20/60, account:5/60; auth.register=ip:5/3600;')
+        self.assertEqual(rules['auth.login'], [Limit('ip', 20, 60.0, ('POST',)), Limit('account', 5, 60.0, ('POST',))])
+        self.assertEqual(rules['auth.register'], [Limit('ip', 5, 3600.0, ('POST',))])
+
+    def test_configured_rules_extend_defaults(self):
+        app = Flask(__name__)
+        app.config['THROTTLE_RULES'] = 'auth.login=ip:1/60;auth.register='
+        init_throttle(app)
+        rules = app.extensions['throttle_rules']
+        self.assertEqual(rules['auth.login'], [Limit('ip', 1, 60.0, ('POST',))])
+        self.assertEqual(rules['auth.register'], [])
+        self.assertEqual(rules['auth.cart_batch'], throttle.DEFAULT_RULES['auth.cart_batch'])
+
+    def test_disabled(self):
+        app = Flask(__name__)
+        app.config['THROTTLE_ENABLED'] = False
+        init_throttle(app)
+        self.assertNotIn('throttle', app.extensions)
+        self.assertFalse(app.before_request_funcs)
+
+
+class MemoryBucketsTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(throttle.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill(self):
+        buckets = MemoryBuckets()
+        for _ in range(3):
+            self.assertEqual(buckets.take('k', 3, 30), 0)
+        self.assertAlmostEqual(buckets.take('k', 3, 30), 10)
+        self.clock.now += 10
+        self.assertEqual(buckets.take('k', 3, 30), 0)
+        self.assertGreater(buckets.take('k', 3, 30), 0)
+
+    def test_keys_are_independent(self):
+        buckets = MemoryBuckets()
+        self.assertEqual(buckets.take('a', 1, 60), 0)
+        self.assertGreater(buckets.take('a', 1, 60), 0)
+        self.assertEqual(buckets.take('b', 1, 60), 0)
+
+    def test_sweep_removes_full_buckets(self):
+        buckets = MemoryBuckets(sweep_interval=60)
+        buckets.take('idle', 5, 10)
+        buckets.take('busy', 1, 600)
+        self.clock.now += 61
+        buckets.take('new', 5, 10)
+        self.assertEqual(set(buckets._buckets), {'busy', 'new'})
+
+    def test_max_keys(self):
+        buckets = MemoryBuckets(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            buckets.take(key, 5, 10)
+        self.assertEqual(list(buckets._buckets), ['b', 'c'])
+
+
+class SharedBucketsTests(unittest.TestCase):
+    def test_fixed_window(self):
+        client = FakeRedis()
+        buckets = SharedBuckets(client)
+        with mock.patch.object(throttle.time, 'time', return_value=1005.0):
+            self.assertEqual(buckets.take('k', 2, 10), 0)
+            self.assertEqual(buckets.take('k', 2, 10), 0)
+            self.assertAlmostEqual(buckets.take('k', 2, 10), 5)
+        self.assertEqual(client.ttl, {'vibe:throttle:k:100': 10})
+        with mock.patch.object(throttle.time, 'time', return_value=1010.0):
+            self.assertEqual(buckets.take('k', 2, 10), 0)
+
+
+class ThrottleRouteTests(SQLiteTestCase):
+    with_routes = True
+    config = {'THROTTLE_RULES': 'auth.login=ip:10/60,account:2/60;auth.add_to_cart=account:1/60'}
+
+    def setUp(self):
+        super().setUp()
+        init_throttle(self.app)
+
+    def post_login(self, email):
+        return self.client.post('/login', data={'email': email, 'password': 'wrong'})
+
+    def test_login_limited_per_account(self):
+        self.assertEqual(self.post_login('seller@example.com').status_code, 200)
+        self.assertEqual(self.post_login('Seller@Example.com ').status_code, 200)
+        with self.assertMaxQueries(0):
+            resp = self.post_login('seller@example.com')
+        self.assertEqual(resp.status_code, 429)
+        self.assertGreaterEqual(int(resp.headers['Retry-After']), 1)
+        # Другая учётная запись с того же IP
+        self.assertEqual(self.post_login('other@example.com').status_code, 200)
+
+    def test_login_page_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get('/login').status_code, 200)
+
+    def test_add_to_cart_limited_per_user(self):
+        product = self.make_product('Кеды', 1000, self.shoes.id)
+        db.session.commit()
+        self.login(self.seller)
+        self.assertNotEqual(self.client.post(f'/add_to_cart/{product.id}').status_code, 429)
+        self.assertEqual(self.client.post(f'/add_to_cart/{product.id}').status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ttl_cache import TTLCache
+
+
+class TTLCacheTests(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+
+    def test_read_started_before_invalidate_is_not_stored(self):
+        cache = TTLCache()
+        token = cache.token()
+        cache.invalidate(lambda key: True)
+        cache.set('a', 1, token)
+        self.assertIsNone(cache.get('a'))
+
+    def test_delete_rejects_only_its_key(self):
+        cache = TTLCache()
+        token_a, token_b = cache.token(), cache.token()
+        cache.delete('a')
+        cache.set('a', 1, token_a)
+        cache.set('b', 2, token_b)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        cache.set('a', 3, cache.token())
+        self.assertEqual(cache.get('a'), 3)
+
+    def test_forgotten_deletes_reject_older_reads(self):
+        cache = TTLCache(maxsize=2)
+        token = cache.token()
+        for key in ('a', 'b', 'c'):
+            cache.delete(key)
+        self.assertEqual(len(cache._deleted), 2)
+        # Удаление 'a' уже забыто: чтение, начатое до него, не сохраняется
+        cache.set('a', 1, token)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 2, cache.token())
+        self.assertEqual(cache.get('a'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
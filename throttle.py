@@ -0,0 +1,172 @@
+# throttle.py
+"""Ограничение частоты запросов: token bucket на IP и на учётную запись.
+
+Правила задаются по endpoint (auth.login, auth.register, auth.add_to_cart):
+сколько запросов за период можно сделать с одного IP ('ip') и для одной
+учётной записи ('account': email из формы входа/регистрации или id вошедшего
+пользователя). Проверка выполняется в before_request — до обращений к БД и
+хэширования пароля; превышение отвечает 429 с Retry-After.
+
+Бакеты по умолчанию хранятся в памяти процесса: на ключ — три числа, полные
+(простаивающие) бакеты периодически удаляются, общее число ключей ограничено.
+THROTTLE_URL (redis://...) включает общий для процессов бэкенд.
+
+THROTTLE_RULES переопределяет правила строкой вида
+'auth.login=ip:20/60,account:5/60;auth.add_to_cart=ip:60/10'.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, request, session
+
+# count запросов за period секунд (это же — размер бакета) для методов methods
+Limit = namedtuple('Limit', 'scope count period methods')
+
+DEFAULT_RULES = {
+	'auth.login': [Limit('ip', 20, 60, ('POST',)), Limit('account', 5, 60, ('POST',))],
+	'auth.register': [Limit('ip', 5, 3600, ('POST',))],
+	'auth.add_to_cart': [Limit('ip', 60, 10, ('POST',)), Limit('account', 30, 10, ('POST',))],
+	'auth.cart_batch': [Limit('ip', 60, 10, ('POST',)), Limit('account', 30, 10, ('POST',))],
+}
+
+
+def parse_rules(text, methods=('POST',)):
+	"""'auth.login=ip:20/60,account:5/60;...' -> {endpoint: [Limit, ...]}; 'auth.register=' — без ограничений"""
+	rules = {}
+	for part in (text or '').split(';'):
+		if not part.strip():
+			continue
+		endpoint, limits = part.split('=', 1)
+		rules[endpoint.strip()] = []
+		for item in limits.split(','):
+			if not item.strip():
+				continue
+			scope, rate = item.strip().split(':', 1)
+			count, period = rate.split('/', 1)
+			rules[endpoint.strip()].append(Limit(scope.strip(), int(count), float(period), methods))
+	return rules
+
+
+class MemoryBuckets:
+	"""Token bucket'ы в памяти процесса с периодическим удалением простаивающих"""
+
+	def __init__(self, max_keys=100000, sweep_interval=60):
+		self.max_keys = max_keys
+		self.sweep_interval = sweep_interval
+		# ключ -> [токены, время обновления, время, когда бакет снова полон]
+		self._buckets = OrderedDict()
+		self._lock = threading.Lock()
+		self._next_sweep = time.monotonic() + sweep_interval
+
+	def take(self, key, count, period):
+		"""Забирает токен; возвращает 0, если можно, иначе секунды до следующего токена"""
+		rate = count / period
+		now = time.monotonic()
+		with self._lock:
+			if now >= self._next_sweep:
+				self._sweep(now)
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				tokens = float(count)
+			else:
+				tokens = min(float(count), bucket[0] + (now - bucket[1]) * rate)
+				self._buckets.move_to_end(key)
+			if tokens < 1:
+				self._buckets[key] = [tokens, now, now + (count - tokens) / rate]
+				return (1 - tokens) / rate
+			tokens -= 1
+			self._buckets[key] = [tokens, now, now + (count - tokens) / rate]
+			while len(self._buckets) > self.max_keys:
+				self._buckets.popitem(last=False)
+			return 0
+
+	def _sweep(self, now):
+		# Полный бакет ничем не отличается от отсутствующего
+		for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+			del self._buckets[key]
+		self._next_sweep = now + self.sweep_interval
+
+	def clear(self):
+		with self._lock:
+			self._buckets.clear()
+
+	def __len__(self):
+		return len(self._buckets)
+
+
+class SharedBuckets:
+	"""Общий для процессов бэкенд (клиент с incr/expire, как у redis.Redis).
+
+	Точный token bucket потребовал бы скрипта на стороне хранилища, поэтому
+	здесь окно фиксированной длины period: не больше count запросов в окне.
+	"""
+
+	def __init__(self, client, prefix='vibe:throttle:'):
+		self.client = client
+		self.prefix = prefix
+
+	def take(self, key, count, period):
+		window = int(time.time() // period)
+		redis_key = f'{self.prefix}{key}:{window}'
+		used = self.client.incr(redis_key)
+		if used == 1:
+			self.client.expire(redis_key, int(math.ceil(period)))
+		if used > count:
+			return (window + 1) * period - time.time()
+		return 0
+
+	def clear(self):
+		pass
+
+
+def _identity(scope):
+	if scope == 'ip':
+		return request.remote_addr or 'unknown'
+	if scope == 'account':
+		# Из сессии и формы, без загрузки пользователя из БД
+		user_id = session.get('_user_id')
+		if user_id:
+			return f'user:{user_id}'
+		email = request.form.get('email', '').strip().lower()
+		return f'email:{email}' if email else None
+	raise ValueError(f'Неизвестная область ограничения: {scope}')
+
+
+def check_request():
+	"""before_request: 429, если для endpoint запроса исчерпан один из бакетов"""
+	rules = current_app.extensions['throttle_rules'].get(request.endpoint)
+	if not rules:
+		return None
+	backend = current_app.extensions['throttle']
+	for limit in rules:
+		if request.method not in limit.methods:
+			continue
+		identity = _identity(limit.scope)
+		if identity is None:
+			continue
+		retry_after = backend.take(f'{request.endpoint}:{limit.scope}:{identity}', limit.count, limit.period)
+		if retry_after:
+			seconds = max(1, int(math.ceil(retry_after)))
+			return (f'Слишком много запросов. Повторите через {seconds} с.', 429,
+					{'Retry-After': str(seconds), 'Content-Type': 'text/plain; charset=utf-8'})
+	return None
+
+
+def init_throttle(app):
+	"""Бэкенд по THROTTLE_URL (иначе в памяти), правила THROTTLE_RULES поверх DEFAULT_RULES;
+	THROTTLE_ENABLED=0 отключает"""
+	if not app.config.get('THROTTLE_ENABLED', True):
+		return
+	url = app.config.get('THROTTLE_URL')
+	if url:
+		import redis  # нужен только для общего бэкенда
+		app.extensions['throttle'] = SharedBuckets(redis.Redis.from_url(url))
+	else:
+		app.extensions['throttle'] = MemoryBuckets(max_keys=app.config.get('THROTTLE_MAX_KEYS', 100000))
+	rules = app.config.get('THROTTLE_RULES')
+	if isinstance(rules, str):
+		rules = parse_rules(rules)
+	# Заданные правила заменяют правила своих endpoint'ов, остальные остаются по умолчанию
+	app.extensions['throttle_rules'] = {**DEFAULT_RULES, **(rules or {})}
+	app.before_request(check_request)
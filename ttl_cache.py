@@ -0,0 +1,81 @@
+# ttl_cache.py
+"""Потокобезопасный LRU-кэш с временем жизни записей.
+
+Защита от гонки с коммитом: перед чтением БД берётся метка token(), и set с
+этой меткой не сохраняет значение, если ключ за это время удалили (delete) или
+кэш сбросили целиком (invalidate, clear). Удаление одного ключа не мешает
+заполнять остальные.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+	"""LRU на maxsize записей, каждая живёт ttl секунд"""
+
+	def __init__(self, maxsize=256, ttl=60):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		# Метки — номера операций. Для удалённых ключей помним номер удаления
+		# (не больше maxsize ключей); set с меткой не новее _horizon отбрасывается
+		self._clock = 0
+		self._deleted = OrderedDict()
+		self._horizon = 0
+
+	def token(self):
+		"""Метка для set, взятая до чтения источника"""
+		with self._lock:
+			self._clock += 1
+			return self._clock
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			expires, value = entry
+			if expires <= time.monotonic():
+				del self._entries[key]
+				return None
+			self._entries.move_to_end(key)
+			return value
+
+	def set(self, key, value, token=None):
+		with self._lock:
+			if token is not None and (token <= self._horizon or token <= self._deleted.get(key, 0)):
+				return
+			self._entries[key] = (time.monotonic() + self.ttl, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+
+	def delete(self, key):
+		"""Удаляет запись; чтения ключа, начатые раньше, её не вернут"""
+		with self._lock:
+			self._clock += 1
+			self._entries.pop(key, None)
+			self._deleted[key] = self._clock
+			self._deleted.move_to_end(key)
+			while len(self._deleted) > self.maxsize:
+				_, self._horizon = self._deleted.popitem(last=False)
+
+	def invalidate(self, predicate):
+		"""Удаляет записи, ключи которых удовлетворяют predicate; отбрасывает все начатые чтения"""
+		with self._lock:
+			self._horizon = self._clock
+			stale = [key for key in self._entries if predicate(key)]
+			for key in stale:
+				del self._entries[key]
+			return len(stale)
+
+	def clear(self):
+		with self._lock:
+			self._horizon = self._clock
+			self._entries.clear()
+			self._deleted.clear()
+
+	def __len__(self):
+		return len(self._entries)